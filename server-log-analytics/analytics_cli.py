@@ -7,17 +7,54 @@ from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from datetime import datetime, timedelta
+import csv
 import sys
 import os
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database.clickhouse_client import ClickHouseClient
+from database.clickhouse_client import APPROX_SAMPLE, ClickHouseClient
+from analyzers.sessionizer import Sessionizer
 
 console = Console()
 
 
+def approx_options(command):
+    """Add --approx and --sample to a command"""
+    command = click.option(
+        '--sample', default=APPROX_SAMPLE, show_default=True,
+        help='Fraction of raw rows read with --approx'
+    )(command)
+    return click.option(
+        '--approx', is_flag=True,
+        help='Approximate: sample raw rows, HLL uniques, t-digest quantiles; report error bounds'
+    )(command)
+
+
+def error_bound(bounds, key: str) -> str:
+    """Format a 95% relative error bound for --approx output"""
+    if bounds is None:
+        return ''
+    value = bounds.get(key, 0)
+    return f" [dim]±{value * 100:.1f}%[/dim]" if value else " [dim](exact)[/dim]"
+
+
+def rank_bound(bounds) -> str:
+    """Format a quantile's rank error for --approx output"""
+    if bounds is None:
+        return ''
+    return f" [dim]±{bounds['latency_rank'] * 100:.1f} pct rank[/dim]"
+
+
+def print_approx_note(sample):
+    """Say how much of the raw data an --approx answer read (None = exact query)"""
+    if sample is None:
+        return
+    source = f"{sample:.0%} sample of requests" if sample < 1 else "rollups / all rows"
+    console.print(f"[dim]Approximate answer from {source}; bounds are 95% confidence[/dim]")
+
+
 @click.group()
 def cli():
     """Server Log Analytics CLI - Query and analyze your server logs"""
@@ -50,13 +87,13 @@ def top_pages(days, limit):
         for i, row in enumerate(results, 1):
             path = row['path']
             requests = f"{row['requests']:,}"
-            latency = f"{row['avg_latency_ms']:.0f}ms"
+            latency = f"{row['avg_latency']:.0f}ms"
             error_rate = f"{row['error_rate']:.2f}%"
 
             # Color code latency
-            if row['avg_latency_ms'] > 1000:
+            if row['avg_latency'] > 1000:
                 latency = f"[red]{latency}[/red]"
-            elif row['avg_latency_ms'] > 500:
+            elif row['avg_latency'] > 500:
                 latency = f"[yellow]{latency}[/yellow]"
 
             table.add_row(str(i), path, requests, latency, error_rate)
@@ -70,39 +107,43 @@ def top_pages(days, limit):
 @cli.command()
 @click.option('--endpoint', required=True, help='Endpoint path to analyze')
 @click.option('--days', default=7, help='Number of days to analyze')
-def performance(endpoint, days):
+@approx_options
+def performance(endpoint, days, approx, sample):
     """Analyze performance metrics for an endpoint"""
     console.print(f"\n[bold cyan]Performance Analysis: {endpoint}[/bold cyan]\n")
 
     try:
         client = ClickHouseClient()
-        metrics = client.get_performance_metrics(endpoint, days=days)
+        metrics = client.get_performance_metrics(endpoint, days=days, approx=approx, sample=sample)
 
         if not metrics:
             console.print("[yellow]No data found for this endpoint[/yellow]")
             return
 
+        bounds = metrics.get('error_bounds')
+
         # Create metrics panel
         info = f"""
-[bold]Total Requests:[/bold] {metrics['total_requests']:,}
+[bold]Total Requests:[/bold] {metrics['total_requests']:,}{error_bound(bounds, 'total_requests')}
 [bold]Date Range:[/bold] {metrics['start_date']} to {metrics['end_date']}
 
-[bold cyan]Latency Percentiles:[/bold cyan]
-  P50 (Median):  {metrics['p50_latency_ms']:.0f}ms
-  P95:           {metrics['p95_latency_ms']:.0f}ms
-  P99:           {metrics['p99_latency_ms']:.0f}ms
-  Max:           {metrics['max_latency_ms']:.0f}ms
+[bold cyan]Latency Percentiles:[/bold cyan]{rank_bound(bounds)}
+  P50 (Median):  {metrics['p50_latency']:.0f}ms
+  P95:           {metrics['p95_latency']:.0f}ms
+  P99:           {metrics['p99_latency']:.0f}ms
+  Max:           {metrics['max_latency']:.0f}ms
 
-[bold cyan]Error Metrics:[/bold cyan]
+[bold cyan]Error Metrics:[/bold cyan]{error_bound(bounds, 'errors')}
   Success Rate:  {metrics['success_rate']:.2f}%
   Error Rate:    {metrics['error_rate']:.2f}%
 
 [bold cyan]Response Times:[/bold cyan]
-  Average:       {metrics['avg_latency_ms']:.0f}ms
-  Median:        {metrics['p50_latency_ms']:.0f}ms
+  Average:       {metrics['avg_latency']:.0f}ms
+  Median:        {metrics['p50_latency']:.0f}ms
         """
 
         console.print(Panel(info.strip(), title="Endpoint Metrics", border_style="cyan"))
+        print_approx_note(metrics.get('sample'))
 
         # Status code breakdown
         if 'status_breakdown' in metrics:
@@ -186,24 +227,33 @@ def security_scan(days, min_severity):
 
     try:
         client = ClickHouseClient()
+        results = client.get_threat_summary(days=days, min_severity=min_severity)
 
-        # This would query the security_events table
-        # For now, show a sample query structure
-        query = f"""
-        SELECT
-            threat_type,
-            severity,
-            count() as threat_count,
-            groupArray(distinct ip_address) as source_ips
-        FROM security_events
-        WHERE date >= today() - {days}
-          AND severity IN ('medium', 'high', 'critical')
-        GROUP BY threat_type, severity
-        ORDER BY threat_count DESC
-        """
+        if not results:
+            console.print("[green]No threats at or above this severity[/green]")
+            console.print("[dim]Security events are recorded when ingesting with security scanning enabled[/dim]")
+            return
 
-        console.print("[yellow]Security scanning requires security_events table to be populated[/yellow]")
-        console.print("[yellow]Run ingestion with security scanning enabled[/yellow]")
+        severity_styles = {'critical': 'bold red', 'high': 'red', 'medium': 'yellow', 'low': 'dim'}
+
+        table = Table(show_header=True, header_style="bold red")
+        table.add_column("Threat Type", style="cyan")
+        table.add_column("Severity")
+        table.add_column("Events", justify="right", style="green")
+        table.add_column("Source IPs", justify="right")
+        table.add_column("Top Sources")
+
+        for row in results:
+            style = severity_styles.get(row['severity'], '')
+            table.add_row(
+                row['threat_type'],
+                f"[{style}]{row['severity'].upper()}[/{style}]" if style else row['severity'].upper(),
+                f"{row['count']:,}",
+                str(len(row['source_ips'])),
+                ', '.join(str(ip) for ip in row['source_ips'][:3])
+            )
+
+        console.print(table)
 
     except Exception as e:
         console.print(f"[red]Error: {e}[/red]")
@@ -220,23 +270,7 @@ def slowest(threshold, days, limit):
     try:
         client = ClickHouseClient()
 
-        query = f"""
-        SELECT
-            path,
-            quantile(0.50)(response_time_ms) as p50,
-            quantile(0.95)(response_time_ms) as p95,
-            quantile(0.99)(response_time_ms) as p99,
-            count() as requests
-        FROM fact_requests
-        WHERE date >= today() - {days}
-          AND response_time_ms > 0
-        GROUP BY path
-        HAVING p95 > {threshold} AND requests > 100
-        ORDER BY p95 DESC
-        LIMIT {limit}
-        """
-
-        results = client.client.execute(query)
+        results = client.get_slowest_endpoints(threshold=threshold, days=days, limit=limit)
 
         if not results:
             console.print(f"[green]No endpoints with P95 > {threshold}ms found[/green]")
@@ -253,11 +287,11 @@ def slowest(threshold, days, limit):
         for i, row in enumerate(results, 1):
             table.add_row(
                 str(i),
-                row[0],  # path
-                f"{row[1]:.0f}ms",  # p50
-                f"{row[2]:.0f}ms",  # p95
-                f"{row[3]:.0f}ms",  # p99
-                f"{row[4]:,}"  # requests
+                row['path'],
+                f"{row['p50']:.0f}ms",
+                f"{row['p95']:.0f}ms",
+                f"{row['p99']:.0f}ms",
+                f"{row['requests']:,}"
             )
 
         console.print(table)
@@ -269,43 +303,31 @@ def slowest(threshold, days, limit):
 
 @cli.command()
 @click.option('--days', default=7, help='Number of days to analyze')
-def traffic_summary(days):
+@click.option('--hours', default=0, help='Analyze the last N hours instead of days')
+@approx_options
+def traffic_summary(days, hours, approx, sample):
     """Show overall traffic summary"""
-    console.print(f"\n[bold cyan]Traffic Summary (Last {days} Days)[/bold cyan]\n")
+    window = f"{hours} Hours" if hours else f"{days} Days"
+    console.print(f"\n[bold cyan]Traffic Summary (Last {window})[/bold cyan]\n")
 
     try:
         client = ClickHouseClient()
+        summary = client.get_traffic_summary(days=days, hours=hours, approx=approx, sample=sample)
 
-        # Overall metrics
-        query = f"""
-        SELECT
-            count() as total_requests,
-            count(distinct date) as days,
-            count(distinct ip_address) as unique_ips,
-            sum(response_bytes) as total_bytes,
-            avg(response_time_ms) as avg_latency,
-            quantile(0.95)(response_time_ms) as p95_latency,
-            countIf(status_code >= 400) as errors,
-            countIf(is_bot = 1) as bot_requests
-        FROM fact_requests
-        WHERE date >= today() - {days}
-        """
-
-        result = client.client.execute(query)
-
-        if not result:
+        if not summary:
             console.print("[yellow]No data found[/yellow]")
             return
 
-        row = result[0]
-        total_requests = row[0]
-        days_count = row[1]
-        unique_ips = row[2]
-        total_bytes = row[3]
-        avg_latency = row[4]
-        p95_latency = row[5]
-        errors = row[6]
-        bot_requests = row[7]
+        total_requests = summary['total_requests']
+        days_count = summary['days']
+        unique_ips = summary['unique_ips']
+        total_bytes = summary['total_bytes']
+        avg_latency = summary['avg_latency']
+        p95_latency = summary['p95_latency']
+        errors = summary['errors']
+        bot_requests = summary['bot_requests']
+        bounds = summary.get('error_bounds')
+        sample_read = summary.get('sample')
 
         # Calculate derived metrics
         requests_per_day = total_requests / days_count if days_count > 0 else 0
@@ -315,56 +337,56 @@ def traffic_summary(days):
 
         summary = f"""
 [bold cyan]Volume:[/bold cyan]
-  Total Requests:      {total_requests:,}
+  Total Requests:      {total_requests:,}{error_bound(bounds, 'total_requests')}
   Requests/Day:        {requests_per_day:,.0f}
-  Unique IPs:          {unique_ips:,}
+  Unique IPs:          {unique_ips:,}{error_bound(bounds, 'unique_ips')}
   Data Transferred:    {total_gb:.2f} GB
 
 [bold cyan]Performance:[/bold cyan]
   Avg Response Time:   {avg_latency:.0f}ms
-  P95 Response Time:   {p95_latency:.0f}ms
+  P95 Response Time:   {p95_latency:.0f}ms{rank_bound(bounds)}
 
 [bold cyan]Quality:[/bold cyan]
   Error Rate:          {error_rate:.2f}%
-  Total Errors:        {errors:,}
+  Total Errors:        {errors:,}{error_bound(bounds, 'errors')}
 
 [bold cyan]Traffic:[/bold cyan]
-  Bot Traffic:         {bot_percentage:.1f}%
+  Bot Traffic:         {bot_percentage:.1f}%{error_bound(bounds, 'bot_requests')}
   Human Traffic:       {100-bot_percentage:.1f}%
         """
 
         console.print(Panel(summary.strip(), title="Traffic Summary", border_style="cyan"))
+        print_approx_note(sample_read)
 
     except Exception as e:
         console.print(f"[red]Error: {e}[/red]")
 
 
 @cli.command()
-@click.option('--limit', default=10, help='Number of IPs to show')
+@click.option('--limit', default=10, help='Number of IPs to show (0 = all, with --csv)')
 @click.option('--days', default=1, help='Number of days to analyze')
-def top_ips(limit, days):
+@click.option('--csv', 'as_csv', is_flag=True, help='Stream rows as CSV to stdout instead of a table')
+@approx_options
+def top_ips(limit, days, as_csv, approx, sample):
     """Show top IPs by request count"""
+    if as_csv:
+        # Streamed block by block, so exporting every IP stays in constant memory
+        client = ClickHouseClient()
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['ip_address', 'requests', 'unique_pages', 'errors', 'avg_latency_ms', 'is_bot'])
+
+        for row in client.iter_top_ips(days=days, limit=limit, approx=approx, sample=sample):
+            writer.writerow([
+                row['ip_address'], row['requests'], row['unique_pages'],
+                row['errors'], f"{row['avg_latency']:.0f}", int(row['is_bot'])
+            ])
+        return
+
     console.print(f"\n[bold cyan]Top {limit} IPs (Last {days} Days)[/bold cyan]\n")
 
     try:
         client = ClickHouseClient()
-
-        query = f"""
-        SELECT
-            ip_address,
-            count() as requests,
-            count(distinct path) as unique_pages,
-            countIf(status_code >= 400) as errors,
-            avg(response_time_ms) as avg_latency,
-            any(is_bot) as is_bot
-        FROM fact_requests
-        WHERE date >= today() - {days}
-        GROUP BY ip_address
-        ORDER BY requests DESC
-        LIMIT {limit}
-        """
-
-        results = client.client.execute(query)
+        results = client.get_top_ips(days=days, limit=limit or 10, approx=approx, sample=sample)
 
         if not results:
             console.print("[yellow]No data found[/yellow]")
@@ -374,21 +396,24 @@ def top_ips(limit, days):
         table.add_column("Rank", style="dim", width=6)
         table.add_column("IP Address", style="cyan")
         table.add_column("Requests", justify="right", style="green")
-        table.add_column("Unique Pages", justify="right")
+        table.add_column("Unique Pages" + (" (min)" if approx else ""), justify="right")
         table.add_column("Errors", justify="right")
         table.add_column("Avg Latency", justify="right")
         table.add_column("Type")
 
         for i, row in enumerate(results, 1):
-            ip_type = "🤖 Bot" if row[5] else "👤 Human"
+            ip_type = "🤖 Bot" if row['is_bot'] else "👤 Human"
+            requests = f"{row['requests']:,}"
+            if approx:
+                requests += f" ±{row['requests_error'] * 100:.0f}%"
 
             table.add_row(
                 str(i),
-                row[0],  # ip
-                f"{row[1]:,}",  # requests
-                str(row[2]),  # unique pages
-                str(row[3]),  # errors
-                f"{row[4]:.0f}ms",  # avg latency
+                str(row['ip_address']),
+                requests,
+                str(row['unique_pages']),
+                str(row['errors']),
+                f"{row['avg_latency']:.0f}ms",
                 ip_type
             )
 
@@ -398,6 +423,60 @@ def top_ips(limit, days):
         console.print(f"[red]Error: {e}[/red]")
 
 
+@cli.command()
+@click.option('--days', default=7, help='Number of days to analyze')
+@click.option('--depth', default=4, help='Pages per journey to track')
+@click.option('--steps', type=int, default=None, help='Only show paths of exactly this many pages')
+@click.option('--min-steps', default=2, help='Shortest path shown')
+@click.option('--limit', default=15, help='Number of results')
+@click.option('--min-sessions', default=10, help='Minimum sessions following a path')
+def journeys(days, depth, steps, min_steps, limit, min_sessions):
+    """Show the most common navigation paths with funnel drop-off"""
+    console.print(f"\n[bold cyan]Top User Journeys (Last {days} Days)[/bold cyan]\n")
+
+    try:
+        client = ClickHouseClient()
+        sessionizer = Sessionizer()
+
+        paths = sessionizer.find_common_paths(
+            client.iter_session_paths(days=days, max_depth=depth),
+            min_frequency=min_sessions,
+            max_depth=depth,
+            top_n=limit,
+            steps=steps,
+            min_steps=min_steps
+        )
+
+        if not paths:
+            console.print("[yellow]No sessions found (ingest with --sessionize to fill fact_sessions)[/yellow]")
+            return
+
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Rank", style="dim", width=6)
+        table.add_column("Path", style="cyan")
+        table.add_column("Sessions", justify="right", style="green")
+        table.add_column("Conversion", justify="right")
+        table.add_column("Drop-off per Step", justify="right", style="yellow")
+
+        for i, path in enumerate(paths, 1):
+            drop_offs = ' → '.join(
+                f"{step['drop_off']:.0%}" for step in path['funnel'] if step['drop_off'] is not None
+            )
+
+            table.add_row(
+                str(i),
+                path['path'],
+                f"{path['frequency']:,}",
+                f"{path['conversion_rate']:.1%}",
+                drop_offs or '-'
+            )
+
+        console.print(table)
+
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/red]")
+
+
 @cli.command()
 def database_info():
     """Show database connection and table info"""
@@ -418,7 +497,7 @@ def database_info():
         ORDER BY total_bytes DESC
         """
 
-        results = client.client.execute(query)
+        results = client.execute_query(query)
 
         if results:
             table = Table(show_header=True, header_style="bold")
@@ -5,7 +5,8 @@ Uses statistical methods to detect traffic spikes, latency anomalies, error rate
 
 import logging
 import numpy as np
-from typing import Dict, List, Optional, Tuple
+import pandas as pd
+from typing import Dict, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from collections import defaultdict
@@ -13,6 +14,9 @@ import statistics
 
 logger = logging.getLogger(__name__)
 
+# Window values rolling_baseline materializes at once (8 bytes each)
+ROLLING_CHUNK_ELEMENTS = 4_000_000
+
 
 @dataclass
 class Anomaly:
@@ -44,6 +48,9 @@ class AnomalyDetector:
         'critical': 5.0  # 5 standard deviations
     }
 
+    # Severity levels, least to most severe
+    SEVERITY_LEVELS = ('low', 'medium', 'high', 'critical')
+
     # Error rate thresholds (percentage)
     ERROR_RATE_THRESHOLDS = {
         'low': 1.0,      # 1% error rate
@@ -72,56 +79,203 @@ class AnomalyDetector:
         Returns:
             List of detected anomalies
         """
-        anomalies = []
-
         if len(time_series) < window_size:
             logger.warning(f"Not enough data points ({len(time_series)} < {window_size})")
-            return anomalies
+            return []
 
-        # Extract values
-        values = [point.get(metric, 0) for point in time_series]
+        values = np.array([[point.get(metric, 0)] for point in time_series], dtype=np.float64)
+        timestamps = [point.get('timestamp', datetime.now()) for point in time_series]
 
-        # Calculate rolling statistics
-        for i in range(window_size, len(values)):
-            # Get baseline window (previous N points)
-            baseline = values[i - window_size:i]
+        return self._rolling_anomalies(values, timestamps, [None], metric, window_size)
 
-            # Calculate statistics
-            mean = statistics.mean(baseline)
-            std_dev = statistics.stdev(baseline) if len(baseline) > 1 else 0
+    def detect_endpoint_anomalies(
+        self,
+        endpoint_metrics,
+        metric: str = 'request_count',
+        window_size: int = 24,
+        fill_value: Optional[float] = 0
+    ) -> List[Anomaly]:
+        """
+        Detect anomalies in one metric across many endpoints at once
 
-            # Current value
-            current_value = values[i]
+        Every endpoint's series is scored against its own rolling baseline
+        (see detect_traffic_anomalies) in a single vectorized pass, so this
+        scales to every endpoint every minute.
 
-            # Skip if no variation
-            if std_dev == 0:
-                continue
+        Args:
+            endpoint_metrics: List of dicts (or DataFrame) with endpoint,
+                              timestamp and metric, e.g. from
+                              ClickHouseClient.get_endpoint_series()
+            metric: Metric to analyze (request_count, avg_response_time_ms, ...)
+            window_size: Number of previous points to use for baseline
+            fill_value: Value for timestamps where an endpoint has no row
+                        (None leaves a gap, which skips windows spanning it)
 
-            # Calculate Z-score
-            z_score = abs((current_value - mean) / std_dev)
+        Returns:
+            List of detected anomalies, grouped by endpoint
+        """
+        if isinstance(endpoint_metrics, pd.DataFrame):
+            frame = endpoint_metrics[['timestamp', 'endpoint', metric]]
+        else:
+            # Only the needed columns; much faster than DataFrame(list_of_dicts)
+            frame = pd.DataFrame({
+                'timestamp': [row.get('timestamp') for row in endpoint_metrics],
+                'endpoint': [row.get('endpoint', 'unknown') for row in endpoint_metrics],
+                metric: [row.get(metric) for row in endpoint_metrics]
+            })
+
+        if frame.empty:
+            return []
+
+        table = (
+            frame.drop_duplicates(['timestamp', 'endpoint'], keep='last')
+            .pivot(index='timestamp', columns='endpoint', values=metric)
+            .sort_index()
+            .reindex(columns=frame['endpoint'].unique())  # Endpoints in input order
+        )
+
+        if fill_value is not None:
+            table = table.fillna(fill_value)
+
+        if len(table) < window_size:
+            logger.warning(f"Not enough data points ({len(table)} < {window_size})")
+            return []
+
+        if isinstance(table.index, pd.DatetimeIndex):
+            timestamps = list(table.index.to_pydatetime())
+        else:
+            timestamps = list(table.index)
+
+        return self._rolling_anomalies(
+            table.to_numpy(dtype=np.float64),
+            timestamps,
+            list(table.columns),
+            metric,
+            window_size
+        )
+
+    @staticmethod
+    def rolling_baseline(values: np.ndarray, window_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mean and sample standard deviation of the previous window_size points
 
-            # Determine severity
-            severity = self._get_severity_from_zscore(z_score)
+        Each window is summed afresh (mean, then squared deviations from it)
+        rather than slid along running sums: O(n * window_size) but vectorized
+        in bounded chunks, and only the window's own values affect its result,
+        so a spike or a plateau earlier in the series leaves no residue behind.
+        Windows of identical values get exactly 0, as statistics.stdev gives.
 
-            if severity:
-                anomaly = Anomaly(
-                    anomaly_type='traffic_spike' if current_value > mean else 'traffic_drop',
-                    severity=severity,
-                    timestamp=time_series[i].get('timestamp', datetime.now()),
-                    metric_name=metric,
-                    expected_value=mean,
-                    actual_value=current_value,
-                    deviation_score=z_score,
-                    description=f"{metric} is {z_score:.1f}σ from baseline",
-                    context={
-                        'baseline_mean': mean,
-                        'baseline_std': std_dev,
-                        'percent_change': ((current_value - mean) / mean * 100) if mean > 0 else 0
-                    }
-                )
-                anomalies.append(anomaly)
-                self.anomalies_detected += 1
+        Args:
+            values: 2-D array with one column per series (rows are time)
+            window_size: Number of previous points forming the baseline
 
+        Returns:
+            (mean, std) arrays shaped like values; NaN for the first
+            window_size rows and for windows containing NaN
+        """
+        rows, columns = values.shape
+        mean = np.full(values.shape, np.nan)
+        std = np.full(values.shape, np.nan)
+
+        # windows[i] is the baseline of row i + window_size
+        windows = np.lib.stride_tricks.sliding_window_view(values, window_size, axis=0)[:rows - window_size]
+        chunk = max(1, ROLLING_CHUNK_ELEMENTS // max(1, columns * window_size))
+
+        for start in range(0, len(windows), chunk):
+            block = windows[start:start + chunk]
+            block_mean = block.mean(axis=-1)
+            deviations = block - block_mean[..., None]
+            variance = np.einsum('ijk,ijk->ij', deviations, deviations) / max(1, window_size - 1)
+            constant = block.max(axis=-1) == block.min(axis=-1)
+
+            target = slice(start + window_size, start + window_size + len(block))
+            mean[target] = block_mean
+            std[target] = np.where(constant, 0.0, np.sqrt(variance))
+
+        return mean, std
+
+    @staticmethod
+    def _exact_baseline(
+        values: np.ndarray,
+        mean: np.ndarray,
+        std: np.ndarray,
+        points: np.ndarray,
+        window_size: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of mean and std with the points in the boolean mask recomputed by statistics"""
+        mean = np.array(mean)
+        std = np.array(std)
+
+        for row, column in zip(*np.nonzero(points)):
+            baseline = values[row - window_size:row, column].tolist()
+            mean[row, column] = statistics.mean(baseline)
+            std[row, column] = statistics.stdev(baseline)
+
+        return mean, std
+
+    def _severities(self, z_scores: np.ndarray) -> np.ndarray:
+        """Vectorized _get_severity_from_zscore: index into SEVERITY_LEVELS, -1 for none"""
+        levels = np.array([self.ANOMALY_THRESHOLDS[level] for level in self.SEVERITY_LEVELS])
+        return np.searchsorted(levels, z_scores, side='right') - 1
+
+    def _rolling_anomalies(
+        self,
+        values: np.ndarray,
+        timestamps: Sequence,
+        names: Sequence[Optional[str]],
+        metric: str,
+        window_size: int
+    ) -> List[Anomaly]:
+        """Score a (time x series) matrix against rolling baselines and build Anomaly objects"""
+        mean, std = self.rolling_baseline(values, window_size)
+
+        # Skip if no variation (or no full baseline)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = np.where(std > 0, np.abs(values - mean) / std, np.nan)
+
+        # Small counts often land exactly on a threshold, where float rounding
+        # decides the severity; rescore those points exactly
+        levels = np.array([self.ANOMALY_THRESHOLDS[level] for level in self.SEVERITY_LEVELS])
+        borderline = (std > 0) & np.isclose(z_scores[..., None], levels, rtol=1e-6, atol=0).any(axis=-1)
+        if borderline.any():
+            mean, std = self._exact_baseline(values, mean, std, borderline, window_size)
+            z_scores[borderline] = np.abs(values[borderline] - mean[borderline]) / std[borderline]
+
+        severities = self._severities(np.nan_to_num(z_scores, nan=0.0))
+        # Series by series, oldest point first
+        flagged_columns, flagged_rows = np.nonzero(severities.T >= 0)
+
+        anomalies = []
+
+        for column, row in zip(flagged_columns.tolist(), flagged_rows.tolist()):
+            name = names[column]
+            current_value = values[row, column].item()
+            baseline_mean = mean[row, column].item()
+            baseline_std = std[row, column].item()
+            z_score = z_scores[row, column].item()
+
+            label = f"{name} {metric}" if name is not None else metric
+            context = {
+                'baseline_mean': baseline_mean,
+                'baseline_std': baseline_std,
+                'percent_change': ((current_value - baseline_mean) / baseline_mean * 100) if baseline_mean > 0 else 0
+            }
+            if name is not None:
+                context['endpoint'] = name
+
+            anomalies.append(Anomaly(
+                anomaly_type='traffic_spike' if current_value > baseline_mean else 'traffic_drop',
+                severity=self.SEVERITY_LEVELS[severities[row, column]],
+                timestamp=timestamps[row],
+                metric_name=label,
+                expected_value=baseline_mean,
+                actual_value=current_value,
+                deviation_score=z_score,
+                description=f"{label} is {z_score:.1f}σ from baseline",
+                context=context
+            ))
+
+        self.anomalies_detected += len(anomalies)
         return anomalies
 
     def detect_latency_anomalies(
@@ -141,58 +295,65 @@ class AnomalyDetector:
         """
         anomalies = []
 
-        # Group by endpoint
-        by_endpoint = defaultdict(list)
-        for metric in endpoint_metrics:
-            endpoint = metric.get('endpoint', 'unknown')
-            by_endpoint[endpoint].append(metric)
-
-        # Analyze each endpoint
-        for endpoint, metrics in by_endpoint.items():
-            if len(metrics) < 10:  # Need minimum data
-                continue
-
-            # Get latency values
-            latencies = [m.get(latency_field, 0) for m in metrics]
-
-            # Calculate baseline (excluding top 5% to avoid skew)
-            sorted_latencies = sorted(latencies)
-            baseline_values = sorted_latencies[:int(len(sorted_latencies) * 0.95)]
-
-            if not baseline_values:
-                continue
-
-            baseline_mean = statistics.mean(baseline_values)
-            baseline_std = statistics.stdev(baseline_values) if len(baseline_values) > 1 else 0
-
-            # Find anomalies
-            for i, metric in enumerate(metrics):
-                current_latency = metric.get(latency_field, 0)
-
-                if baseline_std == 0:
-                    continue
-
-                z_score = abs((current_latency - baseline_mean) / baseline_std)
-                severity = self._get_severity_from_zscore(z_score)
+        if not endpoint_metrics:
+            return anomalies
 
-                if severity and current_latency > baseline_mean:
-                    anomaly = Anomaly(
-                        anomaly_type='latency_spike',
-                        severity=severity,
-                        timestamp=metric.get('timestamp', datetime.now()),
-                        metric_name=f"{endpoint} latency",
-                        expected_value=baseline_mean,
-                        actual_value=current_latency,
-                        deviation_score=z_score,
-                        description=f"{endpoint} latency is {z_score:.1f}σ above normal",
-                        context={
-                            'endpoint': endpoint,
-                            'baseline_p50': baseline_mean,
-                            'slowdown_factor': current_latency / baseline_mean if baseline_mean > 0 else 0
-                        }
-                    )
-                    anomalies.append(anomaly)
-                    self.anomalies_detected += 1
+        # Group by endpoint
+        codes, endpoints = pd.factorize(
+            np.array([metric.get('endpoint', 'unknown') for metric in endpoint_metrics], dtype=object)
+        )
+        latencies = np.array([metric.get(latency_field, 0) for metric in endpoint_metrics], dtype=np.float64)
+        sizes = np.bincount(codes)
+
+        # Baseline: each endpoint's lowest 95% (top 5% excluded to avoid skew),
+        # selected from one sort by (endpoint, latency) instead of a sort per endpoint
+        order = np.lexsort((latencies, codes))
+        starts = np.cumsum(sizes) - sizes
+        rank = np.arange(len(order)) - starts[codes[order]]
+        baseline_sizes = (sizes * 0.95).astype(np.int64)
+        baseline = order[rank < baseline_sizes[codes[order]]]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            baseline_mean = np.bincount(codes[baseline], weights=latencies[baseline], minlength=len(endpoints)) / baseline_sizes
+            deviations = latencies[baseline] - baseline_mean[codes[baseline]]
+            baseline_std = np.sqrt(
+                np.bincount(codes[baseline], weights=deviations ** 2, minlength=len(endpoints)) / (baseline_sizes - 1)
+            )
+
+            # Need minimum data and some variation
+            usable = (sizes >= 10) & (baseline_sizes > 1) & (baseline_std > 0)
+            z_scores = np.abs(latencies - baseline_mean[codes]) / baseline_std[codes]
+
+        severities = self._severities(np.where(usable[codes], z_scores, 0.0))
+        flagged = np.flatnonzero((severities >= 0) & (latencies > baseline_mean[codes]))
+
+        # Report endpoint by endpoint, in input order within each
+        flagged = flagged[np.argsort(codes[flagged], kind='stable')]
+
+        for i in flagged.tolist():
+            metric = endpoint_metrics[i]
+            endpoint = endpoints[codes[i]]
+            current_latency = metric.get(latency_field, 0)
+            mean = baseline_mean[codes[i]].item()
+            z_score = z_scores[i].item()
+
+            anomaly = Anomaly(
+                anomaly_type='latency_spike',
+                severity=self.SEVERITY_LEVELS[severities[i]],
+                timestamp=metric.get('timestamp', datetime.now()),
+                metric_name=f"{endpoint} latency",
+                expected_value=mean,
+                actual_value=current_latency,
+                deviation_score=z_score,
+                description=f"{endpoint} latency is {z_score:.1f}σ above normal",
+                context={
+                    'endpoint': endpoint,
+                    'baseline_p50': mean,
+                    'slowdown_factor': current_latency / mean if mean > 0 else 0
+                }
+            )
+            anomalies.append(anomaly)
+            self.anomalies_detected += 1
 
         return anomalies
 
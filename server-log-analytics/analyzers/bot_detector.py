@@ -5,6 +5,7 @@ Uses user-agent parsing and pattern matching
 
 import logging
 import re
+from collections import OrderedDict
 from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
@@ -61,10 +62,23 @@ class BotDetector:
     # Compile patterns
     COMPILED_PATTERNS = [(re.compile(pattern, re.I), name) for pattern, name in BOT_PATTERNS]
 
-    def __init__(self):
+    def __init__(self, cache_size: int = 10000):
+        """
+        Initialize detector
+
+        Args:
+            cache_size: Max user agents kept in the classification LRU (0 disables it)
+        """
         self.bot_count = 0
         self.human_count = 0
 
+        # User-agent cardinality is tiny compared to request volume, so cache
+        # classifications keyed by the raw user-agent string
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+
     def detect(self, user_agent: str, ip_address: str = "") -> Dict:
         """
         Detect if traffic is from a bot
@@ -79,12 +93,34 @@ class BotDetector:
         if not user_agent:
             return self._default_result(is_bot=True, bot_type='unknown')
 
+        result = self._cache.get(user_agent)
+
+        if result is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(user_agent)
+        else:
+            self.cache_misses += 1
+            result = self._classify(user_agent)
+
+            if self.cache_size > 0:
+                self._cache[user_agent] = result
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if result['is_bot']:
+            self.bot_count += 1
+        else:
+            self.human_count += 1
+
+        return dict(result)
+
+    def _classify(self, user_agent: str) -> Dict:
+        """Classify a non-empty user agent (uncached, does not update counters)"""
         user_agent_lower = user_agent.lower()
 
         # Check against bot patterns
         for pattern, bot_name in self.COMPILED_PATTERNS:
             if pattern.search(user_agent_lower):
-                self.bot_count += 1
                 return {
                     'is_bot': True,
                     'bot_type': bot_name,
@@ -100,7 +136,6 @@ class BotDetector:
             is_bot = parsed.is_bot
 
             if is_bot:
-                self.bot_count += 1
                 return {
                     'is_bot': True,
                     'bot_type': 'detected_bot',
@@ -110,7 +145,6 @@ class BotDetector:
                 }
 
             # Human traffic
-            self.human_count += 1
             return {
                 'is_bot': False,
                 'bot_type': '',
@@ -120,7 +154,6 @@ class BotDetector:
             }
 
         # Fallback: basic human detection
-        self.human_count += 1
         return {
             'is_bot': False,
             'bot_type': '',
@@ -198,12 +231,17 @@ class BotDetector:
     def get_stats(self) -> Dict:
         """Get detection statistics"""
         total = self.bot_count + self.human_count
+        lookups = self.cache_hits + self.cache_misses
 
         return {
             'bot_count': self.bot_count,
             'human_count': self.human_count,
             'total_processed': total,
-            'bot_percentage': round(self.bot_count / total * 100, 2) if total > 0 else 0
+            'bot_percentage': round(self.bot_count / total * 100, 2) if total > 0 else 0,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_hit_rate': round(self.cache_hits / lookups * 100, 2) if lookups > 0 else 0,
+            'cache_entries': len(self._cache)
         }
 
 
@@ -234,3 +272,4 @@ if __name__ == "__main__":
     print(f"  Total: {stats['total_processed']}")
     print(f"  Bots: {stats['bot_count']} ({stats['bot_percentage']}%)")
     print(f"  Humans: {stats['human_count']}")
+    print(f"  Cache hit rate: {stats['cache_hit_rate']}%")
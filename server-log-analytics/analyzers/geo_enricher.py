@@ -0,0 +1,500 @@
+"""
+Geo Enricher - Maps client IPs to country code and city
+Looks addresses up in a memory-mapped MaxMind mmdb or sorted-range file behind a per-IP LRU
+"""
+
+import csv
+import logging
+import mmap
+import os
+import socket
+import struct
+import sys
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Try to import maxminddb for .mmdb databases
+try:
+    import maxminddb
+    MAXMINDDB_AVAILABLE = True
+except ImportError:
+    MAXMINDDB_AVAILABLE = False
+
+# (country_code, city) for addresses the database does not cover
+UNKNOWN_LOCATION = ('', '')
+
+
+class RangeDatabase:
+    """
+    Sorted-range IP database read from a memory-mapped file
+
+    Built from CSV by build_range_database(). The file holds sorted,
+    non-overlapping IPv4 ranges (uint32 start/end) and IPv6 ranges keyed by
+    the /64 prefix (uint64 start/end), each with an index into a table of
+    "country<TAB>city" locations. Lookups bisect the mapped arrays in place,
+    so nothing is read into memory up front and no lookup does file I/O
+    beyond page faults served from the page cache, which worker processes
+    share. A table of where each IPv4 /16 starts in the ranges narrows the
+    bisect to a few entries.
+    """
+
+    MAGIC = b'SLAGEO1\n'
+
+    # magic, IPv4 ranges, IPv6 ranges, locations, location blob bytes
+    HEADER = struct.Struct('<8sIIII')
+
+    # Entries in the IPv4 /16 prefix table (one past the last prefix)
+    PREFIX_ENTRIES = 65537
+
+    def __init__(self, path: str):
+        """
+        Map a range database
+
+        Args:
+            path: File written by build_range_database()
+        """
+        if sys.byteorder != 'little':
+            raise ValueError("Range databases are little-endian; use an .mmdb on this machine")
+
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mmap)
+        magic, v4_count, v6_count, location_count, blob_size = self.HEADER.unpack_from(view)
+        if magic != self.MAGIC:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"{path} is not a range database (build one with scripts/build_geo_db.py)")
+
+        offset = _align(self.HEADER.size)
+        sections = []
+        for count, code in ((v4_count, 'I'), (v4_count, 'I'), (v4_count, 'I'),
+                            (self.PREFIX_ENTRIES, 'I'),
+                            (v6_count, 'Q'), (v6_count, 'Q'), (v6_count, 'I'),
+                            (location_count + 1, 'I')):
+            size = count * struct.calcsize(code)
+            sections.append(view[offset:offset + size].cast(code))
+            offset = _align(offset + size)
+
+        (self._v4_starts, self._v4_ends, self._v4_locations, self._v4_prefixes,
+         self._v6_starts, self._v6_ends, self._v6_locations,
+         self._location_offsets) = sections
+        self._blob = view[offset:offset + blob_size]
+        self._view = view
+
+        # Decoded locations by index, shared by every IP in that location
+        self._decoded: Dict[int, Tuple[str, str]] = {}
+
+        self.v4_ranges = v4_count
+        self.v6_ranges = v6_count
+
+    def lookup(self, ip: str) -> Optional[Tuple[str, str]]:
+        """
+        Find the location of an address
+
+        Args:
+            ip: IPv4 or IPv6 address
+
+        Returns:
+            (country_code, city), or None if no range covers it
+        """
+        try:
+            if ':' not in ip:
+                key = int.from_bytes(socket.inet_aton(ip), 'big')
+                prefix = key >> 16
+                index = bisect_right(
+                    self._v4_starts, key, self._v4_prefixes[prefix], self._v4_prefixes[prefix + 1]
+                ) - 1
+                ends, locations = self._v4_ends, self._v4_locations
+            elif ip.startswith('::ffff:') and '.' in ip:
+                # IPv4-mapped IPv6 (dual-stack listeners)
+                return self.lookup(ip[7:])
+            else:
+                key = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip)[:8], 'big')
+                index = bisect_right(self._v6_starts, key) - 1
+                ends, locations = self._v6_ends, self._v6_locations
+        except OSError:
+            return None
+
+        if index < 0 or key > ends[index]:
+            return None
+
+        return self._location(locations[index])
+
+    def _location(self, index: int) -> Tuple[str, str]:
+        """Decode location `index` from the blob (once)"""
+        location = self._decoded.get(index)
+        if location is None:
+            start, end = self._location_offsets[index], self._location_offsets[index + 1]
+            country_code, _, city = bytes(self._blob[start:end]).decode('utf-8').partition('\t')
+            location = self._decoded[index] = (country_code, city)
+        return location
+
+    def close(self):
+        """Release the mapping"""
+        for section in (self._v4_starts, self._v4_ends, self._v4_locations, self._v4_prefixes,
+                        self._v6_starts, self._v6_ends, self._v6_locations,
+                        self._location_offsets, self._blob, self._view):
+            section.release()
+        self._mmap.close()
+
+
+class MaxMindDatabase:
+    """
+    MaxMind (GeoLite2/GeoIP2 City or Country) or compatible .mmdb database
+
+    Opened in maxminddb's mmap mode (the C extension when installed).
+    """
+
+    def __init__(self, path: str):
+        """
+        Open an mmdb database
+
+        Args:
+            path: .mmdb file
+        """
+        if not MAXMINDDB_AVAILABLE:
+            raise ValueError(f"{path} looks like an mmdb database, which needs maxminddb (pip install maxminddb)")
+
+        self.path = path
+        try:
+            self.reader = maxminddb.open_database(path, maxminddb.MODE_AUTO)
+        except maxminddb.InvalidDatabaseError as e:
+            raise ValueError(f"{path} is neither a range database nor a valid mmdb: {e}") from e
+
+    def lookup(self, ip: str) -> Optional[Tuple[str, str]]:
+        """
+        Find the location of an address
+
+        Args:
+            ip: IPv4 or IPv6 address
+
+        Returns:
+            (country_code, city), or None if the database has no record
+        """
+        try:
+            record = self.reader.get(ip)
+        except ValueError:
+            return None
+
+        if not record:
+            return None
+
+        country = record.get('country') or record.get('registered_country') or {}
+        city = record.get('city', {}).get('names', {}).get('en', '')
+        return (country.get('iso_code', ''), city)
+
+    def close(self):
+        """Close the reader"""
+        self.reader.close()
+
+
+def open_database(path: str):
+    """
+    Open a geo database, detecting its type from the file header
+
+    Args:
+        path: Range database (see build_range_database) or .mmdb file
+
+    Returns:
+        RangeDatabase or MaxMindDatabase
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(RangeDatabase.MAGIC))
+
+    if magic == RangeDatabase.MAGIC:
+        return RangeDatabase(path)
+    return MaxMindDatabase(path)
+
+
+class GeoEnricher:
+    """
+    Resolves client IPs to (country_code, city) for fact_requests
+
+    A handful of clients make most requests, so lookups go through an LRU
+    keyed by the IP string (functools.lru_cache, whose C hit path costs a
+    fraction of a database lookup); misses hit the memory-mapped database.
+    """
+
+    def __init__(self, database_path: str, cache_size: int = 100000):
+        """
+        Initialize enricher
+
+        Args:
+            database_path: Range database or .mmdb file (see open_database)
+            cache_size: Max IPs kept in the lookup LRU (0 disables it)
+        """
+        self.database = open_database(database_path)
+
+        self.cache_size = cache_size
+        self.located = 0
+        self._cached_lookup = lru_cache(maxsize=cache_size)(self._locate)
+
+    def lookup(self, ip_address: str) -> Tuple[str, str]:
+        """
+        Locate a client
+
+        Args:
+            ip_address: Client IP
+
+        Returns:
+            (country_code, city); empty strings when unknown
+        """
+        result = self._cached_lookup(ip_address)
+
+        if result[0]:
+            self.located += 1
+
+        return result
+
+    def _locate(self, ip_address: str) -> Tuple[str, str]:
+        """Uncached lookup"""
+        return self.database.lookup(ip_address) or UNKNOWN_LOCATION
+
+    @property
+    def cache_hits(self) -> int:
+        """Lookups answered by the LRU"""
+        return self._cached_lookup.cache_info().hits
+
+    @property
+    def cache_misses(self) -> int:
+        """Lookups that went to the database"""
+        return self._cached_lookup.cache_info().misses
+
+    def close(self):
+        """Close the database"""
+        self.database.close()
+
+    def get_stats(self) -> Dict:
+        """Get lookup statistics"""
+        cache_info = self._cached_lookup.cache_info()
+        lookups = cache_info.hits + cache_info.misses
+
+        return {
+            'lookups': lookups,
+            'located': self.located,
+            'located_percentage': round(self.located / lookups * 100, 2) if lookups > 0 else 0,
+            'cache_hits': cache_info.hits,
+            'cache_misses': cache_info.misses,
+            'cache_hit_rate': round(cache_info.hits / lookups * 100, 2) if lookups > 0 else 0,
+            'cache_entries': cache_info.currsize
+        }
+
+
+# CSV columns accepted by build_range_database, preferred first
+CSV_COLUMNS = {
+    'network': ('network', 'cidr'),
+    'start': ('start_ip', 'ip_start', 'range_start'),
+    'end': ('end_ip', 'ip_end', 'range_end'),
+    'country_code': ('country_code', 'country_iso_code', 'country'),
+    'city': ('city', 'city_name'),
+    'geoname_id': ('geoname_id',)
+}
+
+
+def build_range_database(
+    csv_paths: Iterable[str],
+    output_path: str,
+    locations_path: Optional[str] = None
+) -> Dict:
+    """
+    Build a range database from CSV
+
+    Each row is a CIDR `network` or a `start_ip`/`end_ip` pair with a
+    `country_code` and optional `city` (DB-IP and IP2Location style exports),
+    or a GeoLite2 blocks row whose `geoname_id` is resolved through the
+    GeoLite2 locations CSV. IPv4 and IPv6 rows may be mixed or split across
+    files. Overlapping ranges keep the first one; adjacent ranges with the
+    same location are merged. IPv6 ranges are stored at /64 granularity.
+
+    Args:
+        csv_paths: Block/range CSV files
+        output_path: Database file to write
+        locations_path: GeoLite2 locations CSV for geoname_id rows
+
+    Returns:
+        Dict with rows, v4_ranges, v6_ranges, locations and skipped rows
+    """
+    geonames = _load_geonames(locations_path) if locations_path else {}
+    location_ids: Dict[Tuple[str, str], int] = {}
+    ranges = {4: [], 6: []}
+    rows = skipped = 0
+
+    for csv_path in csv_paths:
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            columns = {
+                field: next((name for name in names if name in (reader.fieldnames or ())), None)
+                for field, names in CSV_COLUMNS.items()
+            }
+            if not columns['network'] and not (columns['start'] and columns['end']):
+                raise ValueError(f"{csv_path} needs a network column or start_ip/end_ip columns")
+
+            for row in reader:
+                rows += 1
+                try:
+                    if columns['network']:
+                        version, first, last = _parse_network(row[columns['network']])
+                    else:
+                        version, first = _parse_address(row[columns['start']])
+                        last_version, last = _parse_address(row[columns['end']])
+                        if last_version != version:
+                            raise ValueError("mixed address families")
+                except (OSError, ValueError):
+                    skipped += 1
+                    continue
+
+                if columns['geoname_id'] and geonames:
+                    # GeoLite2 leaves geoname_id empty where only the registered country is known
+                    geoname_id = row[columns['geoname_id']] or row.get('registered_country_geoname_id', '')
+                    country_code, city = geonames.get(geoname_id, UNKNOWN_LOCATION)
+                else:
+                    country_code = row[columns['country_code']] if columns['country_code'] else ''
+                    city = row[columns['city']] if columns['city'] else ''
+
+                country_code = country_code.strip().upper()
+                if len(country_code) != 2 or first > last:
+                    skipped += 1
+                    continue
+
+                location = (country_code, city.strip().replace('\t', ' '))
+                location_id = location_ids.setdefault(location, len(location_ids))
+
+                if version == 4:
+                    ranges[4].append((first, last, location_id))
+                else:
+                    ranges[6].append((first >> 64, last >> 64, location_id))
+
+    v4_ranges = _merge_ranges(ranges[4])
+    v6_ranges = _merge_ranges(ranges[6])
+    locations = sorted(location_ids, key=location_ids.get)
+    _write_range_database(output_path, v4_ranges, v6_ranges, locations)
+
+    logger.info(f"Wrote {output_path}: {len(v4_ranges):,} IPv4 and {len(v6_ranges):,} IPv6 ranges, "
+                f"{len(locations):,} locations ({skipped:,} rows skipped)")
+
+    return {
+        'rows': rows,
+        'v4_ranges': len(v4_ranges),
+        'v6_ranges': len(v6_ranges),
+        'locations': len(locations),
+        'skipped': skipped
+    }
+
+
+def _parse_address(text: str) -> Tuple[int, int]:
+    """(version, integer value) of an IP address; OSError if it is not one"""
+    text = text.strip()
+    if ':' in text:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text), 'big')
+    return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), 'big')
+
+
+def _parse_network(text: str) -> Tuple[int, int, int]:
+    """(version, first, last) integer values of a CIDR network"""
+    address, _, prefix_length = text.partition('/')
+    version, value = _parse_address(address)
+    host_bits = (32 if version == 4 else 128) - int(prefix_length)
+    if host_bits < 0:
+        raise ValueError(f"invalid prefix length in {text}")
+
+    first = value >> host_bits << host_bits
+    return version, first, first | ((1 << host_bits) - 1)
+
+
+def _load_geonames(locations_path: str) -> Dict[str, Tuple[str, str]]:
+    """Read a GeoLite2 locations CSV into geoname_id -> (country_code, city)"""
+    with open(locations_path, newline='', encoding='utf-8') as f:
+        return {
+            row['geoname_id']: (row.get('country_iso_code', ''), row.get('city_name', ''))
+            for row in csv.DictReader(f)
+        }
+
+
+def _merge_ranges(ranges: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """Sort ranges, drop overlaps (first wins) and merge adjacent ranges of one location"""
+    ranges.sort(key=lambda r: r[0])
+    merged = []
+
+    for start, end, location_id in ranges:
+        if merged:
+            last_start, last_end, last_location = merged[-1]
+            if start <= last_end:
+                # Overlap (or an IPv6 range narrower than /64): keep the earlier range
+                if end <= last_end:
+                    continue
+                start = last_end + 1
+            if start == last_end + 1 and location_id == last_location:
+                merged[-1] = (last_start, end, location_id)
+                continue
+        merged.append((start, end, location_id))
+
+    return merged
+
+
+def _write_range_database(
+    path: str,
+    v4_ranges: List[Tuple[int, int, int]],
+    v6_ranges: List[Tuple[int, int, int]],
+    locations: List[Tuple[str, str]]
+):
+    """Write the file layout RangeDatabase maps (little-endian, 8-byte aligned sections)"""
+    v4_starts = [r[0] for r in v4_ranges]
+    prefixes = [bisect_right(v4_starts, prefix << 16) for prefix in range(RangeDatabase.PREFIX_ENTRIES - 1)]
+    prefixes.append(len(v4_starts))
+
+    blob = bytearray()
+    offsets = [0]
+    for country_code, city in locations:
+        blob += f"{country_code}\t{city}".encode('utf-8')
+        offsets.append(len(blob))
+
+    sections = [
+        struct.pack(f'<{len(v4_ranges)}I', *v4_starts),
+        struct.pack(f'<{len(v4_ranges)}I', *(r[1] for r in v4_ranges)),
+        struct.pack(f'<{len(v4_ranges)}I', *(r[2] for r in v4_ranges)),
+        struct.pack(f'<{len(prefixes)}I', *prefixes),
+        struct.pack(f'<{len(v6_ranges)}Q', *(r[0] for r in v6_ranges)),
+        struct.pack(f'<{len(v6_ranges)}Q', *(r[1] for r in v6_ranges)),
+        struct.pack(f'<{len(v6_ranges)}I', *(r[2] for r in v6_ranges)),
+        struct.pack(f'<{len(offsets)}I', *offsets),
+        bytes(blob)
+    ]
+
+    header = RangeDatabase.HEADER.pack(
+        RangeDatabase.MAGIC, len(v4_ranges), len(v6_ranges), len(locations), len(blob)
+    )
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(b'\0' * (_align(len(header)) - len(header)))
+        for section in sections:
+            f.write(section)
+            f.write(b'\0' * (_align(len(section)) - len(section)))
+
+    os.replace(tmp_path, path)
+
+
+def _align(offset: int) -> int:
+    """Round up to the next multiple of 8"""
+    return (offset + 7) & ~7
+
+
+if __name__ == "__main__":
+    # Look up addresses given on the command line
+    if len(sys.argv) < 3:
+        print("Usage: python -m analyzers.geo_enricher DATABASE IP [IP ...]")
+        sys.exit(1)
+
+    enricher = GeoEnricher(sys.argv[1])
+
+    for ip in sys.argv[2:]:
+        country_code, city = enricher.lookup(ip)
+        print(f"{ip:<40} {country_code or '--'}  {city}")
+
+    enricher.close()
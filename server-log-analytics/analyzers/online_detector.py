@@ -0,0 +1,527 @@
+"""
+Online Anomaly Detector - Scores per-minute traffic while logs are ingested
+Keeps exponentially weighted baselines (optionally per hour of week) that persist across runs
+"""
+
+import json
+import logging
+import math
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from analyzers.anomaly_detector import Anomaly, AnomalyDetector
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the state file layout changes; older files are ignored
+STATE_VERSION = 1
+
+# Paths per open minute kept in the state file
+STATE_TOP_PATHS = 20
+
+
+def _epoch(timestamp: datetime) -> float:
+    """Seconds since the epoch; naive timestamps are taken as UTC"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class _MinuteBucket:
+    """Requests counted into one minute of log time"""
+
+    __slots__ = ('start', 'requests', 'errors', 'latency_total', 'latency_count', 'paths')
+
+    def __init__(self, start: datetime):
+        self.start = start
+        self.requests = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_count = 0
+        self.paths = Counter()
+
+    def metrics(self) -> Dict[str, float]:
+        """Metric values of the minute (rates and latency only when there was traffic)"""
+        values = {'request_count': float(self.requests)}
+
+        if self.requests:
+            values['error_rate'] = self.errors / self.requests * 100
+        if self.latency_count:
+            values['avg_response_time_ms'] = self.latency_total / self.latency_count
+
+        return values
+
+    def to_state(self) -> List:
+        return [
+            self.start.isoformat(), self.requests, self.errors,
+            self.latency_total, self.latency_count,
+            dict(self.paths.most_common(STATE_TOP_PATHS))
+        ]
+
+    @classmethod
+    def from_state(cls, state: List) -> '_MinuteBucket':
+        bucket = cls(datetime.fromisoformat(state[0]))
+        bucket.requests, bucket.errors, bucket.latency_total, bucket.latency_count = state[1:5]
+        bucket.paths.update(state[5])
+        return bucket
+
+
+class _Baseline:
+    """Exponentially weighted mean and variance of one metric"""
+
+    __slots__ = ('mean', 'var', 'count')
+
+    def __init__(self, mean: float = 0.0, var: float = 0.0, count: int = 0):
+        self.mean = mean
+        self.var = var
+        self.count = count
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+    def update(self, value: float, alpha: float):
+        """Fold one observation in (incremental EWMA / EWMVar)"""
+        if self.count == 0:
+            self.mean = value
+            self.var = 0.0
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+
+        self.count += 1
+
+
+class OnlineAnomalyDetector(AnomalyDetector):
+    """
+    Streaming anomaly detection over per-minute traffic
+
+    Entries are counted into minute buckets by log time. A minute is closed
+    once entries ``allowed_lateness`` seconds past its end have been seen (or,
+    while the log is quiet, once the wall clock has passed it; see advance()).
+    Its request count, 5xx error rate and average latency are then scored
+    against EWMA mean/variance baselines and folded into them, in O(1) per
+    metric, so no history is kept. Minutes without any requests are scored
+    as zero traffic unless the gap is longer than ``max_gap_minutes``, which
+    is taken as an ingestion gap (e.g. the pipeline was stopped) instead.
+
+    With ``seasonal`` every metric also keeps one baseline per hour of the
+    week, which is used instead of the overall one once it has
+    ``min_samples`` points, so a Monday-morning peak is compared with earlier
+    Monday mornings rather than with the night before. Values beyond the
+    'medium' threshold are clipped before they update a baseline so a spike
+    does not drag the baseline along with it.
+    """
+
+    METRICS = ('request_count', 'error_rate', 'avg_response_time_ms')
+
+    # Metrics where only an increase is anomalous
+    UPWARD_ONLY = ('error_rate', 'avg_response_time_ms')
+
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        seasonal: bool = False,
+        seasonal_alpha: float = 0.02,
+        min_samples: int = 30,
+        allowed_lateness: int = 60,
+        max_gap_minutes: int = 60,
+        top_paths: int = 5
+    ):
+        """
+        Initialize online detector
+
+        Args:
+            alpha: Weight of the newest minute in the overall baselines
+            seasonal: Also keep a baseline per metric and hour of the week
+            seasonal_alpha: Weight of the newest minute in hour-of-week baselines
+                            (each sees 60 minutes a week, so it forgets more slowly)
+            min_samples: Minutes a baseline needs before it is used for scoring
+            allowed_lateness: Seconds an entry may arrive after its minute ended
+            max_gap_minutes: Longest run of empty minutes scored as zero traffic
+            top_paths: Busiest paths of a minute reported with its anomalies
+        """
+        super().__init__()
+        self.alpha = alpha
+        self.seasonal = seasonal
+        self.seasonal_alpha = seasonal_alpha
+        self.min_samples = min_samples
+        self.allowed_lateness = allowed_lateness
+        self.max_gap_minutes = max_gap_minutes
+        self.top_paths = top_paths
+
+        # 'metric' or 'metric@hour_of_week' -> _Baseline
+        self.baselines: Dict[str, _Baseline] = {}
+
+        # Open minutes (epoch minute -> bucket) and the last minute scored
+        self.buckets: Dict[int, _MinuteBucket] = {}
+        self.last_closed: Optional[int] = None
+        self.last_start: Optional[datetime] = None
+        self.watermark: Optional[float] = None
+
+        self.minutes_scored = 0
+        self.minutes_skipped = 0
+        self.late_entries = 0
+
+    def add(
+        self,
+        timestamp: datetime,
+        path: str,
+        status_code: int,
+        response_time_ms: Optional[int] = None
+    ):
+        """
+        Count one request into its minute
+
+        Args:
+            timestamp: Request time
+            path: Request path
+            status_code: HTTP status code (5xx counts as an error)
+            response_time_ms: Response time, if logged
+        """
+        seconds = _epoch(timestamp)
+        minute = int(seconds // 60)
+
+        if self.last_closed is not None and minute <= self.last_closed:
+            # Its minute has already been scored
+            self.late_entries += 1
+            return
+
+        bucket = self.buckets.get(minute)
+        if bucket is None:
+            bucket = self.buckets[minute] = _MinuteBucket(timestamp.replace(second=0, microsecond=0))
+
+        bucket.requests += 1
+        bucket.paths[path] += 1
+        if status_code >= 500:
+            bucket.errors += 1
+        if response_time_ms is not None:
+            bucket.latency_total += response_time_ms
+            bucket.latency_count += 1
+
+        if self.watermark is None or seconds > self.watermark:
+            self.watermark = seconds
+
+    def add_entries(self, entries: Iterable) -> List[Anomaly]:
+        """
+        Count parsed log entries and score the minutes they complete
+
+        Args:
+            entries: ParsedLogEntry objects, roughly in time order
+
+        Returns:
+            Anomalies found in the minutes closed by these entries
+        """
+        for entry in entries:
+            self.add(entry.timestamp, entry.path, entry.status_code, entry.response_time_ms)
+
+        if self.watermark is None:
+            return []
+
+        return self._close(int((self.watermark - self.allowed_lateness) // 60))
+
+    def advance(self, now: datetime) -> List[Anomaly]:
+        """
+        Score minutes that ended more than allowed_lateness before ``now``
+
+        Called while the log is quiet, so silent minutes are scored (as a
+        traffic drop) without waiting for the next entry.
+
+        Args:
+            now: Current time (timezone-aware)
+
+        Returns:
+            Anomalies found in the closed minutes
+        """
+        return self._close(int((_epoch(now) - self.allowed_lateness) // 60))
+
+    def flush(self) -> List[Anomaly]:
+        """Score every open minute (end of input)"""
+        if not self.buckets:
+            return []
+
+        return self._close(max(self.buckets) + 1)
+
+    def _close(self, end: int) -> List[Anomaly]:
+        """Score all minutes before epoch minute ``end``, in order"""
+        if self.last_closed is None:
+            if not self.buckets:
+                return []
+            self.last_closed = min(self.buckets) - 1
+
+        if end <= self.last_closed + 1:
+            return []
+
+        anomalies = []
+
+        for minute in sorted(m for m in self.buckets if m < end) + [end]:
+            gap = minute - self.last_closed - 1
+
+            if gap > self.max_gap_minutes:
+                logger.info(f"No requests for {gap:,} minutes; not scoring them as traffic")
+                self.minutes_skipped += gap
+            else:
+                for offset in range(1, gap + 1):
+                    anomalies.extend(self._score(_MinuteBucket(self._minute_start(self.last_closed + offset))))
+
+            if minute == end:
+                self.last_start = self._minute_start(end - 1)
+                self.last_closed = end - 1
+                break
+
+            bucket = self.buckets.pop(minute)
+            anomalies.extend(self._score(bucket))
+            self.last_start = bucket.start
+            self.last_closed = minute
+
+        self.anomalies_detected += len(anomalies)
+        return anomalies
+
+    def _minute_start(self, minute: int) -> datetime:
+        """Start of a minute after the last scored one, in the log's timezone"""
+        return self.last_start + timedelta(minutes=minute - self.last_closed)
+
+    def _baseline(self, key: str) -> _Baseline:
+        baseline = self.baselines.get(key)
+        if baseline is None:
+            baseline = self.baselines[key] = _Baseline()
+        return baseline
+
+    def _clipped(self, value: float, baseline: _Baseline) -> float:
+        """Limit how far one minute can move a warmed-up baseline"""
+        if baseline.count < self.min_samples or baseline.var <= 0:
+            return value
+
+        limit = self.ANOMALY_THRESHOLDS['medium'] * baseline.std
+        return min(max(value, baseline.mean - limit), baseline.mean + limit)
+
+    def _score(self, bucket: _MinuteBucket) -> List[Anomaly]:
+        """Score one closed minute, then update its baselines"""
+        anomalies = []
+        hour_of_week = bucket.start.weekday() * 24 + bucket.start.hour
+
+        for metric, value in bucket.metrics().items():
+            overall = self._baseline(metric)
+            seasonal = self._baseline(f"{metric}@{hour_of_week}") if self.seasonal else None
+
+            if seasonal is not None and seasonal.count >= self.min_samples:
+                anomaly = self._check(bucket, metric, value, seasonal, 'hour_of_week')
+            else:
+                anomaly = self._check(bucket, metric, value, overall, 'overall')
+
+            if anomaly:
+                anomalies.append(anomaly)
+
+            overall.update(self._clipped(value, overall), self.alpha)
+            if seasonal is not None:
+                seasonal.update(self._clipped(value, seasonal), self.seasonal_alpha)
+
+        self.minutes_scored += 1
+        return anomalies
+
+    @staticmethod
+    def _noise_floor(metric: str, mean: float, requests: int) -> float:
+        """
+        Smallest standard deviation expected from sampling alone
+
+        A quiet series (say, almost no 5xx) has a near-zero EWMA variance, so
+        one error among twenty requests would otherwise score as extreme.
+        Counts are floored at Poisson noise and rates at binomial noise for
+        the minute's request count.
+        """
+        if metric == 'request_count':
+            return math.sqrt(max(mean, 1.0))
+
+        if metric == 'error_rate' and requests:
+            share = min(max(mean / 100, 1 / requests), 0.5)
+            return 100 * math.sqrt(share * (1 - share) / requests)
+
+        return 0.0
+
+    def _check(
+        self,
+        bucket: _MinuteBucket,
+        metric: str,
+        value: float,
+        baseline: _Baseline,
+        baseline_name: str
+    ) -> Optional[Anomaly]:
+        """Build an Anomaly if value is far enough from a warmed-up baseline"""
+        if baseline.count < self.min_samples:
+            return None
+
+        std = max(baseline.std, self._noise_floor(metric, baseline.mean, bucket.requests))
+
+        # Skip if no variation
+        if std <= 0:
+            return None
+
+        z_score = (value - baseline.mean) / std
+        if metric in self.UPWARD_ONLY and z_score <= 0:
+            return None
+
+        severity = self._get_severity_from_zscore(abs(z_score))
+        if not severity:
+            return None
+
+        if metric == 'request_count':
+            anomaly_type = 'traffic_spike' if z_score > 0 else 'traffic_drop'
+        elif metric == 'error_rate':
+            anomaly_type = 'error_rate'
+        else:
+            anomaly_type = 'latency_spike'
+
+        return Anomaly(
+            anomaly_type=anomaly_type,
+            severity=severity,
+            timestamp=bucket.start,
+            metric_name=metric,
+            expected_value=baseline.mean,
+            actual_value=value,
+            deviation_score=abs(z_score),
+            description=f"{metric} is {abs(z_score):.1f}σ from {baseline_name.replace('_', '-')} baseline",
+            context={
+                'baseline': baseline_name,
+                'baseline_mean': baseline.mean,
+                'baseline_std': std,
+                'percent_change': ((value - baseline.mean) / baseline.mean * 100) if baseline.mean > 0 else 0,
+                'window_start': bucket.start,
+                'window_end': bucket.start + timedelta(minutes=1),
+                'requests': bucket.requests,
+                'top_paths': [path for path, _ in bucket.paths.most_common(self.top_paths)]
+            }
+        )
+
+    def get_state(self) -> Dict:
+        """Baselines and open minutes as a JSON-serializable dict"""
+        return {
+            'version': STATE_VERSION,
+            'baselines': {
+                key: [baseline.mean, baseline.var, baseline.count]
+                for key, baseline in self.baselines.items()
+            },
+            'last_closed': self.last_closed,
+            'last_start': self.last_start.isoformat() if self.last_start else None,
+            'watermark': self.watermark,
+            'buckets': [bucket.to_state() for _, bucket in sorted(self.buckets.items())]
+        }
+
+    def set_state(self, state: Dict):
+        """Restore what get_state() returned"""
+        self.baselines = {key: _Baseline(*values) for key, values in state['baselines'].items()}
+        self.last_closed = state['last_closed']
+        self.last_start = datetime.fromisoformat(state['last_start']) if state['last_start'] else None
+        self.watermark = state['watermark']
+
+        self.buckets = {}
+        for values in state['buckets']:
+            bucket = _MinuteBucket.from_state(values)
+            self.buckets[int(_epoch(bucket.start) // 60)] = bucket
+
+    def save(self, path: str, state: Optional[Dict] = None):
+        """
+        Persist baselines and open minutes to a JSON state file
+
+        The file is replaced atomically so a crash never leaves it partial.
+
+        Args:
+            path: JSON state file
+            state: An earlier get_state() snapshot to write instead of the current state
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.get_state() if state is None else state, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Restore state saved by an earlier run
+
+        Args:
+            path: JSON state file
+
+        Returns:
+            True if state was loaded (False if missing, unreadable or outdated)
+        """
+        if not os.path.exists(path):
+            return False
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') != STATE_VERSION:
+                logger.warning(f"Ignoring anomaly state {path} from another version")
+                return False
+            self.set_state(state)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable anomaly state {path}: {e}")
+            return False
+
+        logger.info(f"Loaded {len(self.baselines):,} anomaly baselines from {path}")
+        return True
+
+    def get_stats(self) -> Dict:
+        """Get detector statistics"""
+        warm = sum(1 for baseline in self.baselines.values() if baseline.count >= self.min_samples)
+        return {
+            'anomalies_detected': self.anomalies_detected,
+            'minutes_scored': self.minutes_scored,
+            'minutes_skipped': self.minutes_skipped,
+            'late_entries': self.late_entries,
+            'open_minutes': len(self.buckets),
+            'baselines': len(self.baselines),
+            'warm_baselines': warm
+        }
+
+
+if __name__ == "__main__":
+    # Simulate two days of minute traffic with an outage and an error burst
+    import random
+
+    random.seed(7)
+    detector = OnlineAnomalyDetector(seasonal=True)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    class Entry:
+        __slots__ = ('timestamp', 'path', 'status_code', 'response_time_ms')
+
+        def __init__(self, timestamp, path, status_code, response_time_ms):
+            self.timestamp = timestamp
+            self.path = path
+            self.status_code = status_code
+            self.response_time_ms = response_time_ms
+
+    found = []
+    for minute in range(2 * 24 * 60):
+        if 1800 <= minute < 1805:
+            continue  # outage
+
+        hour = (minute // 60) % 24
+        rate = 40 + 30 * math.sin(hour / 24 * 2 * math.pi)
+        error_share = 0.3 if minute == 2500 else 0.01
+
+        entries = [
+            Entry(
+                start + timedelta(minutes=minute, seconds=random.random() * 60),
+                random.choice(['/', '/products', '/cart', '/api/search']),
+                500 if random.random() < error_share else 200,
+                int(random.gammavariate(4.0, 30.0))
+            )
+            for _ in range(int(random.gauss(rate, math.sqrt(rate))))
+        ]
+        entries.sort(key=lambda e: e.timestamp)
+        found.extend(detector.add_entries(entries))
+
+    found.extend(detector.flush())
+
+    print("Online Anomaly Detection Test:\n")
+    for anomaly in found:
+        if anomaly.severity in ('high', 'critical'):
+            print(f"  [{anomaly.severity.upper():8}] {anomaly.timestamp:%a %H:%M} {anomaly.description} "
+                  f"(actual {anomaly.actual_value:.1f}, expected {anomaly.expected_value:.1f})")
+
+    print(f"\nStats: {detector.get_stats()}")
@@ -0,0 +1,204 @@
+"""
+Path Miner - Mines common navigation paths from session page sequences
+Counts journeys in a depth-bounded prefix tree with per-step funnel drop-off
+"""
+
+import heapq
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _TrieNode:
+    """Sessions whose journey starts with the pages leading to this node"""
+
+    __slots__ = ('count', 'converted', 'children')
+
+    def __init__(self):
+        self.count = 0
+        self.converted = 0
+        self.children = {}
+
+
+class PathMiner:
+    """
+    Counts session journeys in a prefix tree (trie)
+
+    Each session walks the trie along its first ``max_depth`` pages, so a node
+    holds how many sessions started with that path and how many of them went
+    on to convert. Sessions are added one at a time, so any number can be
+    streamed through; memory is bounded by ``max_nodes``. When the trie grows
+    past it, the rarest branches are pruned (lossy counting) and
+    ``max_undercount`` records how far any reported count can be too low.
+    """
+
+    def __init__(
+        self,
+        max_depth: int = 5,
+        max_nodes: int = 1000000,
+        conversion_paths: Iterable[str] = ()
+    ):
+        """
+        Initialize path miner
+
+        Args:
+            max_depth: Pages per journey that are tracked (longest reported path)
+            max_nodes: Trie size at which rare branches are pruned
+            conversion_paths: Goal pages; used when add() is not told whether
+                              the session converted
+        """
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.conversion_paths = set(conversion_paths)
+
+        self.root = _TrieNode()
+        self.num_nodes = 0
+
+        self.prunes = 0
+        self.max_undercount = 0
+
+    def add(self, pages: Sequence[str], converted: Optional[bool] = None):
+        """
+        Count one session's journey
+
+        Args:
+            pages: Pages of the session in visit order
+            converted: Whether the session reached a goal (default: any page
+                       is one of conversion_paths)
+        """
+        if converted is None:
+            converted = any(page in self.conversion_paths for page in pages)
+
+        converted = 1 if converted else 0
+
+        node = self.root
+        node.count += 1
+        node.converted += converted
+
+        for page in pages[:self.max_depth]:
+            child = node.children.get(page)
+            if child is None:
+                child = node.children[page] = _TrieNode()
+                self.num_nodes += 1
+
+            child.count += 1
+            child.converted += converted
+            node = child
+
+        if self.num_nodes > self.max_nodes:
+            self._prune()
+
+    @property
+    def sessions(self) -> int:
+        """Number of sessions counted"""
+        return self.root.count
+
+    def _walk(self) -> Iterator[Tuple[Tuple[str, ...], _TrieNode]]:
+        """Yield (pages, node) for every node below the root"""
+        stack = [((page,), child) for page, child in self.root.children.items()]
+
+        while stack:
+            pages, node = stack.pop()
+            yield pages, node
+
+            for page, child in node.children.items():
+                stack.append((pages + (page,), child))
+
+    def _prune(self):
+        """Drop the rarest branches until the trie is back to 3/4 of max_nodes"""
+        target = self.max_nodes * 3 // 4
+        counts = sorted((node.count for _, node in self._walk()), reverse=True)
+        threshold = counts[target]
+
+        # A child never outnumbers its parent, so whole branches go at once
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for page, child in list(node.children.items()):
+                if child.count <= threshold:
+                    del node.children[page]
+                else:
+                    stack.append(child)
+
+        self.num_nodes = sum(1 for _ in self._walk())
+        self.prunes += 1
+
+        # A pruned path that reappears restarts from zero
+        self.max_undercount += threshold
+
+        logger.info(
+            f"Pruned journey trie to {self.num_nodes:,} nodes "
+            f"(count <= {threshold:,} dropped, max undercount {self.max_undercount:,})"
+        )
+
+    def _funnel(self, pages: Tuple[str, ...]) -> List[Dict]:
+        """Sessions remaining at each step of a path and the share lost per step"""
+        funnel = []
+        previous = None
+        node = self.root
+
+        for page in pages:
+            node = node.children[page]
+            funnel.append({
+                'page': page,
+                'sessions': node.count,
+                'drop_off': round(1 - node.count / previous, 4) if previous else None
+            })
+            previous = node.count
+
+        return funnel
+
+    def top_paths(
+        self,
+        steps: Optional[int] = None,
+        top_n: int = 20,
+        min_frequency: int = 1,
+        min_steps: int = 1
+    ) -> List[Dict]:
+        """
+        Most frequent journeys
+
+        Args:
+            steps: Only report paths of exactly this many pages (default: any
+                   length up to max_depth)
+            top_n: Number of paths to return
+            min_frequency: Minimum number of sessions following a path
+            min_steps: Shortest path reported (2 skips plain entry pages)
+
+        Returns:
+            List of path dicts, most frequent first
+        """
+        candidates = (
+            (pages, node) for pages, node in self._walk()
+            if node.count >= min_frequency and len(pages) >= min_steps
+            and (steps is None or len(pages) == steps)
+        )
+
+        top = heapq.nlargest(top_n, candidates, key=lambda item: (item[1].count, -len(item[0])))
+        total = self.sessions
+
+        return [
+            {
+                'path': ' → '.join(pages),
+                'pages': list(pages),
+                'steps': len(pages),
+                'frequency': node.count,
+                'share': round(node.count / total, 4) if total else 0.0,
+                'conversions': node.converted,
+                'conversion_rate': round(node.converted / node.count, 4),
+                'funnel': self._funnel(pages),
+                'is_conversion': any(page in self.conversion_paths for page in pages)
+            }
+            for pages, node in top
+        ]
+
+    def get_stats(self) -> Dict:
+        """Get path miner statistics"""
+        return {
+            'sessions': self.sessions,
+            'nodes': self.num_nodes,
+            'max_depth': self.max_depth,
+            'prunes': self.prunes,
+            'max_undercount': self.max_undercount
+        }
@@ -1,11 +1,13 @@
 """
 Security Scanner - Detects malicious activity in logs
-Identifies SQL injection, XSS, path traversal, and other attacks
+Identifies SQL injection, XSS, path traversal, and other attacks, plus
+request bursts, credential stuffing and scanners from per-IP request rates
 """
 
 import logging
 import re
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
@@ -21,6 +23,159 @@ class SecurityThreat:
     description: str
 
 
+class _WindowCount:
+    """Requests of one key in the current and previous fixed window"""
+
+    __slots__ = ('start', 'current', 'previous', 'alerted_until')
+
+    def __init__(self, start: int):
+        self.start = start
+        self.current = 0
+        self.previous = 0
+        self.alerted_until = 0.0
+
+
+class RateTracker:
+    """
+    Memory-bounded sliding-window request counters per client IP
+
+    Each rule counts matching requests per IP over a sliding window,
+    estimated from two fixed windows: the current count plus the previous
+    window's count weighted by how much of it still overlaps the sliding
+    window. That is exact for evenly spread traffic and needs three numbers
+    per key, however long the window. Keys live in one LRU per rule, capped
+    at ``max_keys``, so millions of one-off IPs only ever evict each other;
+    an IP keeps its count as long as it returns before ``max_keys`` other
+    IPs have been seen, which any IP fast enough to trip a limit does.
+
+    A key that crosses its threshold alerts once, then again only after a
+    full window, while it stays above.
+    """
+
+    # rule -> (threat type, what is counted, window seconds, threshold)
+    RULES = {
+        'burst': ('rate_limit_exceeded', 'requests', 10, 100),
+        'login': ('credential_stuffing', 'login attempts', 300, 20),
+        'not_found': ('vulnerability_scan', 'requests for missing paths', 60, 30),
+    }
+
+    # Paths that take credentials; POSTs to them count as login attempts
+    LOGIN_PATH_PATTERN = re.compile(
+        r"(?:^|/)(?:wp-login\.php|xmlrpc\.php|log-?in|sign-?in|log-?on|auth(?:enticate)?"
+        r"|oauth2?/token|sessions?)(?:[/.]|$)",
+        re.IGNORECASE
+    )
+
+    def __init__(self, rules: Optional[Dict[str, Tuple[str, str, int, int]]] = None, max_keys: int = 100000):
+        """
+        Initialize rate tracker
+
+        Args:
+            rules: Overrides for RULES entries (same tuple layout)
+            max_keys: Max IPs tracked per rule (least recently seen are evicted)
+        """
+        self.rules = {**self.RULES, **(rules or {})}
+        self.max_keys = max_keys
+
+        self.counters = {rule: OrderedDict() for rule in self.rules}
+
+        # rule -> (counters, window, threshold), unpacked once for the hot path
+        self._limits = {
+            rule: (self.counters[rule], window, threshold)
+            for rule, (_, _, window, threshold) in self.rules.items()
+        }
+
+        self.evictions = 0
+        self.alerts = {rule: 0 for rule in self.rules}
+
+    @classmethod
+    def path_class(cls, path: str) -> str:
+        """Coarse class of a request path used to pick rules (login or other)"""
+        return 'login' if cls.LOGIN_PATH_PATTERN.search(path) else 'other'
+
+    def record(
+        self,
+        ip_address: str,
+        path: str,
+        method: str,
+        status_code: int,
+        timestamp: float
+    ) -> List[Tuple[str, int]]:
+        """
+        Count one request against every rule it matches
+
+        Args:
+            ip_address: Client IP
+            path: Request path
+            method: HTTP method
+            status_code: Response status
+            timestamp: Request time in epoch seconds (input roughly time-ordered)
+
+        Returns:
+            (rule, requests in window) for each rule that alerts on this request
+        """
+        alerts = []
+
+        count = self._hit('burst', ip_address, timestamp)
+        if count is not None:
+            alerts.append(('burst', count))
+
+        if method == 'POST' and self.path_class(path) == 'login':
+            count = self._hit('login', ip_address, timestamp)
+            if count is not None:
+                alerts.append(('login', count))
+
+        if status_code == 404:
+            count = self._hit('not_found', ip_address, timestamp)
+            if count is not None:
+                alerts.append(('not_found', count))
+
+        return alerts
+
+    def _hit(self, rule: str, key: str, timestamp: float) -> Optional[int]:
+        """Count a request for key; returns the window count if it should alert"""
+        counters, window, threshold = self._limits[rule]
+        start = int(timestamp) // window * window
+
+        state = counters.get(key)
+        if state is None:
+            state = counters[key] = _WindowCount(start)
+            if len(counters) > self.max_keys:
+                counters.popitem(last=False)
+                self.evictions += 1
+        else:
+            counters.move_to_end(key)
+
+            # Slightly out-of-order requests count toward the current window
+            if start > state.start:
+                state.previous = state.current if start - state.start == window else 0
+                state.current = 0
+                state.start = start
+
+        state.current += 1
+        count = state.current
+
+        if state.previous:
+            overlap = 1.0 - (timestamp - state.start) / window
+            if overlap > 0:
+                count += int(state.previous * overlap)
+
+        if count > threshold and timestamp >= state.alerted_until:
+            state.alerted_until = timestamp + window
+            self.alerts[rule] += 1
+            return count
+
+        return None
+
+    def get_stats(self) -> Dict:
+        """Get tracker statistics"""
+        return {
+            'tracked_keys': {rule: len(counters) for rule, counters in self.counters.items()},
+            'evictions': self.evictions,
+            'alerts': dict(self.alerts)
+        }
+
+
 class SecurityScanner:
     """
     Scans HTTP requests for security threats
@@ -67,15 +222,118 @@ class SecurityScanner:
         (r"(\bbase64_decode\b)", "Suspicious - base64_decode", 0.6),
     ]
 
-    def __init__(self):
+    # Lowercase literals a pattern cannot match without (any one suffices;
+    # a tuple of literals counts only when all of them occur). A pattern only
+    # runs when one of its literals occurs in the request, so benign requests
+    # are mostly rejected by substring checks alone. Patterns missing here
+    # always run.
+    PREFILTER_LITERALS = {
+        r"(\bUNION\b.*\bSELECT\b)": ("union",),
+        r"(\bDROP\b.*\bTABLE\b)": ("drop",),
+        r"(\bDELETE\b.*\bFROM\b)": ("delete",),
+        r"('.*OR.*'1'='1)": ("'1'='1",),
+        r"(;.*\b(SELECT|INSERT|UPDATE|DELETE)\b)": (";",),
+        r"(\bEXEC\b.*\bxp_)": ("exec",),
+        r"(<script[^>]*>)": ("<script",),
+        r"(javascript:)": ("javascript:",),
+        r"(on\w+\s*=)": (("on", "="),),  # "on" alone is in most paths
+        r"(<iframe[^>]*>)": ("<iframe",),
+        r"(<object[^>]*>)": ("<object",),
+        r"\.\./": ("../",),
+        r"\.\.\\": ("..\\",),
+        r"(/etc/passwd)": ("/etc/passwd",),
+        r"(/windows/system)": ("/windows/system",),
+        r"[;&|`]": (";", "&", "|", "`"),
+        r"\$\(.*\)": ("$(",),
+        r"(wget|curl).*http": ("wget", "curl"),
+        r"(<\?php)": ("<?php",),
+        r"(eval\s*\()": ("eval",),
+        r"(\bbase64_decode\b)": ("base64_decode",),
+    }
+
+    # Approximate per-entry overhead of the verdict cache (key tuple, list,
+    # OrderedDict links) and per cached threat, in bytes
+    CACHE_ENTRY_OVERHEAD = 256
+    CACHE_THREAT_OVERHEAD = 120
+
+    # Longer requests are almost always one-off payloads; don't cache them
+    MAX_CACHED_REQUEST_LENGTH = 2048
+
+    def __init__(
+        self,
+        prefilter: bool = True,
+        cache_size: int = 50000,
+        cache_max_bytes: int = 32 * 1024 * 1024,
+        rate_limits: bool = False,
+        rate_max_keys: int = 100000
+    ):
+        """
+        Initialize scanner
+
+        Args:
+            prefilter: Skip patterns whose literals do not occur in the request
+                       (disable to run every pattern, e.g. for benchmarking)
+            cache_size: Max distinct requests kept in the verdict LRU (0 disables it)
+            cache_max_bytes: Approximate memory budget of the verdict LRU
+            rate_limits: Track per-IP request rates (see check_request_rate)
+            rate_max_keys: Max IPs tracked per rate rule
+        """
+        self.prefilter = prefilter
+        self.rate_tracker = RateTracker(max_keys=rate_max_keys) if rate_limits else None
+
+        # Real traffic repeats a small set of path/query pairs, so cache scan
+        # verdicts keyed by the normalized (method, path, query) tuple.
+        # Entries are evicted least-recently-used first when either the entry
+        # or the byte limit is exceeded.
+        self.cache_size = cache_size
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self.cache_bytes = 0
+        self._cache = OrderedDict()
+
+        # literal -> compiled patterns it gates, filled in by _compile
+        triggers = {}
+
         # Compile all patterns
-        self.sql_patterns = [(re.compile(p, re.I), desc, conf) for p, desc, conf in self.SQL_INJECTION_PATTERNS]
-        self.xss_patterns = [(re.compile(p, re.I), desc, conf) for p, desc, conf in self.XSS_PATTERNS]
-        self.path_patterns = [(re.compile(p, re.I), desc, conf) for p, desc, conf in self.PATH_TRAVERSAL_PATTERNS]
-        self.cmd_patterns = [(re.compile(p, re.I), desc, conf) for p, desc, conf in self.COMMAND_INJECTION_PATTERNS]
-        self.other_patterns = [(re.compile(p, re.I), desc, conf) for p, desc, conf in self.OTHER_PATTERNS]
+        self.sql_patterns = self._compile(self.SQL_INJECTION_PATTERNS, triggers)
+        self.xss_patterns = self._compile(self.XSS_PATTERNS, triggers)
+        self.path_patterns = self._compile(self.PATH_TRAVERSAL_PATTERNS, triggers)
+        self.cmd_patterns = self._compile(self.COMMAND_INJECTION_PATTERNS, triggers)
+        self.other_patterns = self._compile(self.OTHER_PATTERNS, triggers)
+
+        self.triggers = [(literal, patterns) for literal, patterns in triggers.items() if isinstance(literal, str)]
+        self.compound_triggers = [(group, patterns) for group, patterns in triggers.items() if not isinstance(group, str)]
+        pattern_lists = (self.sql_patterns, self.xss_patterns, self.path_patterns,
+                         self.cmd_patterns, self.other_patterns)
+        self.num_patterns = sum(len(patterns) for patterns in pattern_lists)
+        self.has_ungated_patterns = any(
+            not literals
+            for patterns in pattern_lists
+            for _, _, _, literals in patterns
+        )
 
         self.threats_detected = 0
+        self.requests_scanned = 0
+        self.patterns_evaluated = 0
+        self.patterns_skipped = 0
+        self.requests_prefiltered = 0
+
+    def _compile(self, patterns: List[tuple], triggers: Dict) -> List[tuple]:
+        """Compile (pattern, description, confidence) tuples and register their prefilter literals"""
+        compiled = []
+
+        for p, desc, conf in patterns:
+            pattern = re.compile(p, re.I)
+            literals = self.PREFILTER_LITERALS.get(p)
+
+            for literal in literals or ():
+                triggers.setdefault(literal, []).append(pattern)
+
+            compiled.append((pattern, desc, conf, literals))
+
+        return compiled
 
     def scan(self, path: str, query_string: str, method: str = "GET") -> List[SecurityThreat]:
         """
@@ -89,14 +347,96 @@ class SecurityScanner:
         Returns:
             List of SecurityThreat objects
         """
+        if self.cache_size <= 0:
+            threats = self._scan_request(path, query_string)
+            self.threats_detected += len(threats)
+            return threats
+
+        key = self._cache_key(path, query_string, method)
+        cached = self._cache.get(key)
+
+        if cached is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+        else:
+            self.cache_misses += 1
+            cached = self._scan_request(path, query_string)
+
+            if len(path) + len(query_string) <= self.MAX_CACHED_REQUEST_LENGTH:
+                self._cache_put(key, cached)
+
+        self.threats_detected += len(cached)
+
+        return list(cached)
+
+    @staticmethod
+    def _cache_key(path: str, query_string: str, method: str) -> tuple:
+        """
+        Normalize a request into a verdict cache key
+
+        Every pattern is case-insensitive, so ASCII requests differing only in
+        case share a verdict. Non-ASCII text is kept as-is because Unicode
+        lowercasing can change length and word boundaries.
+        """
+        if path.isascii() and query_string.isascii():
+            return (method.upper(), path.lower(), query_string.lower())
+
+        return (method.upper(), path, query_string)
+
+    def _cache_put(self, key: tuple, threats: List[SecurityThreat]):
+        """Insert a verdict and evict least-recently-used entries past the limits"""
+        self._cache[key] = threats
+        self.cache_bytes += self._entry_bytes(key, threats)
+
+        while len(self._cache) > self.cache_size or (
+            self.cache_bytes > self.cache_max_bytes and len(self._cache) > 1
+        ):
+            old_key, old_threats = self._cache.popitem(last=False)
+            self.cache_bytes -= self._entry_bytes(old_key, old_threats)
+            self.cache_evictions += 1
+
+    def _entry_bytes(self, key: tuple, threats: List[SecurityThreat]) -> int:
+        """Approximate memory held by one cache entry"""
+        return (
+            self.CACHE_ENTRY_OVERHEAD
+            + len(key[1]) + len(key[2])
+            + self.CACHE_THREAT_OVERHEAD * len(threats)
+        )
+
+    def _scan_request(self, path: str, query_string: str) -> List[SecurityThreat]:
+        """Run the pattern scan for one request (uncached, does not count threats)"""
         threats = []
+        self.requests_scanned += 1
 
         # Combine path and query string for scanning
         full_request = f"{path}?{query_string}"
 
+        # Single pass over the lowercased request collects the patterns worth
+        # confirming. Path and query are substrings of it, so a literal absent
+        # here is absent from them too. Non-ASCII text can match
+        # case-insensitively without containing the lowercase literal, so it
+        # runs every pattern.
+        candidates = None
+        if self.prefilter and full_request.isascii():
+            lowered = full_request.lower()
+            candidates = {
+                pattern
+                for literal, patterns in self.triggers if literal in lowered
+                for pattern in patterns
+            }
+            for group, patterns in self.compound_triggers:
+                if all(literal in lowered for literal in group):
+                    candidates.update(patterns)
+
+            if not candidates and not self.has_ungated_patterns:
+                self.requests_prefiltered += 1
+                self.patterns_skipped += self.num_patterns
+                return threats
+
         # Scan for SQL injection
         threats.extend(self._scan_patterns(
             full_request,
+            candidates,
             self.sql_patterns,
             "sql_injection"
         ))
@@ -104,6 +444,7 @@ class SecurityScanner:
         # Scan for XSS
         threats.extend(self._scan_patterns(
             full_request,
+            candidates,
             self.xss_patterns,
             "xss"
         ))
@@ -111,6 +452,7 @@ class SecurityScanner:
         # Scan for path traversal
         threats.extend(self._scan_patterns(
             path,
+            candidates,
             self.path_patterns,
             "path_traversal"
         ))
@@ -118,6 +460,7 @@ class SecurityScanner:
         # Scan for command injection
         threats.extend(self._scan_patterns(
             query_string,
+            candidates,
             self.cmd_patterns,
             "command_injection"
         ))
@@ -125,24 +468,38 @@ class SecurityScanner:
         # Scan for other threats
         threats.extend(self._scan_patterns(
             full_request,
+            candidates,
             self.other_patterns,
             "code_injection"
         ))
 
-        self.threats_detected += len(threats)
-
         return threats
 
     def _scan_patterns(
         self,
         text: str,
+        candidates: Optional[set],
         patterns: List[tuple],
         threat_type: str
     ) -> List[SecurityThreat]:
-        """Scan text against pattern list"""
+        """
+        Scan text against pattern list
+
+        Args:
+            text: Text to scan
+            candidates: Patterns that passed the prefilter (None runs every pattern)
+            patterns: Compiled (pattern, description, confidence, literals) tuples
+            threat_type: Threat type reported for matches
+        """
         threats = []
 
-        for pattern, description, confidence in patterns:
+        for pattern, description, confidence, literals in patterns:
+            if candidates is not None and literals and pattern not in candidates:
+                self.patterns_skipped += 1
+                continue
+
+            self.patterns_evaluated += 1
+
             if pattern.search(text):
                 # Determine severity based on confidence
                 if confidence >= 0.9:
@@ -171,7 +528,9 @@ class SecurityScanner:
         ip_address: str,
         request_count: int,
         time_window_seconds: int,
-        threshold: int
+        threshold: int,
+        threat_type: str = "rate_limit_exceeded",
+        counted: str = "requests"
     ) -> Optional[SecurityThreat]:
         """
         Check if IP is exceeding rate limits
@@ -181,6 +540,8 @@ class SecurityScanner:
             request_count: Number of requests in time window
             time_window_seconds: Time window in seconds
             threshold: Max requests allowed
+            threat_type: Threat type reported
+            counted: What request_count counts, for the description
 
         Returns:
             SecurityThreat if rate limit exceeded, None otherwise
@@ -197,15 +558,53 @@ class SecurityScanner:
                 severity = "medium"
 
             return SecurityThreat(
-                threat_type="rate_limit_exceeded",
+                threat_type=threat_type,
                 severity=severity,
-                pattern_matched=f"{request_count} requests in {time_window_seconds}s",
+                pattern_matched=f"{request_count} {counted} in {time_window_seconds}s",
                 confidence=1.0,
-                description=f"IP {ip_address} made {request_count} requests (limit: {threshold})"
+                description=f"IP {ip_address} made {request_count} {counted} (limit: {threshold})"
             )
 
         return None
 
+    def check_request_rate(
+        self,
+        ip_address: str,
+        path: str,
+        method: str,
+        status_code: int,
+        timestamp: float
+    ) -> List[SecurityThreat]:
+        """
+        Count a request in the per-IP rate windows and report limits it crosses
+
+        Args:
+            ip_address: Client IP
+            path: Request path
+            method: HTTP method
+            status_code: Response status
+            timestamp: Request time in epoch seconds
+
+        Returns:
+            List of SecurityThreat objects (empty unless rate_limits is enabled)
+        """
+        if self.rate_tracker is None:
+            return []
+
+        threats = []
+
+        for rule, count in self.rate_tracker.record(ip_address, path, method, status_code, timestamp):
+            threat_type, counted, window, threshold = self.rate_tracker.rules[rule]
+            threats.append(self.check_rate_limit(
+                ip_address, count, window, threshold,
+                threat_type=threat_type,
+                counted=counted
+            ))
+
+        self.threats_detected += len(threats)
+
+        return threats
+
     def check_suspicious_ip(self, ip_address: str, known_bad_ips: set) -> Optional[SecurityThreat]:
         """Check if IP is in known bad IP list"""
         if ip_address in known_bad_ips:
@@ -221,8 +620,23 @@ class SecurityScanner:
 
     def get_stats(self) -> Dict:
         """Get scanner statistics"""
+        lookups = self.cache_hits + self.cache_misses
+        pattern_checks = self.patterns_evaluated + self.patterns_skipped
+
         return {
-            'threats_detected': self.threats_detected
+            'threats_detected': self.threats_detected,
+            'requests_scanned': self.requests_scanned,
+            'patterns_evaluated': self.patterns_evaluated,
+            'requests_prefiltered': self.requests_prefiltered,
+            'patterns_skipped': self.patterns_skipped,
+            'prefilter_hit_rate': self.patterns_skipped / pattern_checks if pattern_checks > 0 else 0.0,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_hit_rate': self.cache_hits / lookups if lookups > 0 else 0.0,
+            'cache_entries': len(self._cache),
+            'cache_bytes': self.cache_bytes,
+            'cache_evictions': self.cache_evictions,
+            'rate_limits': self.rate_tracker.get_stats() if self.rate_tracker else None
         }
 
 
@@ -277,3 +691,13 @@ if __name__ == "__main__":
         print()
 
     print(f"\nTotal threats detected: {scanner.get_stats()['threats_detected']}")
+
+    # Rate tracking: a login brute force, one request every 2 seconds
+    print("\nRate Limit Tests:\n")
+
+    rate_scanner = SecurityScanner(rate_limits=True)
+    for second in range(0, 120, 2):
+        for threat in rate_scanner.check_request_rate("203.0.113.7", "/wp-login.php", "POST", 200, 1700000000 + second):
+            print(f"  ⚠ {threat.description} ({threat.severity}, {threat.pattern_matched})")
+
+    print(f"\n  Rate tracker: {rate_scanner.get_stats()['rate_limits']}")
@@ -3,11 +3,17 @@ Sessionizer - Groups HTTP requests into user sessions
 Analyzes user journeys, calculates session metrics, identifies patterns
 """
 
+import hashlib
 import logging
-from typing import Dict, List, Optional, Set
-from dataclasses import dataclass
-from datetime import datetime, timedelta
-from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from analyzers.path_miner import PathMiner
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +42,36 @@ class SessionMetrics:
     user_agent: str
     is_bot: bool
 
+    # Pages in visit order, revisits included (A -> B -> A -> C), capped at
+    # Sessionizer.MAX_PAGES_VISITED
+    pages_visited: List[str] = field(default_factory=list)
+
+
+class _OpenSession:
+    """Running aggregates of a session that has not timed out yet"""
+
+    __slots__ = (
+        'key', 'start_time', 'last_time', 'page_views', 'pages', 'path', 'total_bytes',
+        'total_response_time', 'entry_page', 'exit_page', 'converted',
+        'ip_address', 'user_agent', 'is_bot'
+    )
+
+    def __init__(self, key, timestamp, path, ip_address, user_agent, is_bot):
+        self.key = key
+        self.start_time = timestamp
+        self.last_time = timestamp
+        self.page_views = 0
+        self.pages = set()  # Distinct pages, for unique_pages
+        self.path = []  # Visit sequence, capped (see Sessionizer.MAX_PAGES_VISITED)
+        self.total_bytes = 0
+        self.total_response_time = 0
+        self.entry_page = path
+        self.exit_page = path
+        self.converted = False
+        self.ip_address = ip_address
+        self.user_agent = user_agent
+        self.is_bot = is_bot
+
 
 @dataclass
 class RequestEvent:
@@ -56,6 +92,10 @@ class Sessionizer:
     # Default session timeout (30 minutes)
     DEFAULT_SESSION_TIMEOUT = timedelta(minutes=30)
 
+    # Longest visit sequence kept per session (pages_visited); bounds memory
+    # per open session and row size in fact_sessions
+    MAX_PAGES_VISITED = 100
+
     # Conversion goal paths (customize based on your application)
     CONVERSION_PATHS = [
         '/checkout/complete',
@@ -74,6 +114,13 @@ class Sessionizer:
         self.session_timeout = session_timeout or self.DEFAULT_SESSION_TIMEOUT
         self.sessions_created = 0
 
+        # Streaming state: open sessions ordered by last activity, so the ones
+        # to expire are always at the front. Memory scales with concurrently
+        # active visitors, not with requests.
+        self._open = OrderedDict()
+        self._watermark = None
+        self.peak_open_sessions = 0
+
     def sessionize(
         self,
         requests: List[Dict],
@@ -82,6 +129,9 @@ class Sessionizer:
         """
         Group requests into sessions and calculate metrics
 
+        A key (session ID, IP, ...) starts a new session whenever it has been
+        idle for longer than session_timeout.
+
         Args:
             requests: List of request dicts with keys:
                      session_id, timestamp, path, query_string, status_code,
@@ -91,131 +141,415 @@ class Sessionizer:
         Returns:
             List of SessionMetrics objects
         """
-        # Group requests by session identifier
-        grouped = self._group_requests(requests, group_by)
-
-        sessions = []
-
-        for session_key, session_requests in grouped.items():
-            # Skip empty sessions
-            if not session_requests:
-                continue
-
-            # Sort by timestamp
-            session_requests.sort(key=lambda r: r['timestamp'])
+        streaming = type(self)(self.session_timeout)
 
-            # Calculate session metrics
-            metrics = self._calculate_session_metrics(
-                session_key,
-                session_requests
-            )
+        sessions = streaming.add_requests(
+            sorted(requests, key=lambda r: r['timestamp']),
+            group_by=group_by
+        )
+        sessions.extend(streaming.flush())
 
-            if metrics:
-                sessions.append(metrics)
-                self.sessions_created += 1
+        self.sessions_created += len(sessions)
 
         logger.info(f"Created {len(sessions)} sessions from {len(requests)} requests")
 
         return sessions
 
-    def _group_requests(
+    def add_requests(
         self,
-        requests: List[Dict],
-        group_by: str
-    ) -> Dict[str, List[Dict]]:
-        """Group requests by session identifier"""
-        grouped = defaultdict(list)
+        requests: Iterable[Dict],
+        group_by: str = "session_id"
+    ) -> List[SessionMetrics]:
+        """
+        Feed a time-ordered batch of request dicts into the streaming sessionizer
+
+        Args:
+            requests: Request dicts (see sessionize), oldest first
+            group_by: Field to group by (session_id, ip_address, or ip_user_agent)
+
+        Returns:
+            Sessions that finished (timed out) as of this batch
+        """
+        closed = []
 
         for request in requests:
-            # Get session key
-            if group_by == "session_id":
-                key = request.get('session_id', '')
-            elif group_by == "ip_address":
-                key = request.get('ip_address', '')
-            elif group_by == "ip_user_agent":
-                # Combination of IP and user agent
-                ip = request.get('ip_address', '')
-                ua = request.get('user_agent', '')
-                key = f"{ip}:{ua}"
-            else:
-                key = request.get('session_id', '')
+            key = self._session_key(request, group_by)
 
             # Skip if no key
             if not key:
                 continue
 
-            grouped[key].append(request)
+            self._add(
+                closed,
+                key,
+                request['timestamp'],
+                request['path'],
+                request.get('response_bytes', 0),
+                request.get('response_time_ms', 0),
+                request.get('ip_address', ''),
+                request.get('user_agent', ''),
+                request.get('is_bot', 0) == 1
+            )
 
-        return grouped
+        closed.extend(self._expire())
+        return closed
 
-    def _calculate_session_metrics(
-        self,
-        session_id: str,
-        requests: List[Dict]
-    ) -> Optional[SessionMetrics]:
-        """Calculate metrics for a session"""
+    def add_entries(self, entries: Iterable) -> List[SessionMetrics]:
+        """
+        Feed a time-ordered batch of ParsedLogEntry objects, keyed by session_id
 
-        if not requests:
-            return None
+        Args:
+            entries: Parsed log entries, oldest first
 
-        # Extract timestamps
-        timestamps = [r['timestamp'] for r in requests]
-        start_time = min(timestamps)
-        end_time = max(timestamps)
+        Returns:
+            Sessions that finished (timed out) as of this batch
+        """
+        closed = []
 
-        # Calculate duration
-        duration_seconds = int((end_time - start_time).total_seconds())
+        for entry in entries:
+            if not entry.session_id:
+                continue
 
-        # Page views
-        page_views = len(requests)
+            self._add(
+                closed,
+                entry.session_id,
+                entry.timestamp,
+                entry.path,
+                entry.response_bytes,
+                entry.response_time_ms or 0,
+                entry.ip_address,
+                entry.user_agent,
+                entry.is_bot
+            )
 
-        # Unique pages (distinct paths)
-        unique_paths = set(r['path'] for r in requests)
-        unique_pages = len(unique_paths)
+        closed.extend(self._expire())
+        return closed
 
-        # Total bytes transferred
-        total_bytes = sum(r.get('response_bytes', 0) for r in requests)
+    def expire(self, now: datetime) -> List[SessionMetrics]:
+        """
+        Close sessions idle for longer than session_timeout as of `now`
 
-        # Average response time
-        response_times = [r.get('response_time_ms', 0) for r in requests]
-        avg_response_time_ms = sum(response_times) / len(response_times) if response_times else 0
+        Used when the log goes quiet, so sessions don't wait for the next request.
+        """
+        if self._watermark is not None:
+            now = self._align(now)
+            if now > self._watermark:
+                self._watermark = now
+
+        return self._expire()
+
+    def flush(self) -> List[SessionMetrics]:
+        """Close and return every open session (end of input)"""
+        closed = [self._finish(session) for session in self._open.values()]
+        self._open.clear()
+        return closed
+
+    @property
+    def open_sessions(self) -> int:
+        """Number of sessions currently open"""
+        return len(self._open)
+
+    def _session_key(self, request: Dict, group_by: str) -> str:
+        """Get the grouping key of a request"""
+        if group_by == "session_id":
+            return request.get('session_id', '')
+        elif group_by == "ip_address":
+            return request.get('ip_address', '')
+        elif group_by == "ip_user_agent":
+            # Combination of IP and user agent
+            ip = request.get('ip_address', '')
+            ua = request.get('user_agent', '')
+            return f"{ip}:{ua}"
+
+        return request.get('session_id', '')
+
+    def _align(self, timestamp: datetime) -> datetime:
+        """Make a timestamp comparable with the watermark (naive means UTC)"""
+        if (timestamp.tzinfo is None) == (self._watermark.tzinfo is None):
+            return timestamp
+
+        if timestamp.tzinfo is None:
+            return timestamp.replace(tzinfo=timezone.utc)
+
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def _add(
+        self,
+        closed: List[SessionMetrics],
+        key: str,
+        timestamp: datetime,
+        path: str,
+        response_bytes: int,
+        response_time_ms: int,
+        ip_address: str,
+        user_agent: str,
+        is_bot: bool
+    ):
+        """Add one request to its open session, splitting on timeout"""
+        if self._watermark is None:
+            self._watermark = timestamp
+        else:
+            timestamp = self._align(timestamp)
+            if timestamp > self._watermark:
+                self._watermark = timestamp
+
+        session = self._open.get(key)
+
+        if session is not None and timestamp - session.last_time > self.session_timeout:
+            closed.append(self._finish(session))
+            del self._open[key]
+            session = None
+
+        if session is None:
+            session = _OpenSession(key, timestamp, path, ip_address, user_agent, is_bot)
+            self._open[key] = session
+            if len(self._open) > self.peak_open_sessions:
+                self.peak_open_sessions = len(self._open)
+        else:
+            self._open.move_to_end(key)
+
+        session.page_views += 1
+        session.pages.add(path)
+        if len(session.path) < self.MAX_PAGES_VISITED:
+            session.path.append(path)
+        session.total_bytes += response_bytes or 0
+        session.total_response_time += response_time_ms or 0
+
+        if path in self.CONVERSION_PATHS:
+            session.converted = True
+
+        if timestamp >= session.last_time:
+            session.last_time = timestamp
+            session.exit_page = path
+        elif timestamp < session.start_time:
+            # Slightly out-of-order input: the earliest request defines the entry
+            session.start_time = timestamp
+            session.entry_page = path
+            session.ip_address = ip_address
+            session.user_agent = user_agent
+            session.is_bot = is_bot
+
+    def _expire(self) -> List[SessionMetrics]:
+        """Close sessions idle for longer than session_timeout before the watermark"""
+        closed = []
+
+        while self._open:
+            session = next(iter(self._open.values()))
+            if self._watermark - session.last_time <= self.session_timeout:
+                break
+
+            self._open.popitem(last=False)
+            closed.append(self._finish(session))
 
-        # Entry and exit pages
-        entry_page = requests[0]['path']
-        exit_page = requests[-1]['path']
+        return closed
 
-        # Bounce (single page view)
-        is_bounce = (page_views == 1)
+    def _finish(self, session: _OpenSession) -> SessionMetrics:
+        """Turn closed-session aggregates into SessionMetrics"""
+        self.sessions_created += 1
 
-        # Conversion (reached goal page)
-        converted = any(
-            r['path'] in self.CONVERSION_PATHS
-            for r in requests
+        return SessionMetrics(
+            session_id=self._session_id(session.key, session.start_time),
+            start_time=session.start_time,
+            end_time=session.last_time,
+            duration_seconds=int((session.last_time - session.start_time).total_seconds()),
+            page_views=session.page_views,
+            unique_pages=len(session.pages),
+            total_bytes=session.total_bytes,
+            avg_response_time_ms=session.total_response_time / session.page_views,
+            entry_page=session.entry_page,
+            exit_page=session.exit_page,
+            is_bounce=(session.page_views == 1),
+            converted=session.converted,
+            ip_address=session.ip_address,
+            user_agent=session.user_agent,
+            is_bot=bool(session.is_bot),
+            pages_visited=session.path
         )
 
-        # User info (from first request)
-        ip_address = requests[0].get('ip_address', '')
-        user_agent = requests[0].get('user_agent', '')
-        is_bot = requests[0].get('is_bot', 0) == 1
+    @staticmethod
+    def _session_id(key: str, start_time: datetime) -> str:
+        """One key can produce many sessions; derive a stable 16-char ID per session"""
+        return hashlib.md5(f"{key}:{start_time.isoformat()}".encode('utf-8')).hexdigest()[:16]
 
-        return SessionMetrics(
-            session_id=session_id,
-            start_time=start_time,
-            end_time=end_time,
-            duration_seconds=duration_seconds,
-            page_views=page_views,
-            unique_pages=unique_pages,
-            total_bytes=total_bytes,
-            avg_response_time_ms=avg_response_time_ms,
-            entry_page=entry_page,
-            exit_page=exit_page,
-            is_bounce=is_bounce,
-            converted=converted,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            is_bot=is_bot
+    def sessionize_columns(
+        self,
+        columns,
+        group_by: str = "session_id",
+        presorted: bool = False
+    ) -> List[SessionMetrics]:
+        """
+        Vectorized sessionize() over column arrays
+
+        Session boundaries come from a single diff of the (key, timestamp)
+        ordered timestamps against the timeout, and every metric from a
+        group-wise reduction, so the only per-session Python work is building
+        the SessionMetrics objects. Returns the same sessions as sessionize()
+        for the same requests, ordered by key and then start time.
+
+        Args:
+            columns: Mapping of column name to array (dict, pandas DataFrame or
+                     ClickHouseClient.get_session_request_columns() result) using
+                     the request dict keys of sessionize(); timestamp and path
+                     are required
+            group_by: Field to group by (session_id, ip_address, or ip_user_agent)
+            presorted: Rows are already ordered by (key, timestamp), e.g. by the
+                       query's ORDER BY, so the sort can be skipped
+
+        Returns:
+            List of SessionMetrics objects
+        """
+        timestamps = np.asarray(columns['timestamp'])
+        if len(timestamps) == 0:
+            return []
+
+        # Microsecond ticks (datetime resolution); naive timestamps are UTC
+        if np.issubdtype(timestamps.dtype, np.datetime64):
+            timestamps = timestamps.astype('datetime64[us]')
+            ticks = timestamps.view(np.int64)
+        else:
+            ticks = pd.to_datetime(timestamps, utc=True).as_unit('us').asi8
+
+        key_codes, key_values = pd.factorize(self._key_column(columns, group_by))
+
+        # Requests without a key are skipped, as in sessionize()
+        rows = key_codes >= 0
+        empty = [code for code, key in enumerate(key_values) if not key]
+        if empty:
+            rows &= ~np.isin(key_codes, empty)
+        rows = np.flatnonzero(rows)
+
+        if len(rows) == 0:
+            return []
+
+        if not presorted:
+            rows = rows[self._sort_order(key_codes[rows], ticks[rows], len(key_values))]
+
+        sorted_keys = key_codes[rows]
+        sorted_ticks = ticks[rows]
+
+        # A session starts at every key change and every gap over the timeout
+        boundary = np.empty(len(rows), dtype=bool)
+        boundary[0] = True
+        boundary[1:] = (
+            (sorted_keys[1:] != sorted_keys[:-1])
+            | (np.diff(sorted_ticks) > self.session_timeout // timedelta(microseconds=1))
         )
 
+        starts = np.flatnonzero(boundary)
+        ends = np.append(starts[1:], len(rows)) - 1
+        first = rows[starts]
+        last = rows[ends]
+        page_views = ends - starts + 1
+
+        total_bytes = np.add.reduceat(self._int_column(columns, 'response_bytes')[rows], starts)
+        total_response_time = np.add.reduceat(self._int_column(columns, 'response_time_ms')[rows], starts)
+        durations = ((ticks[last] - ticks[first]) / 1e6).astype(np.int64)
+
+        path_codes, path_values = pd.factorize(np.asarray(columns['path'], dtype=object))
+        sorted_paths = path_codes[rows]
+
+        goals = [code for code, path in enumerate(path_values) if path in self.CONVERSION_PATHS]
+        converted = np.logical_or.reduceat(np.isin(sorted_paths, goals), starts)
+
+        # Distinct (session, path) pairs
+        session_index = np.repeat(np.arange(len(starts)), page_views)
+        visits = session_index * len(path_values) + sorted_paths
+        first_visits = np.flatnonzero(~pd.Series(visits).duplicated().to_numpy())
+        unique_pages = np.bincount(session_index[first_visits], minlength=len(starts))
+
+        # Visit sequences: the first MAX_PAGES_VISITED requests of each session
+        positions = np.arange(len(rows)) - np.repeat(starts, page_views)
+        path_lengths = np.minimum(page_views, self.MAX_PAGES_VISITED).tolist()
+        pages = path_values[sorted_paths[positions < self.MAX_PAGES_VISITED]].tolist()
+
+        keys = key_values[sorted_keys[starts]].tolist()
+        start_times = timestamps[first].tolist()
+        end_times = timestamps[last].tolist()
+        entry_pages = path_values[path_codes[first]].tolist()
+        exit_pages = path_values[path_codes[last]].tolist()
+        ip_addresses = self._take(columns, 'ip_address', first)
+        user_agents = self._take(columns, 'user_agent', first)
+        is_bot = (self._int_column(columns, 'is_bot')[first] == 1).tolist()
+
+        page_views = page_views.tolist()
+        unique_pages = unique_pages.tolist()
+        total_bytes = total_bytes.tolist()
+        avg_response_times = (total_response_time / page_views).tolist()
+        durations = durations.tolist()
+        converted = converted.tolist()
+
+        sessions = []
+        offset = 0
+
+        for i, key in enumerate(keys):
+            sessions.append(SessionMetrics(
+                session_id=self._session_id(key, start_times[i]),
+                start_time=start_times[i],
+                end_time=end_times[i],
+                duration_seconds=durations[i],
+                page_views=page_views[i],
+                unique_pages=unique_pages[i],
+                total_bytes=total_bytes[i],
+                avg_response_time_ms=avg_response_times[i],
+                entry_page=entry_pages[i],
+                exit_page=exit_pages[i],
+                is_bounce=(page_views[i] == 1),
+                converted=converted[i],
+                ip_address=ip_addresses[i],
+                user_agent=user_agents[i],
+                is_bot=is_bot[i],
+                pages_visited=pages[offset:offset + path_lengths[i]]
+            ))
+            offset += path_lengths[i]
+
+        self.sessions_created += len(sessions)
+
+        logger.info(f"Created {len(sessions)} sessions from {len(rows)} requests (vectorized)")
+
+        return sessions
+
+    @staticmethod
+    def _key_column(columns, group_by: str):
+        """Get the grouping key column (see _session_key)"""
+        if group_by == "ip_address":
+            return np.asarray(columns['ip_address'], dtype=object)
+        elif group_by == "ip_user_agent":
+            return np.array(
+                [f"{ip}:{ua}" for ip, ua in zip(columns['ip_address'], columns['user_agent'])],
+                dtype=object
+            )
+
+        return np.asarray(columns['session_id'], dtype=object)
+
+    @staticmethod
+    def _sort_order(key_codes: np.ndarray, ticks: np.ndarray, num_keys: int) -> np.ndarray:
+        """Stable (key, timestamp) sort order, as one int64 sort when the pair fits"""
+        low = int(ticks.min())
+        span = int(ticks.max()) - low + 1
+
+        if num_keys * span < 2 ** 63:
+            return np.argsort(key_codes * span + (ticks - low), kind='stable')
+
+        return np.lexsort((ticks, key_codes))
+
+    @staticmethod
+    def _int_column(columns, name: str) -> np.ndarray:
+        """Get a numeric column as int64, with missing values (or column) as 0"""
+        values = columns.get(name)
+        if values is None:
+            return np.zeros(len(columns['timestamp']), dtype=np.int64)
+
+        return pd.Series(values).fillna(0).to_numpy(dtype=np.int64)
+
+    @staticmethod
+    def _take(columns, name: str, indices: np.ndarray) -> list:
+        """Pick rows of a string column, with '' for a missing column"""
+        values = columns.get(name)
+        if values is None:
+            return [''] * len(indices)
+
+        return np.asarray(values, dtype=object)[indices].tolist()
+
     def analyze_user_journey(
         self,
         session_id: str,
@@ -323,43 +657,50 @@ class Sessionizer:
 
     def find_common_paths(
         self,
-        sessions: List[SessionMetrics],
-        min_frequency: int = 10
+        sessions: Iterable,
+        min_frequency: int = 10,
+        max_depth: int = 5,
+        top_n: int = 20,
+        steps: Optional[int] = None,
+        min_steps: int = 1
     ) -> List[Dict]:
         """
         Find most common user journey paths
 
+        Journeys are counted in a depth-bounded prefix tree (see PathMiner),
+        so sessions can be streamed in any number, e.g. straight from
+        ClickHouseClient.iter_session_paths().
+
         Args:
-            sessions: List of session metrics
+            sessions: SessionMetrics objects (pages_visited is the journey) or
+                      (pages, converted) pairs
             min_frequency: Minimum number of occurrences
+            max_depth: Pages per journey that are tracked
+            top_n: Number of paths to return
+            steps: Only return paths of exactly this many pages
+            min_steps: Shortest path returned
 
         Returns:
-            List of common paths with frequencies
+            List of common paths with frequency, conversion rate and per-step
+            funnel drop-off, most frequent first
         """
-        # This would require access to full request sequences
-        # For now, analyze entry → exit patterns
-
-        entry_exit_patterns = defaultdict(int)
+        miner = PathMiner(max_depth=max_depth, conversion_paths=self.CONVERSION_PATHS)
 
         for session in sessions:
-            pattern = f"{session.entry_page} → {session.exit_page}"
-            entry_exit_patterns[pattern] += 1
-
-        # Filter by minimum frequency
-        common_paths = [
-            {
-                'path': pattern,
-                'frequency': count,
-                'is_conversion': any(goal in pattern for goal in self.CONVERSION_PATHS)
-            }
-            for pattern, count in entry_exit_patterns.items()
-            if count >= min_frequency
-        ]
+            if isinstance(session, SessionMetrics):
+                miner.add(session.pages_visited, session.converted)
+            else:
+                pages, converted = session
+                miner.add(pages, bool(converted))
 
-        # Sort by frequency
-        common_paths.sort(key=lambda x: x['frequency'], reverse=True)
+        logger.info(f"Mined journeys of {miner.sessions:,} sessions ({miner.num_nodes:,} distinct paths)")
 
-        return common_paths
+        return miner.top_paths(
+            steps=steps,
+            top_n=top_n,
+            min_frequency=min_frequency,
+            min_steps=min_steps
+        )
 
     def calculate_engagement_score(self, session: SessionMetrics) -> float:
         """
@@ -392,6 +733,8 @@ class Sessionizer:
         """Get sessionizer statistics"""
         return {
             'sessions_created': self.sessions_created,
+            'open_sessions': len(self._open),
+            'peak_open_sessions': self.peak_open_sessions,
             'session_timeout_minutes': self.session_timeout.total_seconds() / 60
         }
 
@@ -0,0 +1,217 @@
+"""
+Anomaly Detector Benchmark - Per-point statistics vs vectorized rolling z-scores
+Times AnomalyDetector on synthetic per-minute endpoint series and checks it against the per-point method
+"""
+
+import math
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import click
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from analyzers.anomaly_detector import AnomalyDetector
+
+
+def generate_metrics(num_endpoints: int, num_minutes: int, seed: int) -> list:
+    """Per-minute request counts and latency per endpoint, with injected spikes and dips"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    metrics = []
+
+    for e in range(num_endpoints):
+        base = rng.integers(20, 2000)
+        counts = rng.poisson(base, num_minutes)
+        latency = rng.gamma(4.0, 30.0, num_minutes).round(1)
+
+        for minute in rng.choice(num_minutes, size=max(1, num_minutes // 200), replace=False):
+            counts[minute] = counts[minute] * rng.choice([0, 4, 8]) // 2
+            latency[minute] *= 10
+
+        for minute in range(num_minutes):
+            metrics.append({
+                'timestamp': start + timedelta(minutes=minute),
+                'endpoint': f"/api/endpoint/{e}",
+                'request_count': int(counts[minute]),
+                'avg_response_time_ms': float(latency[minute])
+            })
+
+    return metrics
+
+
+def generate_flat_metrics(num_endpoints: int, num_minutes: int, seed: int) -> list:
+    """Quiet endpoints: small counts and flat plateaus, where rolling sums leave rounding residue"""
+    rng = np.random.default_rng(seed + 1)
+    start = datetime(2024, 1, 1)
+    metrics = []
+
+    for e in range(num_endpoints):
+        if e % 2:
+            counts = rng.poisson(rng.uniform(0.2, 3.0), num_minutes)
+        else:
+            # Steady traffic that steps to a new level now and then
+            levels = rng.choice([100, 100, 100, 98, 177, 1000000], num_minutes // 10 + 1)
+            counts = np.repeat(levels, 10)[:num_minutes]
+
+        for minute in range(num_minutes):
+            metrics.append({
+                'timestamp': start + timedelta(minutes=minute),
+                'endpoint': f"/quiet/endpoint/{e}",
+                'request_count': int(counts[minute])
+            })
+
+    return metrics
+
+
+def reference_traffic(detector: AnomalyDetector, series: list, endpoint: str, window_size: int) -> list:
+    """Per-point mean/stdev over a fresh slice (the original algorithm), as comparable tuples"""
+    values = [point['request_count'] for point in series]
+    found = []
+
+    for i in range(window_size, len(values)):
+        baseline = values[i - window_size:i]
+        mean = statistics.mean(baseline)
+        std_dev = statistics.stdev(baseline)
+
+        if std_dev == 0:
+            continue
+
+        z_score = abs((values[i] - mean) / std_dev)
+        severity = detector._get_severity_from_zscore(z_score)
+
+        if severity:
+            kind = 'traffic_spike' if values[i] > mean else 'traffic_drop'
+            found.append((f"{endpoint} request_count", series[i]['timestamp'], kind, severity, mean, z_score))
+
+    return found
+
+
+def reference_latency(detector: AnomalyDetector, metrics: list) -> list:
+    """Per-endpoint sort and trimmed baseline (the original algorithm), as comparable tuples"""
+    by_endpoint = {}
+    for metric in metrics:
+        by_endpoint.setdefault(metric['endpoint'], []).append(metric)
+
+    found = []
+
+    for endpoint, rows in by_endpoint.items():
+        latencies = [row['avg_response_time_ms'] for row in rows]
+        baseline = sorted(latencies)[:int(len(latencies) * 0.95)]
+        mean = statistics.mean(baseline)
+        std_dev = statistics.stdev(baseline)
+
+        for row, latency in zip(rows, latencies):
+            z_score = abs((latency - mean) / std_dev)
+            severity = detector._get_severity_from_zscore(z_score)
+            if severity and latency > mean:
+                found.append((f"{endpoint} latency", row['timestamp'], 'latency_spike', severity, mean, z_score))
+
+    return found
+
+
+def as_tuples(anomalies: list) -> list:
+    return [
+        (a.metric_name, a.timestamp, a.anomaly_type, a.severity, a.expected_value, a.deviation_score)
+        for a in anomalies
+    ]
+
+
+def count_mismatches(expected: list, actual: list) -> int:
+    """Anomalies must match exactly apart from float rounding in mean and z-score"""
+    mismatches = abs(len(expected) - len(actual))
+
+    for a, b in zip(expected, actual):
+        same = a[:4] == b[:4] and all(math.isclose(x, y, rel_tol=1e-9) for x, y in zip(a[4:], b[4:]))
+        mismatches += not same
+
+    return mismatches
+
+
+@click.command()
+@click.option('--endpoints', 'num_endpoints', default=1000, help='Number of endpoint series')
+@click.option('--minutes', 'num_minutes', default=1440, help='Points per series')
+@click.option('--window', 'window_size', default=60, help='Baseline window (points)')
+@click.option('--verify', 'num_verify', default=20, help='Endpoints also scored with the per-point method')
+@click.option('--seed', default=42, help='Random seed for generated series')
+def main(num_endpoints, num_minutes, window_size, num_verify, seed):
+    """Compare per-point and vectorized anomaly scoring across many endpoints"""
+    metrics = generate_metrics(num_endpoints, num_minutes, seed)
+    num_verify = min(num_verify, num_endpoints)
+    sample = metrics[:num_verify * num_minutes]
+    detector = AnomalyDetector()
+
+    print(f"Benchmarking {num_endpoints:,} endpoints x {num_minutes:,} minutes, "
+          f"window {window_size}, verifying on {num_verify:,} endpoints\n")
+
+    # Per-point method on the sample only; it is O(points x window) in pure Python
+    start = time.perf_counter()
+    expected = []
+    for e in range(num_verify):
+        series = sample[e * num_minutes:(e + 1) * num_minutes]
+        expected.extend(reference_traffic(detector, series, series[0]['endpoint'], window_size))
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = detector.detect_endpoint_anomalies(sample, window_size=window_size)
+    sample_time = time.perf_counter() - start
+
+    mismatches = count_mismatches(expected, as_tuples(actual))
+
+    # Parity on quiet series too: constant windows and z-scores exactly on a threshold
+    flat = generate_flat_metrics(num_verify, num_minutes, seed)
+    expected_flat = []
+    for e in range(num_verify):
+        series = flat[e * num_minutes:(e + 1) * num_minutes]
+        expected_flat.extend(reference_traffic(detector, series, series[0]['endpoint'], window_size))
+    for small_window in (3, 7):
+        for e in range(num_verify):
+            series = flat[e * num_minutes:(e + 1) * num_minutes]
+            expected_flat.extend(reference_traffic(detector, series, series[0]['endpoint'], small_window))
+
+    actual_flat = detector.detect_endpoint_anomalies(flat, window_size=window_size)
+    for small_window in (3, 7):
+        actual_flat.extend(detector.detect_endpoint_anomalies(flat, window_size=small_window))
+
+    mismatches += count_mismatches(expected_flat, as_tuples(actual_flat))
+
+    start = time.perf_counter()
+    expected_latency = reference_latency(detector, metrics)
+    latency_reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual_latency = detector.detect_latency_anomalies(metrics)
+    latency_time = time.perf_counter() - start
+
+    mismatches += count_mismatches(expected_latency, as_tuples(actual_latency))
+
+    start = time.perf_counter()
+    found = detector.detect_endpoint_anomalies(metrics, window_size=window_size)
+    full_time = time.perf_counter() - start
+
+    sample_points = len(sample)
+    points = len(metrics)
+
+    print(f"  {'Method':<22} {'Points':>12} {'Seconds':>10} {'Points/sec':>14}")
+    print(f"  {'traffic per-point':<22} {sample_points:>12,} {reference_time:>10.3f} {sample_points / reference_time:>14,.0f}")
+    print(f"  {'traffic vectorized':<22} {sample_points:>12,} {sample_time:>10.3f} {sample_points / sample_time:>14,.0f}")
+    print(f"  {'traffic vectorized':<22} {points:>12,} {full_time:>10.3f} {points / full_time:>14,.0f}")
+    print(f"  {'latency per-endpoint':<22} {points:>12,} {latency_reference_time:>10.3f} {points / latency_reference_time:>14,.0f}")
+    print(f"  {'latency vectorized':<22} {points:>12,} {latency_time:>10.3f} {points / latency_time:>14,.0f}")
+    print(f"\n  Speedup (traffic):  {reference_time / sample_time:.1f}x")
+    print(f"  Speedup (latency):  {latency_reference_time / latency_time:.1f}x")
+    print(f"  Anomalies:          {len(found):,} traffic, {len(actual_latency):,} latency, "
+          f"{len(actual_flat):,} on quiet series")
+    print(f"  Mismatches:         {mismatches}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
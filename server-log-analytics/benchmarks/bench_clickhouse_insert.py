@@ -0,0 +1,139 @@
+"""
+ClickHouse Insert Benchmark - Row vs columnar inserts across batch sizes
+Measures fact_requests insert throughput against a running ClickHouse (docker-compose up -d)
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.clickhouse_client import ClickHouseClient, COMPRESSION_AVAILABLE
+from parsers.log_parser import LogParser
+from bench_parser import generate_lines
+
+BENCH_TABLE = 'fact_requests_bench'
+
+
+def build_rows(num_rows: int, seed: int) -> list:
+    """Parse generated sample lines into fact_requests row tuples"""
+    parser = LogParser(fast=True)
+    entries = (parser.parse(line, 'nginx') for line in generate_lines(num_rows, seed))
+    return [ClickHouseClient.entry_to_row(entry) for entry in entries if entry]
+
+
+def run_case(client: ClickHouseClient, rows: list, batch_size: int) -> float:
+    """Insert all rows in batches and return rows/sec"""
+    client.execute_query(f"TRUNCATE TABLE {BENCH_TABLE}")
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    start = time.perf_counter()
+
+    if client.insert_connections > 1:
+        futures = [client.insert_rows_async(batch, table=BENCH_TABLE) for batch in batches]
+        inserted = sum(future.result() for future in futures)
+    else:
+        inserted = sum(client.insert_rows(batch, table=BENCH_TABLE) for batch in batches)
+
+    elapsed = time.perf_counter() - start
+
+    stored = client.get_table_count(BENCH_TABLE)
+    if stored != inserted:
+        raise RuntimeError(f"Inserted {inserted:,} rows but table holds {stored:,}")
+
+    return inserted / elapsed
+
+
+def parse_int_list(value: str) -> list:
+    """Parse a comma-separated list of integers"""
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+@click.command()
+@click.option('--rows', 'num_rows', default=500000, help='Number of generated rows')
+@click.option('--batch-sizes', default='1000,5000,10000,50000,100000', help='Comma-separated batch sizes')
+@click.option('--in-flight', default='1,2,4', help='Comma-separated concurrent insert counts')
+@click.option('--host', default=lambda: os.getenv('CLICKHOUSE_HOST', 'localhost'), help='ClickHouse host')
+@click.option('--port', default=lambda: int(os.getenv('CLICKHOUSE_PORT', 9000)), help='ClickHouse native port')
+@click.option('--database', default=lambda: os.getenv('CLICKHOUSE_DB', 'logs'), help='ClickHouse database')
+@click.option('--output', default=str(Path(__file__).parent / 'results' / 'clickhouse_insert.json'),
+              help='JSON file the results are written to')
+@click.option('--seed', default=42, help='Random seed for generated rows')
+def main(num_rows, batch_sizes, in_flight, host, port, database, output, seed):
+    """Benchmark fact_requests insert modes and record rows/sec per configuration"""
+    rows = build_rows(num_rows, seed)
+    print(f"Benchmarking inserts of {len(rows):,} rows into {host}:{port}/{database}.{BENCH_TABLE}\n")
+
+    compression_modes = [False, True] if COMPRESSION_AVAILABLE else [False]
+    if not COMPRESSION_AVAILABLE:
+        print("  (lz4/clickhouse-cityhash not installed; skipping compressed runs)\n")
+
+    setup = ClickHouseClient(host=host, port=port, database=database)
+    setup.execute_query(f"CREATE TABLE IF NOT EXISTS {BENCH_TABLE} AS fact_requests")
+    server_version = '.'.join(str(part) for part in setup.client.connection.server_info.version_tuple())
+
+    results = []
+    print(f"  {'Mode':<9} {'LZ4':<4} {'In flight':>9} {'Batch':>8} {'Rows/sec':>12}")
+
+    try:
+        for columnar in (False, True):
+            for compression in compression_modes:
+                for connections in parse_int_list(in_flight):
+                    client = ClickHouseClient(
+                        host=host,
+                        port=port,
+                        database=database,
+                        columnar=columnar,
+                        compression=compression,
+                        insert_connections=connections
+                    )
+
+                    for batch_size in parse_int_list(batch_sizes):
+                        rows_per_sec = run_case(client, rows, batch_size)
+                        mode = 'columnar' if columnar else 'rows'
+
+                        results.append({
+                            'mode': mode,
+                            'compression': compression,
+                            'in_flight': connections,
+                            'batch_size': batch_size,
+                            'rows_per_sec': round(rows_per_sec)
+                        })
+                        print(f"  {mode:<9} {'on' if compression else 'off':<4} {connections:>9} "
+                              f"{batch_size:>8,} {rows_per_sec:>12,.0f}")
+
+                    client.close()
+    finally:
+        setup.execute_query(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        setup.close()
+
+    best = max(results, key=lambda result: result['rows_per_sec'])
+    print(f"\n  Best: {best['mode']}, compression {'on' if best['compression'] else 'off'}, "
+          f"{best['in_flight']} in flight, batch {best['batch_size']:,} "
+          f"-> {best['rows_per_sec']:,} rows/sec")
+
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'run_at': datetime.utcnow().isoformat(),
+            'host': f"{host}:{port}",
+            'server_version': server_version,
+            'python': platform.python_version(),
+            'rows': len(rows),
+            'results': results,
+            'best': best
+        }, f, indent=2)
+
+    print(f"\n  Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
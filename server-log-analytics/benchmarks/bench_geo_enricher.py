@@ -0,0 +1,144 @@
+"""
+Geo Enrichment Benchmark - Lookup cost and ingest overhead of --geoip
+Times GeoEnricher on its own and the parse/enrich loop with and without it
+"""
+
+import logging
+import random
+import socket
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+# Add project root and sample data to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'sample_data'))
+
+from ingest_logs import READ_BLOCK_LINES, LogIngestionPipeline
+from analyzers.geo_enricher import GeoEnricher, build_range_database
+from generate_sample_logs import write_corpus
+
+COUNTRY_CODES = ['US', 'DE', 'FR', 'GB', 'JP', 'CN', 'BR', 'IN', 'KR', 'AU', 'CA', 'NL', 'SE', 'PL', 'ES', 'IT']
+
+
+def write_range_csv(path: Path, num_ranges: int, seed: int):
+    """Write a CSV splitting the IPv4 space into num_ranges ranges over 50k cities"""
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, 2 ** 32), num_ranges - 1))
+    starts = [0] + cuts
+    ends = [cut - 1 for cut in cuts] + [2 ** 32 - 1]
+
+    def ip(value):
+        return socket.inet_ntoa(struct.pack('>I', value))
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('start_ip,end_ip,country_code,city\n')
+        for start, end in zip(starts, ends):
+            city = rng.randrange(50000)
+            f.write(f"{ip(start)},{ip(end)},{COUNTRY_CODES[city % len(COUNTRY_CODES)]},City {city}\n")
+
+
+def read_blocks(path: Path) -> list:
+    """Corpus lines as READ_BLOCK_LINES blocks of bytes, as the ingest readers yield them"""
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    return [lines[i:i + READ_BLOCK_LINES] for i in range(0, len(lines), READ_BLOCK_LINES)]
+
+
+def time_lookups(database: str, ips: list, cache_size: int, repeat: int) -> tuple:
+    """Return (best seconds, stats) for looking up every IP with a fresh enricher"""
+    best = float('inf')
+    stats = {}
+
+    for _ in range(repeat):
+        enricher = GeoEnricher(database, cache_size=cache_size)
+        start = time.perf_counter()
+        for ip in ips:
+            enricher.lookup(ip)
+        best = min(best, time.perf_counter() - start)
+        stats = enricher.get_stats()
+        enricher.close()
+
+    return best, stats
+
+
+def time_pipeline(blocks: list, database, repeat: int) -> float:
+    """Best seconds to parse and enrich every block (no database writes)"""
+    best = float('inf')
+
+    for _ in range(repeat):
+        pipeline = LogIngestionPipeline(geo_database=database, connect=False)
+        batch, security_events = [], []
+
+        start = time.perf_counter()
+        for block in blocks:
+            pipeline._process_lines(block, batch, security_events)
+            batch.clear()
+            security_events.clear()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+@click.command()
+@click.option('--lines', default=200000, help='Corpus lines')
+@click.option('--visitors', type=int, help='Distinct client IPs (default one per 50 lines)')
+@click.option('--ranges', 'num_ranges', default=1000000, help='IPv4 ranges in the synthetic database')
+@click.option('--database', help='Use this range database or .mmdb instead of a synthetic one')
+@click.option('--repeat', default=3, help='Runs per measurement (best time is reported)')
+@click.option('--seed', default=42, help='Random seed for the corpus and database')
+@click.option('--max-overhead', default=5.0, help='Fail if geo enrichment adds more than this % to parse/enrich time')
+def main(lines, visitors, num_ranges, database, repeat, seed, max_overhead):
+    """Measure GeoEnricher lookups and what --geoip adds to ingest time"""
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus = Path(tmp_dir) / 'corpus.log'
+        write_corpus(str(corpus), lines, seed=seed, visitors=visitors)
+
+        if not database:
+            csv_path = Path(tmp_dir) / 'ranges.csv'
+            database = str(Path(tmp_dir) / 'ranges.geo')
+            print(f"Building a {num_ranges:,}-range database...")
+            write_range_csv(csv_path, num_ranges, seed)
+            start = time.perf_counter()
+            build_range_database([str(csv_path)], database)
+            print(f"  built in {time.perf_counter() - start:.1f}s\n")
+
+        blocks = read_blocks(corpus)
+        ips = [line.split(b' ', 1)[0].decode() for block in blocks for line in block]
+
+        print(f"Benchmarking {len(ips):,} lines, {len(set(ips)):,} distinct IPs (best of {repeat})\n")
+
+        uncached_time, _ = time_lookups(database, ips, 0, repeat)
+        cached_time, stats = time_lookups(database, ips, 100000, repeat)
+
+        print(f"  {'Lookup':<12} {'Seconds':>10} {'ns/lookup':>12}")
+        print(f"  {'uncached':<12} {uncached_time:>10.3f} {uncached_time / len(ips) * 1e9:>12,.0f}")
+        print(f"  {'LRU':<12} {cached_time:>10.3f} {cached_time / len(ips) * 1e9:>12,.0f}")
+        print(f"  Cache hit rate:        {stats['cache_hit_rate']:.1f}%")
+        print(f"  Located:               {stats['located_percentage']:.1f}%\n")
+
+        # Alternate runs so drift on a busy machine hits both sides
+        base_time = geo_time = float('inf')
+        for _ in range(repeat):
+            base_time = min(base_time, time_pipeline(blocks, None, 1))
+            geo_time = min(geo_time, time_pipeline(blocks, database, 1))
+
+    overhead = (geo_time - base_time) / base_time * 100
+
+    print(f"  {'Parse+enrich':<12} {'Seconds':>10} {'Lines/sec':>12}")
+    print(f"  {'without geo':<12} {base_time:>10.3f} {len(ips) / base_time:>12,.0f}")
+    print(f"  {'with geo':<12} {geo_time:>10.3f} {len(ips) / geo_time:>12,.0f}")
+    print(f"\n  Geo overhead:          {overhead:+.1f}% (budget {max_overhead:g}%)")
+
+    if overhead > max_overhead:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""
+Ingestion Benchmark Suite - Reproducible per-stage and end-to-end throughput
+Generates a deterministic corpus, times each ingest stage in isolation and the
+whole pipeline, writes JSON results and flags regressions against a baseline
+"""
+
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+# Add project root and sample data to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'sample_data'))
+
+import ingest_logs
+from analyzers.bot_detector import BotDetector
+from analyzers.security_scanner import SecurityScanner
+from analyzers.sessionizer import Sessionizer
+from parsers.log_parser import LogParser
+from generate_sample_logs import CORPUS_CHUNK_LINES, DEFAULT_MIX, write_corpus
+
+STAGES = ('parse', 'bot_detection', 'security_scan', 'sessionize', 'end_to_end')
+
+# Lines handed to each isolated stage at a time
+BLOCK_LINES = 100000
+
+
+class NullClient:
+    """Insert sink for end-to-end runs: counts rows instead of sending them"""
+
+    def __init__(self):
+        self.rows = 0
+
+    def _insert(self, rows: list) -> int:
+        self.rows += len(rows)
+        return len(rows)
+
+    insert_rows = insert_security_event_rows = insert_session_rows = insert_anomaly_rows = _insert
+
+
+def parse_count(value: str) -> int:
+    """Parse a line count such as 1000000, 1M or 100M"""
+    value = value.strip().upper()
+    scale = {'K': 1000, 'M': 1000 ** 2, 'B': 1000 ** 3}.get(value[-1:], 1)
+    return int(float(value.rstrip('KMB')) * scale)
+
+
+def git_commit() -> str:
+    """Short hash of the checked-out commit ('' outside a git work tree)"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def corpus_path(corpus_dir: Path, corpus: dict) -> Path:
+    """Cache file for a corpus definition (same parameters, same file)"""
+    mix = '-'.join(f"{name}{corpus['mix'][name]:g}" for name in DEFAULT_MIX)
+    return corpus_dir / f"corpus-{corpus['lines']}-s{corpus['seed']}-v{corpus['visitors']}-{mix}.log"
+
+
+def iter_blocks(path: Path):
+    """Read the corpus BLOCK_LINES lines at a time"""
+    block = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            block.append(line)
+            if len(block) >= BLOCK_LINES:
+                yield block
+                block = []
+    if block:
+        yield block
+
+
+def run_isolated(path: Path, fast_parser: bool, stages: list) -> dict:
+    """
+    Time parse, bot detection, security scan and sessionizing separately
+
+    Each block of lines goes through every stage in turn, but only the stage
+    itself is timed, so one pass over the corpus gives every stage's
+    throughput without the others (or file reading) in the measurement.
+    """
+    parser = LogParser(fast=fast_parser)
+    bot_detector = BotDetector()
+    scanner = SecurityScanner()
+    sessionizer = Sessionizer()
+
+    seconds = dict.fromkeys(stages, 0.0)
+    lines = 0
+
+    for block in iter_blocks(path):
+        lines += len(block)
+
+        started = time.perf_counter()
+        entries = [entry for entry in (parser.parse_line(line.strip(), 'nginx') for line in block) if entry]
+        seconds['parse'] = seconds.get('parse', 0.0) + time.perf_counter() - started
+
+        if 'bot_detection' in seconds:
+            started = time.perf_counter()
+            for entry in entries:
+                bot_info = bot_detector.detect(entry.user_agent, entry.ip_address)
+                entry.is_bot = bot_info['is_bot']
+                entry.bot_type = bot_info['bot_type']
+            seconds['bot_detection'] += time.perf_counter() - started
+
+        if 'security_scan' in seconds:
+            started = time.perf_counter()
+            for entry in entries:
+                scanner.scan(entry.path, entry.query_string, entry.method)
+            seconds['security_scan'] += time.perf_counter() - started
+
+        if 'sessionize' in seconds:
+            started = time.perf_counter()
+            sessionizer.add_entries(entries)
+            seconds['sessionize'] += time.perf_counter() - started
+
+    if 'sessionize' in seconds:
+        started = time.perf_counter()
+        sessionizer.flush()
+        seconds['sessionize'] += time.perf_counter() - started
+
+    return {stage: seconds[stage] for stage in stages if stage in seconds} | {'_lines': lines}
+
+
+def run_end_to_end(path: Path, fast_parser: bool, workers: int, batch_size: int) -> tuple:
+    """
+    Ingest the corpus with LogIngestionPipeline into a NullClient
+
+    Returns:
+        (seconds, pipeline stats, per-stage share from IngestMetrics)
+    """
+    ingest_logs.console.quiet = True
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        pipeline = ingest_logs.LogIngestionPipeline(
+            batch_size=batch_size,
+            workers=workers,
+            fast_parser=fast_parser,
+            sessionize=workers == 1,
+            spool_dir=spool_dir,
+            instrument=True,
+            connect=False
+        )
+        pipeline.db_client = NullClient()
+
+        started = time.perf_counter()
+        stats = pipeline.ingest_files([str(path)])
+        elapsed = time.perf_counter() - started
+
+    shares = {stage: round(info['share'], 4) for stage, info in pipeline.metrics.snapshot()['stages'].items()}
+    return elapsed, stats, shares
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Stages whose lines/sec dropped more than threshold below the baseline"""
+    regressions = []
+
+    print(f"\n  Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('run_at', '?')}):")
+    print(f"  {'Stage':<15} {'Baseline':>12} {'Current':>12} {'Change':>9}")
+
+    for stage, result in results.items():
+        before = baseline.get('results', {}).get(stage)
+        if not before:
+            continue
+
+        change = result['lines_per_sec'] / before['lines_per_sec'] - 1
+        regressed = change < -threshold
+        print(f"  {stage:<15} {before['lines_per_sec']:>12,.0f} {result['lines_per_sec']:>12,.0f} "
+              f"{change * 100:>+8.1f}%{'  REGRESSION' if regressed else ''}")
+
+        if regressed:
+            regressions.append({
+                'stage': stage,
+                'baseline_lines_per_sec': before['lines_per_sec'],
+                'lines_per_sec': result['lines_per_sec'],
+                'change': round(change, 4)
+            })
+
+    return regressions
+
+
+@click.command()
+@click.option('--lines', 'num_lines', default='1M', help='Corpus size, e.g. 1M, 10M, 100M')
+@click.option('--bot-rate', default=DEFAULT_MIX['bot'], help='Share of bot requests')
+@click.option('--attack-rate', default=DEFAULT_MIX['attack'], help='Share of attack requests')
+@click.option('--slow-rate', default=DEFAULT_MIX['slow'], help='Share of slow requests')
+@click.option('--error-rate', default=DEFAULT_MIX['error'], help='Share of 5xx requests')
+@click.option('--visitors', default=0, help='Distinct clients (default one per 50 lines)')
+@click.option('--seed', default=42, help='Corpus seed')
+@click.option('--stages', default=','.join(STAGES), help='Comma-separated stages to run')
+@click.option('--fast-parser', is_flag=True, help='Use the fast Nginx parser in every stage')
+@click.option('--workers', default=1, help='Worker processes for the end-to-end run')
+@click.option('--batch-size', default=10000, help='End-to-end insert batch size')
+@click.option('--gen-workers', default=0, help='Corpus generator processes (default: all cores)')
+@click.option('--corpus-dir', default=str(Path(__file__).parent / 'corpora'),
+              help='Where generated corpora are cached')
+@click.option('--output', default=str(Path(__file__).parent / 'results' / 'ingest_suite.json'),
+              help='Where to write JSON results')
+@click.option('--baseline', type=click.Path(exists=True), help='Earlier results file to compare against')
+@click.option('--threshold', default=0.10, help='Lines/sec drop vs the baseline flagged as a regression')
+def main(num_lines, bot_rate, attack_rate, slow_rate, error_rate, visitors, seed, stages,
+         fast_parser, workers, batch_size, gen_workers, corpus_dir, output, baseline, threshold):
+    """Benchmark ingest stages on a generated corpus and flag regressions"""
+    num_lines = parse_count(num_lines)
+    stages = [stage for stage in stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise click.BadParameter(f"unknown stages: {', '.join(sorted(unknown))}", param_hint='--stages')
+
+    mix = {'bot': bot_rate, 'attack': attack_rate, 'slow': slow_rate, 'error': error_rate}
+    mix['normal'] = 1.0 - sum(mix.values())
+    if mix['normal'] < 0:
+        raise click.BadParameter("scenario rates add up to more than 1")
+
+    corpus = {
+        'lines': num_lines,
+        'seed': seed,
+        'mix': {name: round(mix[name], 6) for name in DEFAULT_MIX},
+        'visitors': visitors or max(1, num_lines // 50),
+        'chunk_lines': CORPUS_CHUNK_LINES
+    }
+
+    corpus_dir = Path(corpus_dir)
+    if not corpus_dir.exists():
+        corpus_dir.mkdir(parents=True)
+        # Corpora are regenerated on demand and can be many GB
+        (corpus_dir / '.gitignore').write_text('*\n')
+
+    path = corpus_path(corpus_dir, corpus)
+    results = {}
+
+    if path.exists():
+        print(f"Using cached corpus {path}")
+    else:
+        print(f"Generating {num_lines:,} lines -> {path}")
+        started = time.perf_counter()
+        tmp_path = path.with_suffix('.tmp')
+        write_corpus(tmp_path, num_lines, seed=seed, mix=corpus['mix'],
+                     visitors=corpus['visitors'], workers=gen_workers or None)
+        os.replace(tmp_path, path)
+        elapsed = time.perf_counter() - started
+        print(f"  {num_lines / elapsed:,.0f} lines/sec")
+
+    corpus['bytes'] = path.stat().st_size
+    print(f"\nBenchmarking {num_lines:,} lines ({corpus['bytes'] / 1024 ** 2:,.0f} MB), "
+          f"parser: {'fast' if fast_parser else 'regex'}\n")
+    print(f"  {'Stage':<15} {'Seconds':>10} {'Lines/sec':>14}")
+
+    isolated = [stage for stage in stages if stage != 'end_to_end']
+    if isolated:
+        timings = run_isolated(path, fast_parser, isolated)
+        lines = timings.pop('_lines')
+        for stage in isolated:
+            results[stage] = {
+                'lines': lines,
+                'seconds': round(timings[stage], 4),
+                'lines_per_sec': round(lines / timings[stage]) if timings[stage] > 0 else 0
+            }
+            print(f"  {stage:<15} {timings[stage]:>10.2f} {results[stage]['lines_per_sec']:>14,}")
+
+    if 'end_to_end' in stages:
+        elapsed, stats, shares = run_end_to_end(path, fast_parser, workers, batch_size)
+        results['end_to_end'] = {
+            'lines': stats['total_lines'],
+            'seconds': round(elapsed, 4),
+            'lines_per_sec': round(stats['total_lines'] / elapsed),
+            'workers': workers,
+            'stage_share': shares
+        }
+        print(f"  {'end_to_end':<15} {elapsed:>10.2f} {results['end_to_end']['lines_per_sec']:>14,}")
+
+    regressions = []
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        previous_corpus = previous.get('corpus', {})
+        if previous_corpus.get('lines') != corpus['lines'] or previous_corpus.get('mix') != corpus['mix']:
+            print("\n  Warning: baseline used a different corpus; numbers are not directly comparable")
+        if previous.get('fast_parser') != fast_parser:
+            print("\n  Warning: baseline used the other parser; numbers are not directly comparable")
+        regressions = compare(results, previous, threshold)
+
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'run_at': datetime.utcnow().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'fast_parser': fast_parser,
+            'corpus': corpus,
+            'results': results,
+            'threshold': threshold,
+            'regressions': regressions
+        }, f, indent=2)
+
+    print(f"\n  Results written to {output}")
+
+    if regressions:
+        print(f"  {len(regressions)} stage(s) regressed by more than {threshold * 100:.0f}%")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Parser Micro-benchmark - Regex vs fast-path Nginx parsing
+Times LogParser on generate_sample_logs.py output and checks both paths agree
+"""
+
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import click
+
+# Add project root and sample data to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'sample_data'))
+
+from parsers.log_parser import LogParser
+from generate_sample_logs import generate_log_line
+
+
+def generate_lines(num_lines: int, seed: int) -> list:
+    """Generate sample Nginx lines with the same scenario mix as generate_sample_logs"""
+    random.seed(seed)
+    timestamp = datetime(2024, 1, 1)
+    lines = []
+
+    for _ in range(num_lines):
+        timestamp += timedelta(seconds=random.randint(0, 2))
+        rand = random.random()
+
+        if rand < 0.70:
+            scenario = 'normal'
+        elif rand < 0.85:
+            scenario = 'bot'
+        elif rand < 0.90:
+            scenario = 'slow'
+        elif rand < 0.98:
+            scenario = 'error'
+        else:
+            scenario = 'attack'
+
+        lines.append(generate_log_line(timestamp, scenario))
+
+    return lines
+
+
+def time_parser(parser: LogParser, lines: list, repeat: int) -> tuple:
+    """Return (best seconds, parsed entries) over `repeat` runs"""
+    best = float('inf')
+    entries = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        entries = [parser.parse(line, 'nginx') for line in lines]
+        best = min(best, time.perf_counter() - start)
+
+    return best, entries
+
+
+def measure_memory(parser: LogParser, lines: list) -> float:
+    """Return bytes allocated per parsed entry still held after the batch"""
+    gc.collect()
+    tracemalloc.start()
+
+    # Traced copies, so lines kept alive through raw_line count and the rest are freed
+    lines = [line.encode().decode() for line in lines]
+    entries = [parser.parse(line, 'nginx') for line in lines]
+    del lines
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return retained / max(len(entries), 1)
+
+
+@click.command()
+@click.option('--lines', 'num_lines', default=200000, help='Number of generated lines')
+@click.option('--file', 'file_path', type=click.Path(exists=True), help='Benchmark an existing log file instead')
+@click.option('--repeat', default=3, help='Runs per parser (best time is reported)')
+@click.option('--seed', default=42, help='Random seed for generated lines')
+@click.option('--memory', is_flag=True, help='Also report bytes retained per parsed entry')
+def main(num_lines, file_path, repeat, seed, memory):
+    """Compare LogParser regex and fast-path throughput"""
+    if file_path:
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            lines = [line.strip() for line in f]
+    else:
+        lines = generate_lines(num_lines, seed)
+
+    print(f"Benchmarking {len(lines):,} lines (best of {repeat})\n")
+
+    regex_time, regex_entries = time_parser(LogParser(), lines, repeat)
+    fast_time, fast_entries = time_parser(LogParser(fast=True), lines, repeat)
+
+    mismatches = sum(1 for a, b in zip(regex_entries, fast_entries) if a != b)
+
+    print(f"  {'Parser':<10} {'Seconds':>10} {'Lines/sec':>14}")
+    print(f"  {'regex':<10} {regex_time:>10.3f} {len(lines) / regex_time:>14,.0f}")
+    print(f"  {'fast':<10} {fast_time:>10.3f} {len(lines) / fast_time:>14,.0f}")
+    print(f"\n  Speedup:    {regex_time / fast_time:.2f}x")
+    print(f"  Mismatches: {mismatches}")
+
+    if memory:
+        print(f"\n  {'Parser':<10} {'Bytes/entry':>14}")
+        for name, parser in [
+            ('regex', LogParser()),
+            ('fast', LogParser(fast=True)),
+            ('fast+raw', LogParser(fast=True, keep_raw_line=True))
+        ]:
+            print(f"  {name:<10} {measure_memory(parser, lines):>14,.0f}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
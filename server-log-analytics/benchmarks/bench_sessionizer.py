@@ -0,0 +1,107 @@
+"""
+Sessionizer Benchmark - Streaming vs vectorized session metrics
+Times Sessionizer.sessionize() and sessionize_columns() on synthetic requests and checks they agree
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import click
+import numpy as np
+
+# Add project root and sample data to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'sample_data'))
+
+from analyzers.sessionizer import Sessionizer
+from generate_sample_logs import PATHS, USER_AGENTS
+
+
+def generate_columns(num_requests: int, requests_per_visitor: int, seed: int) -> dict:
+    """
+    Generate unsorted request columns for about num_requests / requests_per_visitor visitors
+
+    Each visitor's requests fall within two hours, so gaps over the 30 minute
+    timeout split some visits into several sessions.
+    """
+    rng = np.random.default_rng(seed)
+    num_visitors = max(1, num_requests // requests_per_visitor)
+
+    visitor = rng.integers(0, num_visitors, num_requests)
+    visitor_ids = np.array([f"{v:016x}" for v in range(num_visitors)], dtype=object)
+    visitor_ips = np.array([f"10.{v >> 16 & 255}.{v >> 8 & 255}.{v & 255}" for v in range(num_visitors)], dtype=object)
+    user_agents = np.array(USER_AGENTS, dtype=object)
+
+    paths = np.array(PATHS + Sessionizer.CONVERSION_PATHS, dtype=object)
+    visit_start = rng.integers(0, 86400, num_visitors)
+    seconds = visit_start[visitor] + rng.integers(0, 7200, num_requests)
+
+    return {
+        'session_id': visitor_ids[visitor],
+        'timestamp': np.datetime64('2024-01-01T00:00:00', 'us') + seconds.astype('timedelta64[s]'),
+        'path': paths[rng.integers(0, len(paths), num_requests)],
+        'response_bytes': rng.integers(200, 200000, num_requests),
+        'response_time_ms': rng.integers(5, 3000, num_requests),
+        'ip_address': visitor_ips[visitor],
+        'user_agent': user_agents[visitor % len(user_agents)],
+        'is_bot': (visitor % 7 == 0).astype(np.int64)
+    }
+
+
+def to_requests(columns: dict) -> list:
+    """Convert request columns into request dicts for sessionize()"""
+    names = list(columns)
+    values = [columns[name].tolist() for name in names]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+@click.command()
+@click.option('--requests', 'num_requests', default=10000000, help='Number of synthetic requests')
+@click.option('--verify', 'num_verify', default=1000000,
+              help='Requests also run through the streaming sessionizer and compared')
+@click.option('--requests-per-visitor', default=20, help='Average requests per visitor')
+@click.option('--seed', default=42, help='Random seed for generated requests')
+def main(num_requests, num_verify, requests_per_visitor, seed):
+    """Compare streaming and vectorized sessionization throughput"""
+    print(f"Benchmarking {num_requests:,} requests, verifying on {num_verify:,}\n")
+
+    # Streaming and vectorized on a smaller sample, checked for identical sessions
+    subset = generate_columns(num_verify, requests_per_visitor, seed)
+    requests = to_requests(subset)
+
+    start = time.perf_counter()
+    expected = Sessionizer().sessionize(requests)
+    streaming_time = time.perf_counter() - start
+    del requests
+
+    start = time.perf_counter()
+    actual = Sessionizer().sessionize_columns(subset)
+    subset_time = time.perf_counter() - start
+
+    expected.sort(key=lambda session: session.session_id)
+    actual.sort(key=lambda session: session.session_id)
+    mismatches = abs(len(expected) - len(actual)) + sum(1 for a, b in zip(expected, actual) if a != b)
+    del expected, actual, subset
+
+    # Vectorized on the full set
+    columns = generate_columns(num_requests, requests_per_visitor, seed)
+
+    start = time.perf_counter()
+    sessions = Sessionizer().sessionize_columns(columns)
+    full_time = time.perf_counter() - start
+
+    print(f"  {'Sessionizer':<12} {'Requests':>12} {'Seconds':>10} {'Requests/sec':>14}")
+    print(f"  {'streaming':<12} {num_verify:>12,} {streaming_time:>10.3f} {num_verify / streaming_time:>14,.0f}")
+    print(f"  {'vectorized':<12} {num_verify:>12,} {subset_time:>10.3f} {num_verify / subset_time:>14,.0f}")
+    print(f"  {'vectorized':<12} {num_requests:>12,} {full_time:>10.3f} {num_requests / full_time:>14,.0f}")
+    print(f"\n  Speedup:    {streaming_time / subset_time:.2f}x")
+    print(f"  Sessions:   {len(sessions):,} ({num_requests / len(sessions):.1f} requests each)")
+    print(f"  Mismatches: {mismatches}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,7 +15,8 @@ from dash import dcc, html, Input, Output, callback
 import dash_bootstrap_components as dbc
 import plotly.graph_objs as go
 import plotly.express as px
-from clickhouse_driver import Client
+
+from dashboard.queries import DashboardQueries, LATENCY_BIN_MS
 
 # Initialize Dash app
 app = dash.Dash(
@@ -24,9 +25,17 @@ app = dash.Dash(
     title="Server Log Analytics"
 )
 
-# ClickHouse connection
-def get_client():
-    return Client(host='localhost', port=9000, database='logs')
+# Refresh interval of every panel (ms)
+REFRESH_INTERVAL_MS = 30 * 1000
+
+# Shared by all callbacks and browser tabs: pooled connections, and one
+# cached query per time range and refresh interval
+queries = DashboardQueries(
+    host='localhost',
+    port=9000,
+    database='logs',
+    ttl=REFRESH_INTERVAL_MS / 1000
+)
 
 
 # Layout
@@ -169,7 +178,7 @@ app.layout = dbc.Container([
     # Auto-refresh
     dcc.Interval(
         id='interval-component',
-        interval=30*1000,  # Refresh every 30 seconds
+        interval=REFRESH_INTERVAL_MS,  # Refresh every 30 seconds
         n_intervals=0
     )
 
@@ -193,26 +202,13 @@ app.layout = dbc.Container([
 def update_kpis(days, n):
     """Update KPI cards"""
     try:
-        client = get_client()
-
-        query = f"""
-        SELECT
-            count() as total_requests,
-            avg(response_time_ms) as avg_latency,
-            countIf(status_code >= 400) as errors,
-            countIf(is_bot = 1) as bot_requests
-        FROM fact_requests
-        WHERE date >= today() - {days}
-        """
-
-        result = client.execute(query)
-
-        if result:
-            row = result[0]
-            total = row[0]
-            avg_lat = row[1]
-            errors = row[2]
-            bots = row[3]
+        data = queries.overview(days)
+
+        if data['requests']:
+            total = data['requests']
+            avg_lat = data['avg_latency']
+            errors = data['errors']
+            bots = data['bots']
 
             error_rate = (errors / total * 100) if total > 0 else 0
             bot_pct = (bots / total * 100) if total > 0 else 0
@@ -221,7 +217,7 @@ def update_kpis(days, n):
                 f"{total:,}",
                 f"Last {days} days",
                 f"{avg_lat:.0f}ms",
-                "Average response time",
+                f"p50 {data['latency_p50']:.0f}ms · p95 {data['latency_p95']:.0f}ms · p99 {data['latency_p99']:.0f}ms",
                 f"{error_rate:.2f}%",
                 f"{errors:,} errors",
                 f"{bot_pct:.1f}%",
@@ -241,27 +237,14 @@ def update_kpis(days, n):
 def update_traffic_timeline(days, n):
     """Update traffic timeline chart"""
     try:
-        client = get_client()
-
-        query = f"""
-        SELECT
-            toStartOfHour(timestamp) as hour,
-            count() as requests,
-            avg(response_time_ms) as avg_latency
-        FROM fact_requests
-        WHERE date >= today() - {days}
-        GROUP BY hour
-        ORDER BY hour
-        """
-
-        result = client.execute(query)
-
-        if not result:
+        data = queries.overview(days)
+
+        if not data['requests']:
             return go.Figure()
 
-        hours = [row[0] for row in result]
-        requests = [row[1] for row in result]
-        latencies = [row[2] for row in result]
+        hours = data['hours']
+        requests = data['hourly_requests']
+        latencies = data['hourly_latency']
 
         fig = go.Figure()
 
@@ -302,25 +285,13 @@ def update_traffic_timeline(days, n):
 def update_status_pie(days, n):
     """Update status code pie chart"""
     try:
-        client = get_client()
-
-        query = f"""
-        SELECT
-            status_code,
-            count() as count
-        FROM fact_requests
-        WHERE date >= today() - {days}
-        GROUP BY status_code
-        ORDER BY count DESC
-        """
+        data = queries.overview(days)
 
-        result = client.execute(query)
-
-        if not result:
+        if not data['requests']:
             return go.Figure()
 
-        status_codes = [str(row[0]) for row in result]
-        counts = [row[1] for row in result]
+        status_codes = [code for code, _ in data['status_codes']]
+        counts = [count for _, count in data['status_codes']]
 
         # Color mapping
         colors = {
@@ -355,26 +326,13 @@ def update_status_pie(days, n):
 def update_top_pages(days, n):
     """Update top pages bar chart"""
     try:
-        client = get_client()
-
-        query = f"""
-        SELECT
-            path,
-            count() as requests
-        FROM fact_requests
-        WHERE date >= today() - {days}
-        GROUP BY path
-        ORDER BY requests DESC
-        LIMIT 10
-        """
-
-        result = client.execute(query)
-
-        if not result:
+        data = queries.overview(days)
+
+        if not data['requests']:
             return go.Figure()
 
-        paths = [row[0] for row in result]
-        requests = [row[1] for row in result]
+        paths = [path for path, _ in data['top_pages']]
+        requests = [count for _, count in data['top_pages']]
 
         fig = px.bar(
             x=requests,
@@ -401,31 +359,20 @@ def update_top_pages(days, n):
 def update_latency_histogram(days, n):
     """Update latency histogram"""
     try:
-        client = get_client()
+        data = queries.overview(days)
 
-        query = f"""
-        SELECT response_time_ms
-        FROM fact_requests
-        WHERE date >= today() - {days}
-          AND response_time_ms > 0
-          AND response_time_ms < 5000
-        LIMIT 10000
-        """
-
-        result = client.execute(query)
-
-        if not result:
+        if not data['requests'] or not data['latency_counts']:
             return go.Figure()
 
-        latencies = [row[0] for row in result]
-
-        fig = px.histogram(
-            x=latencies,
-            nbins=50,
+        # Binned by ClickHouse over every request in range, not a sample
+        fig = px.bar(
+            x=data['latency_bins'],
+            y=data['latency_counts'],
             labels={'x': 'Response Time (ms)', 'y': 'Count'}
         )
 
-        fig.update_layout(height=350)
+        fig.update_traces(offset=0, width=LATENCY_BIN_MS)
+        fig.update_layout(bargap=0, height=350)
 
         return fig
 
@@ -440,27 +387,14 @@ def update_latency_histogram(days, n):
 def update_bot_timeline(days, n):
     """Update bot vs human timeline"""
     try:
-        client = get_client()
-
-        query = f"""
-        SELECT
-            toStartOfHour(timestamp) as hour,
-            countIf(is_bot = 0) as human,
-            countIf(is_bot = 1) as bot
-        FROM fact_requests
-        WHERE date >= today() - {days}
-        GROUP BY hour
-        ORDER BY hour
-        """
-
-        result = client.execute(query)
-
-        if not result:
+        data = queries.overview(days)
+
+        if not data['requests']:
             return go.Figure()
 
-        hours = [row[0] for row in result]
-        human = [row[1] for row in result]
-        bot = [row[2] for row in result]
+        hours = data['hours']
+        human = data['hourly_humans']
+        bot = data['hourly_bots']
 
         fig = go.Figure()
 
@@ -500,28 +434,13 @@ def update_bot_timeline(days, n):
 def update_bot_types(days, n):
     """Update bot types bar chart"""
     try:
-        client = get_client()
-
-        query = f"""
-        SELECT
-            bot_type,
-            count() as requests
-        FROM fact_requests
-        WHERE date >= today() - {days}
-          AND is_bot = 1
-          AND bot_type != ''
-        GROUP BY bot_type
-        ORDER BY requests DESC
-        LIMIT 10
-        """
-
-        result = client.execute(query)
-
-        if not result:
+        data = queries.overview(days)
+
+        if not data['requests'] or not data['bot_types']:
             return go.Figure()
 
-        bot_types = [row[0] for row in result]
-        requests = [row[1] for row in result]
+        bot_types = [bot_type for bot_type, _ in data['bot_types']]
+        requests = [count for _, count in data['bot_types']]
 
         fig = px.bar(
             x=requests,
@@ -0,0 +1,160 @@
+"""
+Dashboard Queries - Shared, cached data layer for the Dash dashboard
+Serves every panel from one pre-aggregated ClickHouse query per refresh
+"""
+
+import logging
+import math
+from typing import Dict
+
+from database.clickhouse_client import ClickHouseClient
+
+logger = logging.getLogger(__name__)
+
+# Width and upper bound of the latency histogram bins (ms)
+LATENCY_BIN_MS = 100
+LATENCY_MAX_MS = 5000
+
+# Everything the dashboard draws, aggregated server-side in one scan.
+# Per-hour series and distributions come back as sumMap (keys, values)
+# arrays, so a 90-day range is a few thousand numbers, not raw rows.
+OVERVIEW_QUERY = """
+SELECT
+    requests,
+    avg_latency,
+    errors,
+    bots,
+    latency_quantiles,
+    hourly_requests,
+    hourly_latency,
+    hourly_bots,
+    status_codes,
+    bot_types,
+    latency_histogram,
+    arraySlice(arrayReverseSort(x -> x.2, arrayZip(pages.1, pages.2)), 1, %(top_n)s) AS top_pages
+FROM
+(
+    SELECT
+        count() AS requests,
+        avg(response_time_ms) AS avg_latency,
+        countIf(status_code >= 400) AS errors,
+        countIf(is_bot = 1) AS bots,
+        quantiles(0.5, 0.95, 0.99)(response_time_ms) AS latency_quantiles,
+        sumMap([toStartOfHour(timestamp)], [toUInt64(1)]) AS hourly_requests,
+        sumMap([toStartOfHour(timestamp)], [toUInt64(response_time_ms)]) AS hourly_latency,
+        sumMapIf([toStartOfHour(timestamp)], [toUInt64(1)], is_bot = 1) AS hourly_bots,
+        sumMap([status_code], [toUInt64(1)]) AS status_codes,
+        sumMapIf([toString(bot_type)], [toUInt64(1)], is_bot = 1 AND bot_type != '') AS bot_types,
+        sumMapIf(
+            [intDiv(response_time_ms, %(bin_ms)s) * %(bin_ms)s], [toUInt64(1)],
+            response_time_ms > 0 AND response_time_ms < %(max_ms)s
+        ) AS latency_histogram,
+        sumMap([path], [toUInt64(1)]) AS pages
+    FROM fact_requests
+    WHERE date >= today() - %(days)s
+)
+"""
+
+
+class DashboardQueries:
+    """
+    Query layer shared by all dashboard callbacks and browser tabs
+
+    Every panel reads from overview(), which runs OVERVIEW_QUERY through
+    ClickHouseClient.query() on a pooled connection; the decoded result is
+    cached per (time range, refresh interval). All tabs and callbacks in the
+    same interval share one query, so database load no longer grows with
+    the number of viewers.
+    """
+
+    def __init__(
+        self,
+        host: str = 'localhost',
+        port: int = 9000,
+        database: str = 'logs',
+        pool_size: int = 4,
+        ttl: float = 30.0,
+        top_n: int = 10
+    ):
+        """
+        Initialize query layer
+
+        Args:
+            host: ClickHouse host
+            port: Native protocol port
+            database: Database name
+            pool_size: Max concurrent ClickHouse connections
+            ttl: Seconds a result is shared (match the dashboard refresh interval)
+            top_n: Rows in the top pages and bot type panels
+        """
+        self.client = ClickHouseClient(
+            host=host, port=port, database=database,
+            cache_ttl=ttl, read_connections=pool_size
+        )
+        self.top_n = top_n
+
+    def overview(self, days: int) -> Dict:
+        """
+        Aggregates for every dashboard panel over the last ``days`` days
+
+        Args:
+            days: Time range in days
+
+        Returns:
+            Dict of KPIs, hourly series and distributions (see _decode_overview)
+        """
+        params = {
+            'days': int(days),
+            'top_n': self.top_n,
+            'bin_ms': LATENCY_BIN_MS,
+            'max_ms': LATENCY_MAX_MS
+        }
+
+        return self.client.query(
+            'overview', OVERVIEW_QUERY, params,
+            decode=lambda rows: self._decode_overview(rows[0] if rows else None)
+        )
+
+    def _decode_overview(self, row) -> Dict:
+        """Turn OVERVIEW_QUERY's sumMap arrays into plot-ready lists"""
+        if not row or not row[0]:
+            return {'requests': 0}
+
+        (requests, avg_latency, errors, bots, latency_quantiles, hourly_requests,
+         hourly_latency, hourly_bots, status_codes, bot_types, latency_histogram, top_pages) = row
+
+        hours, hour_counts = hourly_requests
+        latency_by_hour = dict(zip(*hourly_latency))
+        bots_by_hour = dict(zip(*hourly_bots))
+        bot_counts = [bots_by_hour.get(hour, 0) for hour in hours]
+
+        statuses = sorted(zip(*status_codes), key=lambda item: item[1], reverse=True)
+        bot_type_counts = sorted(zip(*bot_types), key=lambda item: item[1], reverse=True)[:self.top_n]
+        p50, p95, p99 = (0.0 if math.isnan(q) else q for q in latency_quantiles)
+
+        return {
+            'requests': requests,
+            'avg_latency': avg_latency,
+            'errors': errors,
+            'bots': bots,
+            'latency_p50': p50,
+            'latency_p95': p95,
+            'latency_p99': p99,
+            'hours': list(hours),
+            'hourly_requests': list(hour_counts),
+            'hourly_latency': [
+                latency_by_hour.get(hour, 0) / count if count else 0.0
+                for hour, count in zip(hours, hour_counts)
+            ],
+            'hourly_bots': bot_counts,
+            'hourly_humans': [count - bot for count, bot in zip(hour_counts, bot_counts)],
+            'status_codes': [(str(code), count) for code, count in statuses],
+            'bot_types': bot_type_counts,
+            'latency_bins': list(latency_histogram[0]),
+            'latency_counts': list(latency_histogram[1]),
+            'top_pages': [tuple(page) for page in top_pages]
+        }
+
+    def get_stats(self) -> Dict:
+        """Get cache and connection pool statistics"""
+        return self.client.get_stats()
@@ -0,0 +1,383 @@
+"""
+Buffered Writer - Background ClickHouse inserts with retry and disk spill
+Overlaps inserts with parsing (optionally several batches in flight), retries
+failed batches with exponential backoff and spools them to disk while
+ClickHouse is unavailable
+"""
+
+import itertools
+import logging
+import os
+import pickle
+import queue
+import threading
+import time
+from typing import Dict, List
+
+from clickhouse_driver.errors import NetworkError, SocketTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning "ClickHouse is unreachable" rather than "this batch is bad"
+UNAVAILABLE_ERRORS = (NetworkError, SocketTimeoutError, ConnectionError, EOFError, OSError)
+
+# Queue marker that stops one writer thread
+_STOP = object()
+
+
+class BufferedWriter:
+    """
+    Background threads that own all inserts for a pipeline
+
+    Producers call submit(), which blocks once ``queue_size`` batches are
+    waiting, so parsing is throttled to what the database (or the spool)
+    absorbs. ``threads`` writer threads take batches off the queue, so up to
+    that many inserts are in flight at once (give the ClickHouseClient as
+    many insert_connections so each thread has its own connection). Connection failures (UNAVAILABLE_ERRORS) are retried; a batch
+    that still fails after ``max_retries`` is pickled into ``spool_dir`` and
+    later batches skip straight to the spool until a replay succeeds; replay
+    is attempted every ``probe_interval`` seconds and on startup, so batches
+    left by a previous run are picked up too. Any other error means the
+    batch itself is bad: it is set aside as a .rejected file at once, so it
+    never stalls or diverts the batches behind it.
+
+    Batches are numbered as they are submitted; completed_through() tells a
+    producer how far every batch is settled (inserted, spooled or rejected)
+    without waiting on drain(), e.g. to checkpoint its input behind them.
+    """
+
+    TABLES = ('fact_requests', 'security_events', 'fact_sessions', 'anomalies')
+
+    def __init__(
+        self,
+        db_client,
+        queue_size: int = 4,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        spool_dir: str = '.ingest_spool',
+        probe_interval: float = 10.0,
+        metrics=None,
+        threads: int = 1
+    ):
+        """
+        Initialize writer
+
+        Args:
+            db_client: ClickHouseClient used for inserts
+            queue_size: Max batches waiting to be written before submit() blocks
+            max_retries: Retries per batch before it is spooled to disk
+            backoff_base: Delay before the first retry, doubled on each retry
+            backoff_max: Upper bound on a single retry delay
+            spool_dir: Directory for batches that could not be inserted
+            probe_interval: Seconds between replay attempts while ClickHouse is down
+            metrics: Optional IngestMetrics; each insert round-trip is reported
+                     to its observe_insert()
+            threads: Writer threads, i.e. batches inserted concurrently
+        """
+        self.db_client = db_client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.spool_dir = spool_dir
+        self.probe_interval = probe_interval
+        self.metrics = metrics
+
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.num_threads = max(1, threads)
+        self.threads = []
+
+        self.available = True
+        self._next_probe = 0.0
+        self._spool_sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+
+        self.submitted = 0            # Sequence number of the latest submitted batch
+        self._completed_through = 0   # Every batch up to this one is settled
+        self._completed = set()       # Settled batches beyond _completed_through
+
+        # Counters (updated by the writer threads under _lock)
+        self.rows_inserted = 0
+        self.events_inserted = 0
+        self.sessions_inserted = 0
+        self.anomalies_inserted = 0
+        self.retries = 0
+        self.batches_spilled = 0
+        self.rows_spilled = 0
+        self.batches_replayed = 0
+        self.rows_replayed = 0
+        self.batches_failed = 0
+        self.batches_rejected = 0
+
+    def start(self):
+        """Start the writer threads (replays any spooled batches first)"""
+        if self.threads:
+            return
+
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self._run, name=f'clickhouse-writer-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, table: str, rows: List[tuple]):
+        """
+        Queue a batch of rows for insertion, blocking while the queue is full
+
+        Args:
+            table: 'fact_requests', 'security_events' or 'fact_sessions'
+            rows: Prepared row tuples for that table
+        """
+        if table not in self.TABLES:
+            raise ValueError(f"Unknown table: {table}")
+
+        if not rows:
+            return
+
+        if not any(thread.is_alive() for thread in self.threads):
+            raise RuntimeError("BufferedWriter is not running")
+
+        with self._lock:
+            self.submitted += 1
+            sequence = self.submitted
+
+        try:
+            self.queue.put((table, rows, sequence))
+        except BaseException:
+            # Interrupted while the queue was full; the batch never entered it
+            self._settle(sequence)
+            raise
+
+    def completed_through(self) -> int:
+        """Highest sequence number up to which every submitted batch is inserted, spooled or rejected"""
+        with self._lock:
+            return self._completed_through
+
+    def _settle(self, sequence: int):
+        """Record a finished batch and advance the contiguous completion mark"""
+        with self._lock:
+            self._completed.add(sequence)
+            while self._completed_through + 1 in self._completed:
+                self._completed_through += 1
+                self._completed.remove(self._completed_through)
+
+    def drain(self):
+        """Block until every submitted batch is inserted or spooled"""
+        self.queue.join()
+
+    def close(self):
+        """Drain the queue and stop the writer threads"""
+        if not self.threads:
+            return
+
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _count(self, counter: str, amount: int = 1):
+        """Add to a counter; several writer threads may update it at once"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _run(self):
+        """Writer thread: replay the spool when possible, then write queued batches"""
+        while True:
+            try:
+                job = self.queue.get(timeout=self.probe_interval)
+            except queue.Empty:
+                job = None
+
+            try:
+                if job is _STOP:
+                    # Last chance to empty the spool before exiting
+                    self._next_probe = 0.0
+                    self._replay_spool()
+                    return
+
+                self._replay_spool()
+
+                if job is not None:
+                    table, rows, _ = job
+                    self._write(table, rows)
+
+            except Exception as e:
+                # Never let the thread die with producers blocked on the queue
+                logger.error(f"Writer error: {e}")
+                self._count('batches_failed')
+
+            finally:
+                if job is not None:
+                    if job is not _STOP:
+                        self._settle(job[2])
+                    self.queue.task_done()
+
+    def _write(self, table: str, rows: List[tuple]):
+        """Insert a batch with retries, spooling it if ClickHouse stays unavailable"""
+        if not self.available:
+            # Keep parsing moving while ClickHouse is down; replay catches up later
+            self._spill(table, rows)
+            return
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._insert(table, rows)
+                return
+
+            except UNAVAILABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Giving up on {table} batch of {len(rows):,} rows after {attempt + 1} attempts: {e}")
+                    break
+
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                logger.warning(f"Insert into {table} failed ({e}); retrying in {delay:.1f}s")
+                self._count('retries')
+                time.sleep(delay)
+
+            except Exception as e:
+                # Retrying a bad batch (unknown column, bad value) can't help
+                logger.error(f"Rejected {table} batch of {len(rows):,} rows: {e}")
+                self._spill(table, rows, rejected=True)
+                self._count('batches_rejected')
+                return
+
+        self._mark_unavailable()
+        self._spill(table, rows)
+
+    def _insert(self, table: str, rows: List[tuple]):
+        """Send one batch to ClickHouse"""
+        if self.metrics is None:
+            self._send(table, rows)
+            return
+
+        started = time.perf_counter()
+        try:
+            self._send(table, rows)
+        finally:
+            self.metrics.observe_insert(table, time.perf_counter() - started)
+
+    def _send(self, table: str, rows: List[tuple]):
+        """Insert one batch into its table"""
+        if table == 'fact_requests':
+            self._count('rows_inserted', self.db_client.insert_rows(rows))
+        elif table == 'security_events':
+            self._count('events_inserted', self.db_client.insert_security_event_rows(rows))
+        elif table == 'fact_sessions':
+            self._count('sessions_inserted', self.db_client.insert_session_rows(rows))
+        else:
+            self._count('anomalies_inserted', self.db_client.insert_anomaly_rows(rows))
+
+    def _mark_unavailable(self):
+        """Route new batches to the spool until the next successful replay"""
+        self.available = False
+        self._next_probe = time.monotonic() + self.probe_interval
+
+    def _spool_files(self) -> List[str]:
+        """Spooled batch files, oldest first"""
+        if not os.path.isdir(self.spool_dir):
+            return []
+
+        return sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.pkl'))
+
+    def _spill(self, table: str, rows: List[tuple], rejected: bool = False):
+        """Persist a batch to the spool directory (set aside for inspection if rejected)"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        name = f"{time.time_ns():020d}-{os.getpid()}-{next(self._spool_sequence):06d}.{table}.pkl"
+        path = os.path.join(self.spool_dir, name)
+        if rejected:
+            path += '.rejected'
+
+        try:
+            with open(f"{path}.tmp", 'wb') as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.tmp", path)
+
+        except OSError as e:
+            logger.error(f"Could not spool {table} batch of {len(rows):,} rows: {e}")
+            if not rejected:
+                self._count('batches_failed')
+            return
+
+        if rejected:
+            return
+
+        self._count('batches_spilled')
+        if table == 'fact_requests':
+            self._count('rows_spilled', len(rows))
+
+        logger.info(f"Spooled {len(rows):,} {table} rows to {path}")
+
+    def _replay_spool(self):
+        """Insert spooled batches oldest first; stop at the first connection failure"""
+        if not self.available and time.monotonic() < self._next_probe:
+            return
+
+        # One thread replays at a time; the others carry on with queued batches
+        if not self._replay_lock.acquire(blocking=False):
+            return
+
+        try:
+            self._replay_spooled_batches()
+        finally:
+            self._replay_lock.release()
+
+    def _replay_spooled_batches(self):
+        """Replay loop behind _replay_spool (caller holds _replay_lock)"""
+        for name in self._spool_files():
+            path = os.path.join(self.spool_dir, name)
+            table = name.rsplit('.', 2)[1]
+
+            try:
+                with open(path, 'rb') as f:
+                    rows = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError) as e:
+                logger.error(f"Unreadable spooled batch {path}: {e}")
+                os.replace(path, f"{path}.rejected")
+                self._count('batches_rejected')
+                continue
+
+            try:
+                self._insert(table, rows)
+
+            except UNAVAILABLE_ERRORS as e:
+                logger.warning(f"ClickHouse still unavailable ({e}); {len(self._spool_files()):,} batches spooled")
+                self._mark_unavailable()
+                return
+
+            except Exception as e:
+                # The batch itself is bad; set it aside so it can't block the spool
+                logger.error(f"Rejected spooled batch {path}: {e}")
+                os.replace(path, f"{path}.rejected")
+                self._count('batches_rejected')
+                continue
+
+            os.remove(path)
+            self._count('batches_replayed')
+            if table == 'fact_requests':
+                self._count('rows_replayed', len(rows))
+
+            logger.info(f"Replayed {len(rows):,} spooled {table} rows")
+
+        if not self.available:
+            logger.info("ClickHouse available again; spool replayed")
+        self.available = True
+
+    def get_stats(self) -> Dict:
+        """Get writer statistics"""
+        return {
+            'rows_inserted': self.rows_inserted,
+            'events_inserted': self.events_inserted,
+            'sessions_inserted': self.sessions_inserted,
+            'anomalies_inserted': self.anomalies_inserted,
+            'retries': self.retries,
+            'batches_spilled': self.batches_spilled,
+            'rows_spilled': self.rows_spilled,
+            'batches_replayed': self.batches_replayed,
+            'rows_replayed': self.rows_replayed,
+            'batches_failed': self.batches_failed,
+            'batches_rejected': self.batches_rejected,
+            'batches_spooled': len(self._spool_files()),
+            'queued_batches': self.queue.qsize()
+        }
@@ -3,14 +3,151 @@ ClickHouse Client - Handles connection and data insertion
 """
 
 import logging
-from typing import List, Dict
-from datetime import datetime
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from datetime import datetime, timezone
 
 from clickhouse_driver import Client
+from database.client_pool import ClientPool
+from database.query_cache import QueryCache
 from parsers.log_parser import ParsedLogEntry
+from analyzers.sessionizer import SessionMetrics
+from analyzers.anomaly_detector import Anomaly
 
 logger = logging.getLogger(__name__)
 
+# Try to import the codecs clickhouse-driver needs for LZ4 compression
+try:
+    import lz4  # noqa: F401
+    import clickhouse_cityhash  # noqa: F401
+    COMPRESSION_AVAILABLE = True
+except ImportError:
+    COMPRESSION_AVAILABLE = False
+
+# fact_requests columns in entry_to_row order
+REQUEST_COLUMNS = (
+    'timestamp', 'method', 'path', 'query_string', 'http_version',
+    'status_code', 'response_bytes', 'response_time_ms',
+    'ip_address', 'user_agent', 'referer', 'session_id',
+    'is_bot', 'bot_type', 'device_type', 'browser', 'os',
+    'country_code', 'city', 'is_suspicious', 'attack_type', 'log_format'
+)
+
+# Rollup tables fed from fact_requests (see clickhouse_schema.sql), coarsest
+# first: (table, bucket seconds, retention in days or None for unlimited)
+ROLLUPS = (
+    ('rollup_requests_day', 86400, None),
+    ('rollup_requests_hour', 3600, None),
+    ('rollup_requests_minute', 60, 7)
+)
+
+# Query windows end now and start on a unit boundary in server time, the same
+# boundaries the rollup buckets use: 'day' matches date >= today() - N
+WINDOW_UNITS = {'day': 86400, 'hour': 3600, 'minute': 60}
+WINDOW_STARTS = {
+    'day': "toDateTime(today() - %(window)s)",
+    'hour': "toStartOfHour(now()) - INTERVAL %(window)s HOUR",
+    'minute': "toStartOfMinute(now()) - INTERVAL %(window)s MINUTE"
+}
+
+# Aggregate expressions per source. Rollups merge their stored sums and
+# states; fact_requests computes the same figures from raw rows. Latency
+# stats only count requests that logged a response time.
+ROLLUP_AGGREGATES = {
+    'time': 'bucket',
+    'requests': 'sum(requests)',
+    'bytes': 'sum(bytes)',
+    'bots': 'sumIf(requests, is_bot = 1)',
+    'client_errors': 'sum(client_errors)',
+    'server_errors': 'sum(server_errors)',
+    'avg_latency': 'ifNotFinite(sum(latency_sum) / sum(timed_requests), 0)',
+    'max_latency': 'max(latency_max)',
+    'quantiles': 'quantilesTDigestMerge(0.5, 0.95, 0.99)(latency)',
+    'visitors': 'uniqMerge(visitors)',
+    'days': 'uniqExact(toDate(bucket))'
+}
+RAW_AGGREGATES = {
+    'time': 'timestamp',
+    'requests': 'count()',
+    'bytes': 'sum(response_bytes)',
+    'bots': 'countIf(is_bot = 1)',
+    'client_errors': 'countIf(status_code >= 400 AND status_code < 500)',
+    'server_errors': 'countIf(status_code >= 500)',
+    'avg_latency': 'ifNotFinite(avgIf(response_time_ms, response_time_ms > 0), 0)',
+    'max_latency': 'max(response_time_ms)',
+    'quantiles': 'quantilesTDigestIf(0.5, 0.95, 0.99)(response_time_ms, response_time_ms > 0)',
+    'visitors': 'uniq(ip_address)',
+    'days': 'uniqExact(date)'
+}
+
+
+# fact_requests aggregates for approximate queries: HLL distinct counts and
+# counters scaled by {factor} (_sample_factor when reading a SAMPLE, else 1).
+# Distinct IPs cannot be scaled up from a request sample, so they come from
+# an unsampled HLL over the ip_address column alone.
+APPROX_AGGREGATES = {
+    **RAW_AGGREGATES,
+    'requests': 'toUInt64(sum({factor}))',
+    'bytes': 'toUInt64(sum(response_bytes * {factor}))',
+    'bots': 'toUInt64(sumIf({factor}, is_bot = 1))',
+    'client_errors': 'toUInt64(sumIf({factor}, status_code >= 400 AND status_code < 500))',
+    'server_errors': 'toUInt64(sumIf({factor}, status_code >= 500))',
+    'visitors': '(SELECT uniqCombined(17)(ip_address) FROM fact_requests WHERE {where})'
+}
+
+# Default fraction of fact_requests read by approximate queries
+APPROX_SAMPLE = 0.1
+
+# 95% relative error of the distinct-count sketches (1.96 standard errors):
+# uniq keeps an adaptive sample of up to 65536 hashes, uniqCombined(17)
+# uses 2^17 HyperLogLog registers (standard error 1.04 / sqrt(registers))
+UNIQ_ERROR = 1.96 / math.sqrt(65536)
+HLL_ERROR = 1.96 * 1.04 / math.sqrt(2 ** 17)
+
+# Max rank error of ClickHouse's t-digest quantiles (0.01 = 1 percentile)
+TDIGEST_RANK_ERROR = 0.01
+
+# Severity levels, lowest first
+SEVERITY_LEVELS = ('low', 'medium', 'high', 'critical')
+
+
+def _finite(value) -> float:
+    """Quantiles of an empty set come back as nan; report them as 0"""
+    return 0.0 if value is None or math.isnan(value) else float(value)
+
+
+def count_error(estimate: float, sample: float) -> float:
+    """
+    95% relative error of a count scaled up from a uniform row sample
+
+    The estimate came from about estimate * sample sampled rows, whose
+    binomial standard error relative to the count is sqrt((1 - p) / hits).
+
+    Args:
+        estimate: Scaled-up count
+        sample: Fraction of rows read (1.0 = exact)
+
+    Returns:
+        Relative error (0.05 = +/-5%)
+    """
+    if sample >= 1 or estimate <= 0:
+        return 0.0
+    return 1.96 * math.sqrt((1 - sample) / (estimate * sample))
+
+
+def quantile_rank_error(count: float, sample: float) -> float:
+    """
+    95% rank error of a t-digest quantile over a sample of count rows
+
+    t-digest's own error plus the sampling error of the median (the worst
+    case), so a reported p95 is the true value at roughly p95 +/- this rank.
+    """
+    if sample >= 1 or count <= 0:
+        return TDIGEST_RANK_ERROR
+    return TDIGEST_RANK_ERROR + 1.96 * math.sqrt(0.25 / (count * sample))
+
 
 class ClickHouseClient:
     """
@@ -23,15 +160,62 @@ class ClickHouseClient:
         port: int = 9000,
         database: str = 'logs',
         user: str = 'default',
-        password: str = ''
+        password: str = '',
+        columnar: bool = False,
+        compression: bool = False,
+        insert_connections: int = 1,
+        cache_ttl: float = 30.0,
+        read_connections: int = 0
     ):
-        self.client = Client(
-            host=host,
-            port=port,
-            database=database,
-            user=user,
-            password=password
-        )
+        """
+        Initialize client
+
+        Args:
+            host: ClickHouse host
+            port: Native protocol port
+            database: Database name
+            user: User name
+            password: Password
+            columnar: Send inserts as per-column arrays instead of row tuples
+            compression: LZ4-compress inserted blocks (needs lz4 and clickhouse-cityhash)
+            insert_connections: Max batches in flight via insert_rows_async; above 1,
+                the insert_* methods also use a connection per calling thread, so
+                several BufferedWriter threads can insert at once
+            cache_ttl: Seconds query() results are reused (0 disables caching)
+            read_connections: Pool this many connections for reads so threads
+                can query concurrently (0 = reads share the main connection)
+        """
+        if compression and not COMPRESSION_AVAILABLE:
+            logger.warning("Compression needs lz4 and clickhouse-cityhash (pip install clickhouse-driver[lz4]); disabled")
+            compression = False
+
+        self.columnar = columnar
+        self.insert_connections = max(1, insert_connections)
+        self._connection_params = {
+            'host': host,
+            'port': port,
+            'database': database,
+            'user': user,
+            'password': password,
+            'compression': compression
+        }
+
+        self.client = Client(**self._connection_params)
+
+        # clickhouse_driver clients are not thread-safe, so each in-flight
+        # insert runs on its own connection (created lazily per thread)
+        self._local = threading.local()
+        self._insert_clients = []
+        self._insert_pool = None
+        self._in_flight = threading.BoundedSemaphore(self.insert_connections)
+
+        # Read results are cached per query and bound parameters; inserts
+        # drop the entries of the table they write to
+        self.cache = QueryCache(ttl=cache_ttl) if cache_ttl > 0 else None
+        self.pool = ClientPool(
+            size=read_connections, host=host, port=port,
+            database=database, user=user, password=password
+        ) if read_connections > 0 else None
 
         logger.info(f"Connected to ClickHouse: {host}:{port}/{database}")
 
@@ -48,72 +232,421 @@ class ClickHouseClient:
         if not entries:
             return 0
 
-        # Convert entries to row tuples
-        rows = []
-        for entry in entries:
-            row = (
-                entry.timestamp,
-                entry.method,
-                entry.path,
-                entry.query_string,
-                entry.http_version,
-                entry.status_code,
-                entry.response_bytes,
-                entry.response_time_ms or 0,
-                entry.ip_address,
-                entry.user_agent,
-                entry.referer,
-                entry.session_id,
-                0,  # is_bot (will be updated by bot detector)
-                '',  # bot_type
-                '',  # device_type
-                '',  # browser
-                '',  # os
-                '',  # country_code
-                '',  # city
-                0,  # is_suspicious
-                '',  # attack_type
-                entry.log_format
+        if self.columnar:
+            return self.insert_columns(self.entries_to_columns(entries))
+
+        return self.insert_rows([self.entry_to_row(entry) for entry in entries])
+
+    @staticmethod
+    def entry_to_row(entry: ParsedLogEntry) -> tuple:
+        """Convert a ParsedLogEntry into a fact_requests row tuple"""
+        return (
+            entry.timestamp,
+            entry.method,
+            entry.path,
+            entry.query_string,
+            entry.http_version,
+            entry.status_code,
+            entry.response_bytes,
+            entry.response_time_ms or 0,
+            entry.ip_address,
+            entry.user_agent,
+            entry.referer,
+            entry.session_id,
+            int(entry.is_bot),
+            entry.bot_type,
+            entry.device_type,
+            entry.browser,
+            entry.os,
+            entry.country_code,
+            entry.city,
+            int(entry.is_suspicious),
+            entry.attack_type,
+            entry.log_format
+        )
+
+    @staticmethod
+    def entries_to_columns(entries: List[ParsedLogEntry]) -> List[list]:
+        """Convert ParsedLogEntry objects into fact_requests column arrays (REQUEST_COLUMNS order)"""
+        return [
+            [entry.timestamp for entry in entries],
+            [entry.method for entry in entries],
+            [entry.path for entry in entries],
+            [entry.query_string for entry in entries],
+            [entry.http_version for entry in entries],
+            [entry.status_code for entry in entries],
+            [entry.response_bytes for entry in entries],
+            [entry.response_time_ms or 0 for entry in entries],
+            [entry.ip_address for entry in entries],
+            [entry.user_agent for entry in entries],
+            [entry.referer for entry in entries],
+            [entry.session_id for entry in entries],
+            [int(entry.is_bot) for entry in entries],
+            [entry.bot_type for entry in entries],
+            [entry.device_type for entry in entries],
+            [entry.browser for entry in entries],
+            [entry.os for entry in entries],
+            [entry.country_code for entry in entries],
+            [entry.city for entry in entries],
+            [int(entry.is_suspicious) for entry in entries],
+            [entry.attack_type for entry in entries],
+            [entry.log_format for entry in entries]
+        ]
+
+    def insert_rows(self, rows: List[tuple], table: str = 'fact_requests') -> int:
+        """
+        Insert prepared row tuples (see entry_to_row) into fact_requests table
+
+        Args:
+            rows: List of row tuples
+            table: Target table with the fact_requests columns
+
+        Returns:
+            Number of rows inserted
+        """
+        if not rows:
+            return 0
+
+        if self.columnar:
+            # Transpose in C rather than letting the driver walk every row
+            return self.insert_columns([list(column) for column in zip(*rows)], table)
+
+        return self._execute_insert(self._insert_client(), table, rows, columnar=False)
+
+    def insert_columns(self, columns: List[list], table: str = 'fact_requests') -> int:
+        """
+        Insert fact_requests data as per-column arrays (REQUEST_COLUMNS order)
+
+        Args:
+            columns: One list per column, all the same length
+            table: Target table with the fact_requests columns
+
+        Returns:
+            Number of rows inserted
+        """
+        if not columns or not columns[0]:
+            return 0
+
+        return self._execute_insert(self._insert_client(), table, columns, columnar=True)
+
+    def insert_rows_async(self, rows: List[tuple], table: str = 'fact_requests') -> Future:
+        """
+        Insert row tuples on a background connection
+
+        At most insert_connections batches are in flight; further calls block
+        until one completes, so producers cannot outrun the database.
+
+        Returns:
+            Future resolving to the number of rows inserted (or raising the insert error)
+        """
+        if self._insert_pool is None:
+            self._insert_pool = ThreadPoolExecutor(
+                max_workers=self.insert_connections,
+                thread_name_prefix='clickhouse-insert'
             )
-            rows.append(row)
 
-        # Batch insert
+        self._in_flight.acquire()
+
+        try:
+            future = self._insert_pool.submit(self._insert_rows_on_thread, rows, table)
+        except Exception:
+            self._in_flight.release()
+            raise
+
+        future.add_done_callback(lambda _: self._in_flight.release())
+        return future
+
+    def _thread_client(self) -> Client:
+        """The calling thread's own insert connection (created on first use)"""
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(**self._connection_params)
+            self._insert_clients.append(client)
+        return client
+
+    def _insert_client(self) -> Client:
+        """Connection for a synchronous insert: shared unless inserts may run concurrently"""
+        if self.insert_connections == 1:
+            return self.client
+        return self._thread_client()
+
+    def _insert_rows_on_thread(self, rows: List[tuple], table: str) -> int:
+        """Run an insert on the calling pool thread's own connection"""
+        client = self._thread_client()
+
+        if self.columnar:
+            return self._execute_insert(client, table, [list(column) for column in zip(*rows)], columnar=True)
+
+        return self._execute_insert(client, table, rows, columnar=False)
+
+    def _execute_insert(self, client: Client, table: str, data: list, columnar: bool) -> int:
+        """Send one INSERT INTO table (REQUEST_COLUMNS) VALUES block"""
+        query = f"INSERT INTO {table} ({', '.join(REQUEST_COLUMNS)}) VALUES"
+        count = len(data[0]) if columnar else len(data)
+
+        try:
+            client.execute(query, data, columnar=columnar)
+            self.invalidate_cache(table)
+            logger.info(f"Inserted {count} rows into {table}")
+            return count
+
+        except Exception as e:
+            logger.error(f"Error inserting into {table}: {e}")
+            raise
+
+    def insert_security_event_rows(self, rows: List[tuple]) -> int:
+        """
+        Insert prepared rows into security_events table
+
+        Args:
+            rows: (timestamp, threat_type, severity, ip_address, user_agent,
+                   method, path, query_string, pattern_matched,
+                   confidence_score, action) tuples
+
+        Returns:
+            Number of rows inserted
+        """
+        if not rows:
+            return 0
+
+        query = """
+            INSERT INTO security_events
+            (timestamp, threat_type, severity, ip_address, user_agent,
+             method, path, query_string, pattern_matched,
+             confidence_score, action)
+            VALUES
+        """
+
+        try:
+            self._insert_client().execute(query, rows)
+            self.invalidate_cache('security_events')
+            logger.info(f"Inserted {len(rows)} security events")
+            return len(rows)
+
+        except Exception as e:
+            logger.error(f"Error inserting security events: {e}")
+            raise
+
+    @staticmethod
+    def session_to_row(session: SessionMetrics) -> tuple:
+        """Convert SessionMetrics into a fact_sessions row tuple"""
+        return (
+            session.session_id,
+            session.start_time,
+            session.end_time,
+            session.duration_seconds,
+            min(session.page_views, 65535),  # UInt16
+            min(session.unique_pages, 65535),
+            session.total_bytes,
+            int(round(session.avg_response_time_ms)),
+            session.entry_page,
+            session.exit_page,
+            session.pages_visited,
+            int(session.is_bounce),
+            int(session.converted),
+            session.ip_address,
+            session.user_agent
+        )
+
+    def insert_session_rows(self, rows: List[tuple]) -> int:
+        """
+        Insert prepared rows (see session_to_row) into fact_sessions table
+
+        Args:
+            rows: List of row tuples
+
+        Returns:
+            Number of rows inserted
+        """
+        if not rows:
+            return 0
+
         query = """
-            INSERT INTO fact_requests (
-                timestamp, method, path, query_string, http_version,
-                status_code, response_bytes, response_time_ms,
-                ip_address, user_agent, referer, session_id,
-                is_bot, bot_type, device_type, browser, os,
-                country_code, city, is_suspicious, attack_type, log_format
+            INSERT INTO fact_sessions (
+                session_id, start_time, end_time, duration_seconds,
+                page_views, unique_pages, total_bytes, avg_response_time_ms,
+                entry_page, exit_page, pages_visited, is_bounce, has_conversion,
+                ip_address, user_agent
             ) VALUES
         """
 
         try:
-            self.client.execute(query, rows)
-            logger.info(f"Inserted {len(rows)} requests into ClickHouse")
+            self._insert_client().execute(query, rows)
+            self.invalidate_cache('fact_sessions')
+            logger.info(f"Inserted {len(rows)} sessions into ClickHouse")
             return len(rows)
 
         except Exception as e:
-            logger.error(f"Error inserting into ClickHouse: {e}")
+            logger.error(f"Error inserting sessions: {e}")
             raise
 
-    def execute_query(self, query: str) -> List[tuple]:
+    @staticmethod
+    def anomaly_to_row(anomaly: Anomaly) -> tuple:
+        """Convert an Anomaly into an anomalies row tuple"""
+        context = anomaly.context
+        return (
+            datetime.now(timezone.utc),
+            anomaly.anomaly_type,
+            anomaly.severity,
+            anomaly.metric_name,
+            float(anomaly.expected_value),
+            float(anomaly.actual_value),
+            float(anomaly.deviation_score),
+            context.get('window_start', anomaly.timestamp),
+            context.get('window_end', anomaly.timestamp),
+            context.get('top_paths', []),
+            [],
+            anomaly.description
+        )
+
+    def insert_anomaly_rows(self, rows: List[tuple]) -> int:
+        """
+        Insert prepared rows (see anomaly_to_row) into anomalies table
+
+        Args:
+            rows: List of row tuples
+
+        Returns:
+            Number of rows inserted
+        """
+        if not rows:
+            return 0
+
+        query = """
+            INSERT INTO anomalies (
+                detected_at, anomaly_type, severity, metric_name,
+                expected_value, actual_value, deviation_score,
+                time_window_start, time_window_end,
+                affected_paths, affected_ips, description
+            ) VALUES
         """
-        Execute a SQL query
+
+        try:
+            self._insert_client().execute(query, rows)
+            self.invalidate_cache('anomalies')
+            logger.info(f"Inserted {len(rows)} anomalies into ClickHouse")
+            return len(rows)
+
+        except Exception as e:
+            logger.error(f"Error inserting anomalies: {e}")
+            raise
+
+    def execute_query(self, query: str, params: Optional[dict] = None) -> List[tuple]:
+        """
+        Execute a SQL query (uncached; on a pooled connection if configured)
 
         Args:
             query: SQL query string
+            params: Values for %(name)s placeholders
 
         Returns:
             List of result tuples
         """
         try:
-            result = self.client.execute(query)
-            return result
+            if self.pool is not None:
+                return self.pool.execute(query, params)
+            return self.client.execute(query, params)
         except Exception as e:
             logger.error(f"Error executing query: {e}")
             raise
 
+    def execute_iter(
+        self,
+        query: str,
+        params: Optional[dict] = None,
+        block_size: int = 100000
+    ) -> Iterator[tuple]:
+        """
+        Stream the rows of a large result instead of materializing it
+
+        Rows arrive from the server in blocks of block_size. The connection
+        stays busy until the iterator is exhausted or closed; a partially read
+        stream is discarded by reconnecting.
+
+        Args:
+            query: SQL query string
+            params: Values for %(name)s placeholders
+            block_size: Rows per block read from the server
+
+        Returns:
+            Iterator of result tuples
+        """
+        settings = {'max_block_size': block_size}
+
+        if self.pool is None:
+            yield from self._stream(self.client, query, params, settings)
+            return
+
+        with self.pool.connection() as client:
+            yield from self._stream(client, query, params, settings)
+
+    @staticmethod
+    def _stream(client: Client, query: str, params: Optional[dict], settings: dict) -> Iterator[tuple]:
+        """Iterate one execute_iter() result, disconnecting if abandoned midway"""
+        finished = False
+
+        try:
+            yield from client.execute_iter(query, params, settings=settings)
+            finished = True
+        finally:
+            if not finished:
+                client.disconnect()
+
+    def query(
+        self,
+        name: str,
+        query: str,
+        params: Optional[dict] = None,
+        table: str = 'fact_requests',
+        decode: Optional[Callable[[List[tuple]], Any]] = None
+    ) -> Any:
+        """
+        Run a read query through the result cache
+
+        Results are shared for cache_ttl seconds by every caller passing the
+        same query and parameters, and dropped as soon as this client inserts
+        into ``table``. Cached values are shared, so treat them as read-only.
+
+        Args:
+            name: Query name (logging and cache statistics)
+            query: SQL with %(name)s placeholders
+            params: Bound parameter values (must be hashable)
+            table: Table the result depends on, for invalidation
+            decode: Turns the result rows into the value that is cached
+
+        Returns:
+            decode(rows), or the rows themselves
+        """
+        params = params or {}
+
+        def load():
+            logger.debug(f"Running query '{name}' {params}")
+            rows = self.execute_query(query, params)
+            return decode(rows) if decode else rows
+
+        if self.cache is None:
+            return load()
+
+        key = (table, query, tuple(sorted(params.items())), self.cache.bucket())
+        return self.cache.get_or_load(key, load)
+
+    def invalidate_cache(self, table: Optional[str] = None):
+        """
+        Drop cached query results
+
+        Args:
+            table: Only drop results that depend on this table (default: all)
+        """
+        if self.cache is not None:
+            self.cache.invalidate(table)
+
+    def get_stats(self) -> Dict:
+        """Get query cache and read pool statistics"""
+        return {
+            'cache': self.cache.get_stats() if self.cache is not None else None,
+            'pool': self.pool.get_stats() if self.pool is not None else None
+        }
+
     def get_table_count(self, table: str) -> int:
         """Get row count for a table"""
         result = self.execute_query(f"SELECT count() FROM {table}")
@@ -125,99 +658,627 @@ class ClickHouseClient:
         result = self.execute_query(query)
         return result[0] if result else (None, None)
 
+    @staticmethod
+    def rollup_for(unit: str = 'day', window: int = 7, resolution: int = 0) -> Optional[str]:
+        """
+        Pick the coarsest rollup table that can answer a query
+
+        A rollup qualifies when its buckets are no wider than the window unit
+        (so the window start falls on a bucket boundary) and no wider than the
+        resolution the query groups by, and it still retains the whole window.
+
+        Args:
+            unit: Window unit ('day', 'hour' or 'minute')
+            window: Number of whole units before the current one
+            resolution: Seconds per output time bucket (0 = no time grouping)
+
+        Returns:
+            Rollup table name, or None when only fact_requests can answer
+        """
+        unit_seconds = WINDOW_UNITS[unit]
+        span_days = (window + 1) * unit_seconds / 86400
+
+        for table, seconds, retention_days in ROLLUPS:
+            if seconds > unit_seconds or (resolution and seconds > resolution):
+                continue
+            if retention_days is not None and span_days > retention_days:
+                continue
+            return table
+
+        return None
+
+    def _aggregate(
+        self,
+        name: str,
+        template: str,
+        unit: str = 'day',
+        window: int = 7,
+        resolution: int = 0,
+        params: Optional[dict] = None,
+        decode: Optional[Callable[[List[tuple]], Any]] = None,
+        approx: bool = False,
+        sample: float = 1.0
+    ) -> Any:
+        """
+        Run a cached aggregate query on the best rollup (or fact_requests)
+
+        The template names its source as {table}, its time filter as {where}
+        and aggregates by ROLLUP_AGGREGATES key, e.g. {requests}. Aliases must
+        not reuse rollup column names (requests, bytes, latency, ...), since
+        ClickHouse would substitute them inside the aggregates.
+
+        With approx, a query that has to read fact_requests uses
+        APPROX_AGGREGATES and reads a ``sample`` fraction of it (see
+        sample_for). Rollups are already sketches and are read as usual.
+        """
+        table = self.rollup_for(unit, window, resolution)
+        start = WINDOW_STARTS[unit]
+
+        if table:
+            query = template.format(table=table, where=f"bucket >= {start}", **ROLLUP_AGGREGATES)
+        elif approx:
+            where = f"date >= toDate({start}) AND timestamp >= {start}"
+            factor = '_sample_factor' if sample < 1 else '1'
+            aggregates = {key: value.format(factor=factor, where=where) for key, value in APPROX_AGGREGATES.items()}
+            source = f"fact_requests SAMPLE {sample:g}" if sample < 1 else 'fact_requests'
+            query = template.format(table=source, where=where, **aggregates)
+        else:
+            where = f"date >= toDate({start}) AND timestamp >= {start}"
+            query = template.format(table='fact_requests', where=where, **RAW_AGGREGATES)
+
+        logger.debug(f"Serving '{name}' ({unit} window {window}) from {table or 'fact_requests'}")
+        return self.query(name, query, {'window': int(window), **(params or {})}, decode=decode)
+
+    def sampling_supported(self) -> bool:
+        """Whether fact_requests has a SAMPLE BY key (tables created before it was added do not)"""
+        rows = self.query('sampling_key', """
+            SELECT sampling_key
+            FROM system.tables
+            WHERE database = currentDatabase() AND name = 'fact_requests'
+        """, table='system')
+
+        return bool(rows and rows[0][0])
+
+    def sample_for(self, sample: float = APPROX_SAMPLE) -> float:
+        """
+        Fraction of fact_requests an approximate query will actually read
+
+        Args:
+            sample: Requested fraction
+
+        Returns:
+            sample, or 1.0 when fact_requests cannot be sampled
+        """
+        if sample >= 1:
+            return 1.0
+
+        if not self.sampling_supported():
+            logger.warning("fact_requests has no SAMPLE BY key (created before sampling support); reading all rows")
+            return 1.0
+
+        return max(sample, 1e-6)
+
     def get_top_pages(self, days: int = 7, limit: int = 10) -> List[Dict]:
-        """Get top pages by request count"""
-        query = f"""
+        """
+        Get top pages by request count
+
+        Args:
+            days: Number of days to analyze
+            limit: Max pages returned
+
+        Returns:
+            List of dicts with path, requests, avg_latency, total_bytes and error_rate
+        """
+        def decode(rows):
+            return [
+                {
+                    'path': row[0],
+                    'requests': row[1],
+                    'avg_latency': round(row[2], 2),
+                    'total_bytes': row[3],
+                    'error_rate': round(row[4] / row[1] * 100, 2) if row[1] > 0 else 0
+                }
+                for row in rows
+            ]
+
+        return self._aggregate('top_pages', """
             SELECT
                 path,
-                count() as requests,
-                avg(response_time_ms) as avg_latency,
-                sum(response_bytes) as total_bytes
-            FROM fact_requests
-            WHERE date >= today() - {days}
+                {requests} AS total_requests,
+                {avg_latency} AS avg_latency_ms,
+                {bytes} AS total_bytes,
+                {client_errors} + {server_errors} AS errors
+            FROM {table}
+            WHERE {where}
             GROUP BY path
-            ORDER BY requests DESC
-            LIMIT {limit}
+            ORDER BY total_requests DESC
+            LIMIT %(limit)s
+        """, 'day', days, params={'limit': int(limit)}, decode=decode)
+
+    def get_performance_metrics(
+        self,
+        path: Optional[str] = None,
+        days: int = 7,
+        approx: bool = False,
+        sample: float = APPROX_SAMPLE
+    ) -> Dict:
         """
+        Get latency and error metrics for one endpoint or all of them
 
-        results = self.execute_query(query)
+        Args:
+            path: Exact request path (None = every endpoint)
+            days: Number of days to analyze
+            approx: Sample raw rows if no rollup applies, and report error_bounds
+            sample: Fraction of raw rows read in approx mode
 
-        return [
-            {
-                'path': row[0],
-                'requests': row[1],
-                'avg_latency': round(row[2], 2),
-                'total_bytes': row[3]
+        Returns:
+            Dict of request count, latency percentiles, error counts and rates,
+            and the first/last day seen (empty when there is no traffic)
+        """
+        rollup = self.rollup_for('day', days)
+        sample = self.sample_for(sample) if approx and not rollup else 1.0
+
+        template = """
+            SELECT
+                {requests} AS total_requests,
+                {quantiles} AS latency_quantiles,
+                {max_latency} AS max_latency_ms,
+                {avg_latency} AS avg_latency_ms,
+                {server_errors} AS total_server_errors,
+                {client_errors} AS total_client_errors,
+                toDate(min({time})) AS start_date,
+                toDate(max({time})) AS end_date
+            FROM {table}
+            WHERE {where}
+        """
+
+        if path:
+            template += "AND path = %(path)s"
+
+        def decode(rows):
+            if not rows or not rows[0][0]:
+                return {}
+
+            row = rows[0]
+            p50, p95, p99 = (_finite(q) for q in row[1])
+            error_rate = round((row[4] + row[5]) / row[0] * 100, 2)
+
+            metrics = {
+                'total_requests': row[0],
+                'p50_latency': round(p50, 2),
+                'p95_latency': round(p95, 2),
+                'p99_latency': round(p99, 2),
+                'max_latency': row[2],
+                'avg_latency': round(row[3], 2),
+                'server_errors': row[4],
+                'client_errors': row[5],
+                'error_rate': error_rate,
+                'success_rate': round(100 - error_rate, 2),
+                'start_date': row[6],
+                'end_date': row[7]
             }
-            for row in results
-        ]
 
-    def get_performance_metrics(self, path: str = None, days: int = 7) -> Dict:
-        """Get performance metrics for endpoint(s)"""
-        where_clause = f"AND path = '{path}'" if path else ""
+            if approx:
+                metrics['sample'] = sample
+                metrics['error_bounds'] = {
+                    'total_requests': count_error(row[0], sample),
+                    'errors': count_error(row[4] + row[5], sample),
+                    'latency_rank': quantile_rank_error(row[0], sample)
+                }
 
-        query = f"""
+            return metrics
+
+        return self._aggregate(
+            'performance', template, 'day', days, params={'path': path},
+            decode=decode, approx=approx, sample=sample
+        )
+
+    def get_bot_stats(self, days: int = 7) -> Dict:
+        """
+        Get bot traffic statistics, with requests per bot type
+
+        Args:
+            days: Number of days to analyze
+
+        Returns:
+            Dict of bot/human/total requests, bot_percentage and bot_breakdown
+            (empty when there is no traffic)
+        """
+        def decode(rows):
+            if not rows:
+                return {}
+
+            total = sum(row[2] for row in rows)
+            bots = sum(row[2] for row in rows if row[0])
+            breakdown = {}
+            for is_bot, bot_type, count in rows:
+                if is_bot:
+                    breakdown[bot_type or 'unknown'] = breakdown.get(bot_type or 'unknown', 0) + count
+
+            return {
+                'bot_requests': bots,
+                'human_requests': total - bots,
+                'total_requests': total,
+                'bot_percentage': round(bots / total * 100, 2) if total > 0 else 0,
+                'bot_breakdown': breakdown
+            }
+
+        return self._aggregate('bot_stats', """
+            SELECT is_bot, bot_type, {requests} AS total_requests
+            FROM {table}
+            WHERE {where}
+            GROUP BY is_bot, bot_type
+        """, 'day', days, decode=decode)
+
+    def get_traffic_summary(
+        self,
+        days: int = 7,
+        hours: int = 0,
+        approx: bool = False,
+        sample: float = APPROX_SAMPLE
+    ) -> Dict:
+        """
+        Get overall traffic volume, latency, error and bot figures
+
+        Args:
+            days: Whole days before today to include
+            hours: If set, whole hours before the current one instead of days
+            approx: Sample raw rows if no rollup applies, and report error_bounds
+            sample: Fraction of raw rows read in approx mode
+
+        Returns:
+            Dict of summary figures (empty when there is no traffic); with
+            approx also the sample read and 95% relative error_bounds
+        """
+        unit, window = ('hour', hours) if hours else ('day', days)
+        rollup = self.rollup_for(unit, window)
+        sample = self.sample_for(sample) if approx and not rollup else 1.0
+
+        def decode(rows):
+            if not rows or not rows[0][0]:
+                return {}
+
+            row = rows[0]
+            p50, p95, p99 = (_finite(q) for q in row[5])
+
+            summary = {
+                'total_requests': row[0],
+                'days': row[1],
+                'unique_ips': row[2],
+                'total_bytes': row[3],
+                'avg_latency': row[4],
+                'p50_latency': p50,
+                'p95_latency': p95,
+                'p99_latency': p99,
+                'errors': row[6],
+                'bot_requests': row[7]
+            }
+
+            if approx:
+                summary['sample'] = sample
+                summary['error_bounds'] = {
+                    'total_requests': count_error(row[0], sample),
+                    'unique_ips': UNIQ_ERROR if rollup else HLL_ERROR,
+                    'errors': count_error(row[6], sample),
+                    'bot_requests': count_error(row[7], sample),
+                    'latency_rank': quantile_rank_error(row[0], sample)
+                }
+
+            return summary
+
+        return self._aggregate('traffic_summary', """
             SELECT
-                count() as total_requests,
-                quantile(0.50)(response_time_ms) as p50,
-                quantile(0.95)(response_time_ms) as p95,
-                quantile(0.99)(response_time_ms) as p99,
-                max(response_time_ms) as max_latency,
-                avg(response_time_ms) as avg_latency,
-                countIf(status_code >= 500) as server_errors,
-                countIf(status_code >= 400 AND status_code < 500) as client_errors
-            FROM fact_requests
-            WHERE date >= today() - {days}
-            {where_clause}
+                {requests} AS total_requests,
+                {days} AS active_days,
+                {visitors} AS unique_ips,
+                {bytes} AS total_bytes,
+                {avg_latency} AS avg_latency_ms,
+                {quantiles} AS latency_quantiles,
+                {client_errors} + {server_errors} AS errors,
+                {bots} AS bot_requests
+            FROM {table}
+            WHERE {where}
+        """, unit, window, decode=decode, approx=approx, sample=sample)
+
+    def get_slowest_endpoints(
+        self,
+        threshold: int = 1000,
+        days: int = 7,
+        limit: int = 20,
+        min_requests: int = 100
+    ) -> List[Dict]:
         """
+        Get endpoints whose P95 latency exceeds threshold, slowest first
 
-        result = self.execute_query(query)
+        Args:
+            threshold: P95 latency threshold in milliseconds
+            days: Number of days to analyze
+            limit: Max endpoints returned
+            min_requests: Ignore endpoints with fewer requests
 
-        if not result:
-            return {}
+        Returns:
+            List of dicts with path, p50, p95, p99 and requests
+        """
+        def decode(rows):
+            return [
+                {
+                    'path': path,
+                    'p50': _finite(quantiles[0]),
+                    'p95': _finite(quantiles[1]),
+                    'p99': _finite(quantiles[2]),
+                    'requests': requests
+                }
+                for path, quantiles, requests in rows
+            ]
 
-        row = result[0]
-        return {
-            'total_requests': row[0],
-            'p50_latency': round(row[1], 2),
-            'p95_latency': round(row[2], 2),
-            'p99_latency': round(row[3], 2),
-            'max_latency': row[4],
-            'avg_latency': round(row[5], 2),
-            'server_errors': row[6],
-            'client_errors': row[7],
-            'error_rate': round((row[6] + row[7]) / row[0] * 100, 2) if row[0] > 0 else 0
+        return self._aggregate('slowest_endpoints', """
+            SELECT
+                path,
+                {quantiles} AS latency_quantiles,
+                {requests} AS total_requests
+            FROM {table}
+            WHERE {where}
+            GROUP BY path
+            HAVING latency_quantiles[2] > %(threshold)s AND total_requests > %(min_requests)s
+            ORDER BY latency_quantiles[2] DESC
+            LIMIT %(limit)s
+        """, 'day', days, params={
+            'threshold': int(threshold),
+            'min_requests': int(min_requests),
+            'limit': int(limit)
+        }, decode=decode)
+
+    @staticmethod
+    def _top_ips_query(limit: int, approx: bool = False, sample: float = 1.0) -> str:
+        """Per-IP totals from fact_requests (IPs are not kept in the rollups)"""
+        factor = '_sample_factor' if sample < 1 else '1'
+
+        if approx:
+            requests = f"toUInt64(sum({factor}))"
+            pages = "uniqCombined(17)(path)"
+            errors = f"toUInt64(sumIf({factor}, status_code >= 400))"
+        else:
+            requests, pages, errors = "count()", "uniqExact(path)", "countIf(status_code >= 400)"
+
+        return f"""
+            SELECT
+                ip_address,
+                {requests} AS total_requests,
+                {pages} AS unique_pages,
+                {errors} AS errors,
+                ifNotFinite(avgIf(response_time_ms, response_time_ms > 0), 0) AS avg_latency_ms,
+                max(is_bot) AS bot
+            FROM fact_requests {f'SAMPLE {sample:g}' if sample < 1 else ''}
+            WHERE date >= today() - %(days)s
+            GROUP BY ip_address
+            ORDER BY total_requests DESC
+            {'LIMIT %(limit)s' if limit else ''}
+        """
+
+    @staticmethod
+    def _top_ip_row(row: tuple, approx: bool = False, sample: float = 1.0) -> Dict:
+        """Turn a _top_ips_query() row into a dict"""
+        result = {
+            'ip_address': row[0],
+            'requests': row[1],
+            'unique_pages': row[2],
+            'errors': row[3],
+            'avg_latency': row[4],
+            'is_bot': bool(row[5])
         }
 
-    def get_bot_stats(self, days: int = 7) -> Dict:
-        """Get bot traffic statistics"""
-        query = f"""
+        if approx:
+            # Pages seen in a request sample undercount, so unique_pages is a lower bound
+            result['requests_error'] = count_error(row[1], sample)
+
+        return result
+
+    def get_top_ips(
+        self,
+        days: int = 1,
+        limit: int = 10,
+        approx: bool = False,
+        sample: float = APPROX_SAMPLE
+    ) -> List[Dict]:
+        """
+        Get the busiest client IPs
+
+        Args:
+            days: Number of days to analyze
+            limit: Max IPs returned
+            approx: Read a sample of fact_requests and add requests_error
+            sample: Fraction of rows read in approx mode
+
+        Returns:
+            List of dicts with ip_address, requests, unique_pages, errors,
+            avg_latency and is_bot
+        """
+        sample = self.sample_for(sample) if approx else 1.0
+
+        return self.query(
+            'top_ips',
+            self._top_ips_query(limit, approx, sample),
+            {'days': int(days), 'limit': int(limit)},
+            decode=lambda rows: [self._top_ip_row(row, approx, sample) for row in rows]
+        )
+
+    def iter_top_ips(
+        self,
+        days: int = 1,
+        limit: int = 0,
+        block_size: int = 100000,
+        approx: bool = False,
+        sample: float = APPROX_SAMPLE
+    ) -> Iterator[Dict]:
+        """
+        Stream client IPs by request count without materializing the result
+
+        Args:
+            days: Number of days to analyze
+            limit: Max IPs returned (0 = every IP)
+            block_size: Rows per block read from the server
+            approx: Read a sample of fact_requests and add requests_error
+            sample: Fraction of rows read in approx mode
+
+        Returns:
+            Iterator of dicts shaped like get_top_ips() results
+        """
+        sample = self.sample_for(sample) if approx else 1.0
+
+        rows = self.execute_iter(
+            self._top_ips_query(limit, approx, sample),
+            {'days': int(days), 'limit': int(limit)},
+            block_size=block_size
+        )
+
+        return (self._top_ip_row(row, approx, sample) for row in rows)
+
+    def get_threat_summary(self, days: int = 1, min_severity: str = 'medium') -> List[Dict]:
+        """
+        Get security events grouped by threat type and severity
+
+        Args:
+            days: Number of days to analyze
+            min_severity: Lowest severity included (low, medium, high, critical)
+
+        Returns:
+            List of dicts with threat_type, severity, count and source_ips,
+            most frequent first
+        """
+        severities = SEVERITY_LEVELS[SEVERITY_LEVELS.index(min_severity):]
+
+        def decode(rows):
+            return [
+                {
+                    'threat_type': row[0],
+                    'severity': row[1],
+                    'count': row[2],
+                    'source_ips': row[3]
+                }
+                for row in rows
+            ]
+
+        query = """
             SELECT
-                countIf(is_bot = 1) as bot_requests,
-                countIf(is_bot = 0) as human_requests,
-                count() as total_requests
+                threat_type,
+                severity,
+                count() AS threat_count,
+                groupUniqArray(100)(ip_address) AS source_ips
+            FROM security_events
+            WHERE timestamp >= toDateTime(today() - %(days)s)
+              AND severity IN %(severities)s
+            GROUP BY threat_type, severity
+            ORDER BY threat_count DESC
+        """
+
+        params = {'days': int(days), 'severities': severities}
+        return self.query('threat_summary', query, params, table='security_events', decode=decode)
+
+    def get_session_request_columns(self, days: int = 1) -> Dict[str, list]:
+        """
+        Fetch the request columns Sessionizer.sessionize_columns() needs
+
+        Rows come back ordered by (session_id, timestamp), so the result can
+        be passed with presorted=True.
+
+        Args:
+            days: Number of days of requests to fetch
+
+        Returns:
+            Dict of column name to list of values
+        """
+        names = (
+            'session_id', 'timestamp', 'path', 'response_bytes',
+            'response_time_ms', 'ip_address', 'user_agent', 'is_bot'
+        )
+
+        query = f"""
+            SELECT {', '.join(names)}
             FROM fact_requests
-            WHERE date >= today() - {days}
+            WHERE date >= today() - %(days)s
+            ORDER BY session_id, timestamp
         """
 
-        result = self.execute_query(query)
+        try:
+            result = self.client.execute(query, {'days': int(days)}, columnar=True)
+        except Exception as e:
+            logger.error(f"Error executing query: {e}")
+            raise
 
         if not result:
-            return {}
+            return {name: [] for name in names}
 
-        row = result[0]
-        total = row[2]
+        return {name: list(column) for name, column in zip(names, result)}
 
-        return {
-            'bot_requests': row[0],
-            'human_requests': row[1],
-            'total_requests': total,
-            'bot_percentage': round(row[0] / total * 100, 2) if total > 0 else 0
-        }
+    def iter_session_paths(
+        self,
+        days: int = 7,
+        max_depth: int = 0,
+        block_size: int = 100000
+    ) -> Iterator[tuple]:
+        """
+        Stream (pages_visited, has_conversion) for every session in fact_sessions
+
+        Rows arrive in blocks of block_size, so tens of millions of sessions
+        can be fed to Sessionizer.find_common_paths() without materializing them.
+
+        Args:
+            days: Number of days of sessions to read
+            max_depth: Only fetch the first max_depth pages of each session (0 = all)
+            block_size: Rows per block read from the server
+
+        Returns:
+            Iterator of (pages, has_conversion) tuples
+        """
+        pages = "arraySlice(pages_visited, 1, %(max_depth)s)" if max_depth else "pages_visited"
+
+        query = f"""
+            SELECT {pages}, has_conversion
+            FROM fact_sessions
+            WHERE start_time >= now() - INTERVAL %(days)s DAY
+        """
+
+        return self.execute_iter(query, {'days': int(days), 'max_depth': int(max_depth)}, block_size=block_size)
+
+    def get_endpoint_series(self, minutes: int = 1440) -> List[Dict]:
+        """
+        Get per-endpoint, per-minute traffic for AnomalyDetector.detect_endpoint_anomalies()
+
+        Args:
+            minutes: Number of minutes of history to fetch
+
+        Returns:
+            List of dicts with timestamp, endpoint, request_count,
+            avg_response_time_ms and error_count
+        """
+        def decode(rows):
+            return [
+                {
+                    'timestamp': row[0],
+                    'endpoint': row[1],
+                    'request_count': row[2],
+                    'avg_response_time_ms': row[3],
+                    'error_count': row[4]
+                }
+                for row in rows
+            ]
+
+        return self._aggregate('endpoint_series', """
+            SELECT
+                toStartOfMinute({time}) AS minute,
+                path,
+                {requests} AS total_requests,
+                {avg_latency} AS avg_latency_ms,
+                {server_errors} AS errors
+            FROM {table}
+            WHERE {where}
+            GROUP BY minute, path
+            ORDER BY minute
+        """, 'minute', minutes, resolution=60, decode=decode)
 
     def get_security_events(self, days: int = 1, limit: int = 50) -> List[Dict]:
         """Get recent security events"""
-        query = f"""
+        query = """
             SELECT
                 timestamp,
                 threat_type,
@@ -227,25 +1288,27 @@ class ClickHouseClient:
                 pattern_matched,
                 action
             FROM security_events
-            WHERE timestamp >= now() - INTERVAL {days} DAY
+            WHERE timestamp >= now() - INTERVAL %(days)s DAY
             ORDER BY timestamp DESC
-            LIMIT {limit}
+            LIMIT %(limit)s
         """
 
-        results = self.execute_query(query)
+        def decode(rows):
+            return [
+                {
+                    'timestamp': row[0],
+                    'threat_type': row[1],
+                    'severity': row[2],
+                    'ip_address': row[3],
+                    'path': row[4],
+                    'pattern_matched': row[5],
+                    'action': row[6]
+                }
+                for row in rows
+            ]
 
-        return [
-            {
-                'timestamp': row[0],
-                'threat_type': row[1],
-                'severity': row[2],
-                'ip_address': row[3],
-                'path': row[4],
-                'pattern_matched': row[5],
-                'action': row[6]
-            }
-            for row in results
-        ]
+        params = {'days': int(days), 'limit': int(limit)}
+        return self.query('security_events', query, params, table='security_events', decode=decode)
 
     def insert_security_event(
         self,
@@ -283,11 +1346,23 @@ class ClickHouseClient:
 
         try:
             self.client.execute(query, [row])
+            self.invalidate_cache('security_events')
         except Exception as e:
             logger.error(f"Error inserting security event: {e}")
 
     def close(self):
-        """Close database connection"""
+        """Wait for in-flight inserts and close database connections"""
+        if self._insert_pool is not None:
+            self._insert_pool.shutdown(wait=True)
+            self._insert_pool = None
+
+        for client in self._insert_clients:
+            client.disconnect()
+        self._insert_clients = []
+
+        if self.pool is not None:
+            self.pool.close()
+
         self.client.disconnect()
 
 
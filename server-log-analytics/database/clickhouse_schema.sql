@@ -51,7 +51,10 @@ CREATE TABLE IF NOT EXISTS fact_requests (
 
 ) ENGINE = MergeTree()
 PARTITION BY toYYYYMM(date)
-ORDER BY (date, timestamp)
+-- Within each hour rows are ordered by the sampling hash, so SAMPLE 0.1
+-- reads a contiguous tenth of every hour instead of the whole table
+ORDER BY (date, toStartOfHour(timestamp), cityHash64(request_id))
+SAMPLE BY cityHash64(request_id)
 SETTINGS index_granularity = 8192;
 
 -- Indexes for common queries
@@ -83,7 +86,7 @@ CREATE TABLE IF NOT EXISTS fact_sessions (
     -- Pages
     entry_page String,
     exit_page String,
-    pages_visited Array(String),
+    pages_visited Array(String),  -- Visit order, revisits included (first 100 requests)
 
     -- Behavior
     is_bounce UInt8,
@@ -201,55 +204,117 @@ SETTINGS index_granularity = 8192;
 
 
 -- ============================================
--- MATERIALIZED VIEWS (for common aggregations)
+-- ROLLUPS (minute / hour / day pre-aggregates)
 -- ============================================
+-- One row per (bucket, path, is_bot, bot_type), kept current by the
+-- materialized views below. Counters are plain sums; latency quantiles and
+-- unique visitors are stored as aggregate states, so any range of buckets
+-- merges to the same answer a scan of fact_requests would give. Latency
+-- stats cover requests that logged a response time (response_time_ms > 0).
+--
+-- Read them with sum(requests), uniqMerge(visitors),
+-- quantilesTDigestMerge(0.5, 0.95, 0.99)(latency) and
+-- sum(latency_sum) / sum(timed_requests). ClickHouseClient picks the
+-- coarsest table whose buckets line up with the query's window.
+
+CREATE TABLE IF NOT EXISTS rollup_requests_minute (
+    bucket DateTime,
+    path String,
+    is_bot UInt8,
+    bot_type LowCardinality(String),
 
--- Hourly traffic statistics
-CREATE MATERIALIZED VIEW IF NOT EXISTS mv_hourly_traffic
-ENGINE = SumMingMergeTree()
-PARTITION BY toYYYYMM(hour)
-ORDER BY hour
+    requests SimpleAggregateFunction(sum, UInt64),
+    bytes SimpleAggregateFunction(sum, UInt64),
+    client_errors SimpleAggregateFunction(sum, UInt64),
+    server_errors SimpleAggregateFunction(sum, UInt64),
+    timed_requests SimpleAggregateFunction(sum, UInt64),
+    latency_sum SimpleAggregateFunction(sum, UInt64),
+    latency_max SimpleAggregateFunction(max, UInt32),
+    latency AggregateFunction(quantilesTDigest(0.5, 0.95, 0.99), UInt32),
+    visitors AggregateFunction(uniq, IPv4)
+
+) ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMMDD(bucket)
+ORDER BY (bucket, path, is_bot, bot_type)
+TTL bucket + INTERVAL 7 DAY DELETE;
+
+CREATE TABLE IF NOT EXISTS rollup_requests_hour AS rollup_requests_minute
+ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(bucket)
+ORDER BY (bucket, path, is_bot, bot_type);
+
+CREATE TABLE IF NOT EXISTS rollup_requests_day AS rollup_requests_minute
+ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(bucket)
+ORDER BY (bucket, path, is_bot, bot_type);
+
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_rollup_requests_minute
+TO rollup_requests_minute
 AS SELECT
-    toStartOfHour(timestamp) AS hour,
+    toStartOfMinute(timestamp) AS bucket,
+    path,
+    is_bot,
+    bot_type,
     count() AS requests,
-    uniq(ip_address) AS unique_ips,
-    sum(response_bytes) AS total_bytes,
-    avg(response_time_ms) AS avg_response_time,
-    quantile(0.95)(response_time_ms) AS p95_response_time,
-    sum(status_code >= 500) AS server_errors,
-    sum(status_code >= 400 AND status_code < 500) AS client_errors
+    sum(response_bytes) AS bytes,
+    countIf(status_code >= 400 AND status_code < 500) AS client_errors,
+    countIf(status_code >= 500) AS server_errors,
+    countIf(response_time_ms > 0) AS timed_requests,
+    sum(response_time_ms) AS latency_sum,
+    max(response_time_ms) AS latency_max,
+    quantilesTDigestStateIf(0.5, 0.95, 0.99)(response_time_ms, response_time_ms > 0) AS latency,
+    uniqState(ip_address) AS visitors
 FROM fact_requests
-GROUP BY hour;
+GROUP BY bucket, path, is_bot, bot_type;
 
 
--- Top pages by traffic (daily)
-CREATE MATERIALIZED VIEW IF NOT EXISTS mv_top_pages_daily
-ENGINE = SumMingMergeTree()
-PARTITION BY date
-ORDER BY (date, requests DESC)
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_rollup_requests_hour
+TO rollup_requests_hour
 AS SELECT
-    date,
+    toStartOfHour(timestamp) AS bucket,
     path,
+    is_bot,
+    bot_type,
     count() AS requests,
-    avg(response_time_ms) AS avg_latency,
-    sum(response_bytes) AS total_bytes
+    sum(response_bytes) AS bytes,
+    countIf(status_code >= 400 AND status_code < 500) AS client_errors,
+    countIf(status_code >= 500) AS server_errors,
+    countIf(response_time_ms > 0) AS timed_requests,
+    sum(response_time_ms) AS latency_sum,
+    max(response_time_ms) AS latency_max,
+    quantilesTDigestStateIf(0.5, 0.95, 0.99)(response_time_ms, response_time_ms > 0) AS latency,
+    uniqState(ip_address) AS visitors
 FROM fact_requests
-GROUP BY date, path;
+GROUP BY bucket, path, is_bot, bot_type;
 
 
--- Bot traffic statistics (daily)
-CREATE MATERIALIZED VIEW IF NOT EXISTS mv_bot_stats_daily
-ENGINE = SumMingMergeTree()
-PARTITION BY date
-ORDER BY date
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_rollup_requests_day
+TO rollup_requests_day
 AS SELECT
-    date,
+    toStartOfDay(timestamp) AS bucket,
+    path,
     is_bot,
     bot_type,
     count() AS requests,
-    sum(response_bytes) AS bytes_transferred
+    sum(response_bytes) AS bytes,
+    countIf(status_code >= 400 AND status_code < 500) AS client_errors,
+    countIf(status_code >= 500) AS server_errors,
+    countIf(response_time_ms > 0) AS timed_requests,
+    sum(response_time_ms) AS latency_sum,
+    max(response_time_ms) AS latency_max,
+    quantilesTDigestStateIf(0.5, 0.95, 0.99)(response_time_ms, response_time_ms > 0) AS latency,
+    uniqState(ip_address) AS visitors
 FROM fact_requests
-GROUP BY date, is_bot, bot_type;
+GROUP BY bucket, path, is_bot, bot_type;
+
+-- Views only see rows inserted after they exist. To add a rollup over
+-- requests already loaded without stopping ingestion, create its view with
+-- WHERE ingested_at >= <cutoff> (a moment after the view exists), then once
+-- inserts started before the cutoff are done, backfill the rows before it:
+--   INSERT INTO rollup_requests_day SELECT ... FROM fact_requests
+--   WHERE ingested_at < <cutoff> GROUP BY ...;
+-- (scripts/init_db.py does this automatically for empty rollups.)
 
 
 -- ============================================
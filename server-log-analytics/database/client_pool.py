@@ -0,0 +1,121 @@
+"""
+Client Pool - Shares a few ClickHouse connections between threads
+Used by read paths that serve many concurrent callers (the dashboard)
+"""
+
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from clickhouse_driver import Client
+
+logger = logging.getLogger(__name__)
+
+
+class ClientPool:
+    """
+    Fixed-size pool of clickhouse_driver clients
+
+    A Client holds one connection and is not thread-safe, so every caller
+    borrows its own for the duration of a query. Clients are created lazily
+    up to ``size``; callers beyond that wait up to ``timeout`` seconds for
+    one to be returned. A client whose query failed is disconnected before it
+    goes back, so the next borrower reconnects cleanly.
+    """
+
+    def __init__(
+        self,
+        size: int = 4,
+        timeout: float = 30.0,
+        host: str = 'localhost',
+        port: int = 9000,
+        database: str = 'logs',
+        user: str = 'default',
+        password: str = ''
+    ):
+        """
+        Initialize pool
+
+        Args:
+            size: Max open connections
+            timeout: Seconds to wait for a free connection
+            host: ClickHouse host
+            port: Native protocol port
+            database: Database name
+            user: User name
+            password: Password
+        """
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._connection_params = {
+            'host': host,
+            'port': port,
+            'database': database,
+            'user': user,
+            'password': password
+        }
+
+        # Most recently returned first, so idle connections stay warm
+        self._idle = queue.LifoQueue()
+        self._clients: List[Client] = []
+        self._lock = threading.Lock()
+
+        self.borrows = 0
+        self.waits = 0
+
+    @contextmanager
+    def connection(self) -> Iterator[Client]:
+        """Borrow a client for one or more queries"""
+        client = self._acquire()
+
+        try:
+            yield client
+        except Exception:
+            client.disconnect()
+            raise
+        finally:
+            self._idle.put(client)
+
+    def _acquire(self) -> Client:
+        """Take an idle client, create one if below size, else wait"""
+        self.borrows += 1
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._clients) < self.size:
+                client = Client(**self._connection_params)
+                self._clients.append(client)
+                return client
+
+        self.waits += 1
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No ClickHouse connection free after {self.timeout:g}s (pool size {self.size})")
+
+    def execute(self, query: str, params: Optional[dict] = None, **kwargs) -> list:
+        """Run one query on a pooled client (see Client.execute)"""
+        with self.connection() as client:
+            return client.execute(query, params, **kwargs)
+
+    def close(self):
+        """Disconnect every client"""
+        with self._lock:
+            for client in self._clients:
+                client.disconnect()
+
+    def get_stats(self) -> Dict:
+        """Get pool statistics"""
+        return {
+            'size': self.size,
+            'open': len(self._clients),
+            'idle': self._idle.qsize(),
+            'borrows': self.borrows,
+            'waits': self.waits
+        }
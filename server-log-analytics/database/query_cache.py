@@ -0,0 +1,136 @@
+"""
+Query Cache - Time-bounded cache for query results
+Concurrent requests for the same key share one query instead of each running it
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCache:
+    """
+    TTL result cache with single-flight loading
+
+    Results are kept for ``ttl`` seconds, least-recently-used evicted past
+    ``max_entries``. When several threads miss on the same key at once, one
+    runs the loader and the rest wait for its result, so a burst of identical
+    requests costs one query.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 256):
+        """
+        Initialize cache
+
+        Args:
+            ttl: Seconds a result is served before it is reloaded
+            max_entries: Max cached results
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._loading: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bucket(self, now: Optional[float] = None) -> int:
+        """
+        Index of the current ``ttl``-long wall-clock interval
+
+        Put it in a key so every caller reloads at the same moment rather
+        than each at its own first miss.
+        """
+        return int((time.time() if now is None else now) // self.ttl) if self.ttl > 0 else 0
+
+    def _fresh(self, key: Hashable):
+        """Return (True, value) for an unexpired entry; caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            return True, entry[1]
+        return False, None
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Cached value for key, running loader() on a miss
+
+        Args:
+            key: Hashable cache key (e.g. query name, parameters, bucket())
+            loader: Computes the value; exceptions propagate and nothing is cached
+
+        Returns:
+            Cached or freshly loaded value
+        """
+        with self._lock:
+            found, value = self._fresh(key)
+            if found:
+                self.hits += 1
+                return value
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have loaded it while this one waited
+            with self._lock:
+                found, value = self._fresh(key)
+                if found:
+                    self.hits += 1
+                    return value
+
+            try:
+                value = loader()
+            except BaseException:
+                with self._lock:
+                    self._release_loading(key, key_lock)
+                raise
+
+            # Publish the value and retire the loading lock together, so a
+            # thread that misses after this finds the entry, not a free lock
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+                self._release_loading(key, key_lock)
+
+        return value
+
+    def _release_loading(self, key: Hashable, key_lock: threading.Lock):
+        """Forget key's loading lock unless a newer load replaced it; caller holds the lock"""
+        if self._loading.get(key) is key_lock:
+            del self._loading[key]
+
+    def invalidate(self, name: Optional[Hashable] = None):
+        """
+        Drop cached results
+
+        Args:
+            name: Only drop tuple keys starting with this element (default: all)
+        """
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+                return
+
+            for key in [key for key in self._entries if isinstance(key, tuple) and key and key[0] == name]:
+                del self._entries[key]
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+            'evictions': self.evictions
+        }
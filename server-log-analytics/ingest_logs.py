@@ -5,21 +5,40 @@ Ties together parser, bot detection, security scanning, and database insertion
 
 import click
 import logging
+import multiprocessing
+import os
+import queue
 import sys
 import time
+from collections import Counter, deque
 from pathlib import Path
-from typing import List, Dict
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Dict, Optional
+from datetime import datetime, timedelta, timezone
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
+from rich.progress import (
+    Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn,
+    DownloadColumn, TransferSpeedColumn
+)
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from parsers.log_parser import LogParser, ParsedLogEntry
+from parsers.log_reader import (
+    CheckpointStore, IngestManifest, LogFileReader, LogTailer,
+    expand_inputs, is_compressed, iter_range_lines, rotation_key, split_byte_ranges
+)
 from analyzers.bot_detector import BotDetector
+from analyzers.geo_enricher import GeoEnricher, open_database
 from analyzers.security_scanner import SecurityScanner, SecurityThreat
+from analyzers.sessionizer import Sessionizer
+from analyzers.online_detector import OnlineAnomalyDetector
 from database.clickhouse_client import ClickHouseClient
+from database.buffered_writer import BufferedWriter
+from monitoring.ingest_metrics import (
+    PYINSTRUMENT_AVAILABLE, IngestMetrics, MetricsServer, StatsFileWriter, run_profiled
+)
 
 # Setup logging
 logging.basicConfig(
@@ -41,7 +60,27 @@ class LogIngestionPipeline:
         log_format: str = 'nginx',
         batch_size: int = 10000,
         enable_bot_detection: bool = True,
-        enable_security_scan: bool = True
+        enable_security_scan: bool = True,
+        workers: int = 1,
+        fast_parser: bool = False,
+        scan_cache_size: int = 50000,
+        scan_cache_mb: int = 32,
+        rate_limits: bool = False,
+        geo_database: Optional[str] = None,
+        geo_cache_size: int = 100000,
+        columnar_insert: bool = False,
+        compress_inserts: bool = False,
+        insert_queue_size: int = 4,
+        insert_connections: int = 1,
+        insert_retries: int = 5,
+        spool_dir: str = '.ingest_spool',
+        sessionize: bool = False,
+        session_timeout_minutes: int = 30,
+        detect_anomalies: bool = False,
+        seasonal_baselines: bool = False,
+        anomaly_state: Optional[str] = None,
+        instrument: bool = False,
+        connect: bool = True
     ):
         """
         Initialize ingestion pipeline
@@ -51,56 +90,190 @@ class LogIngestionPipeline:
             batch_size: Number of logs to process in each batch
             enable_bot_detection: Whether to detect bots
             enable_security_scan: Whether to scan for security threats
+            workers: Number of parse/enrich processes (1 = in-process)
+            fast_parser: Use the delimiter-splitting Nginx parser fast path
+            scan_cache_size: Max distinct requests in the security scan verdict cache (0 disables)
+            scan_cache_mb: Approximate memory budget of the verdict cache, per process
+            rate_limits: Flag per-IP bursts, credential stuffing and scanners from
+                         sliding-window request rates (part of the security scan;
+                         single process only)
+            geo_database: Range database or .mmdb file used to fill country_code and city
+                          (see analyzers/geo_enricher.py); None skips geo enrichment
+            geo_cache_size: Max client IPs in the geo lookup LRU, per process
+            columnar_insert: Send inserts to ClickHouse as per-column arrays
+            compress_inserts: LZ4-compress inserted blocks
+            insert_queue_size: Batches buffered for the background writer before parsing blocks
+            insert_connections: Batches inserted concurrently, each by its own writer
+                                thread on its own ClickHouse connection
+            insert_retries: Retries per failed insert before the batch is spooled to disk
+            spool_dir: Where batches are spooled while ClickHouse is unavailable
+            sessionize: Build sessions while ingesting and insert them into fact_sessions
+                        (input must be time-ordered; single process only)
+            session_timeout_minutes: Idle gap that ends a session
+            detect_anomalies: Score per-minute traffic against online baselines and
+                              insert anomalies into the anomalies table (single process only)
+            seasonal_baselines: Also keep baselines per hour of the week
+            anomaly_state: JSON file the baselines are loaded from and saved to
+            instrument: Time each stage and collect throughput, queue depth and
+                        insert latency metrics (see IngestMetrics)
+            connect: Whether to create a database client (False in workers)
         """
         self.log_format = log_format
         self.batch_size = batch_size
         self.enable_bot_detection = enable_bot_detection
         self.enable_security_scan = enable_security_scan
+        self.workers = max(1, workers)
+        self.fast_parser = fast_parser
+        self.scan_cache_size = scan_cache_size
+        self.scan_cache_mb = scan_cache_mb
+        self.rate_limits = rate_limits
+        self.geo_database = geo_database
+        self.geo_cache_size = geo_cache_size
+        self.insert_queue_size = insert_queue_size
+        self.insert_connections = max(1, insert_connections)
+        self.insert_retries = insert_retries
+        self.spool_dir = spool_dir
+        self.anomaly_state = anomaly_state
 
         # Initialize components
-        self.parser = LogParser()
+        self.parser = LogParser(fast=fast_parser)
         self.bot_detector = BotDetector() if enable_bot_detection else None
-        self.security_scanner = SecurityScanner() if enable_security_scan else None
-        self.db_client = ClickHouseClient()
+        self.geo_enricher = GeoEnricher(
+            geo_database,
+            cache_size=geo_cache_size
+        ) if geo_database else None
+        self.security_scanner = SecurityScanner(
+            cache_size=scan_cache_size,
+            cache_max_bytes=scan_cache_mb * 1024 * 1024,
+            rate_limits=rate_limits
+        ) if enable_security_scan else None
+        self.sessionizer = Sessionizer(
+            session_timeout=timedelta(minutes=session_timeout_minutes)
+        ) if sessionize else None
+        self.anomaly_detector = OnlineAnomalyDetector(
+            seasonal=seasonal_baselines
+        ) if detect_anomalies else None
+        self.db_client = ClickHouseClient(
+            columnar=columnar_insert,
+            compression=compress_inserts,
+            insert_connections=self.insert_connections
+        ) if connect else None
+
+        # Background writer, running only while ingesting (see _start_writer)
+        self.writer = None
 
         # Statistics
         self.stats = {
             'total_lines': 0,
+            'bytes_read': 0,
             'parsed_successfully': 0,
             'parse_errors': 0,
             'inserted_to_db': 0,
+            'insert_errors': 0,
+            'insert_retries': 0,
+            'spilled_rows': 0,
+            'replayed_rows': 0,
+            'files_processed': 0,
+            'files_skipped': 0,
             'bots_detected': 0,
+            'ua_cache_hits': 0,
+            'ua_cache_misses': 0,
+            'geo_located': 0,
+            'geo_cache_hits': 0,
+            'geo_cache_misses': 0,
             'threats_detected': 0,
+            'rate_alerts': 0,
+            'sessions_emitted': 0,
+            'anomalies_detected': 0,
+            'scan_cache_hits': 0,
+            'scan_cache_misses': 0,
             'processing_time': 0
         }
 
-    def ingest_file(self, file_path: str) -> Dict:
+        # Last-seen component counters (see _collect_component_stats)
+        self._component_marks = {}
+
+        # Stage timings, folded into the metrics once per batch
+        self.metrics = IngestMetrics(self.stats) if instrument else None
+        self.stage_times = IngestMetrics.new_stage_times() if instrument else None
+
+        # Worker result queue while ingesting with --workers (for its depth gauge)
+        self._results = None
+
+        if self.metrics:
+            self.metrics.register_gauge(
+                'insert_queue_depth', 'Batches waiting for the ClickHouse writer',
+                lambda: self.writer.queue.qsize() if self.writer else 0
+            )
+            self.metrics.register_gauge(
+                'spooled_batches', 'Batches spooled to disk awaiting replay',
+                lambda: len(self.writer._spool_files()) if self.writer else 0
+            )
+            self.metrics.register_gauge(
+                'worker_queue_depth', 'Row batches sent by workers and not yet written',
+                lambda: self._results.qsize() if self._results is not None else 0
+            )
+
+        if self.anomaly_detector and anomaly_state:
+            self.anomaly_detector.load(anomaly_state)
+
+    def ingest_file(self, file_path: str, manifest: Optional[IngestManifest] = None) -> Dict:
         """
         Ingest a log file
 
         Args:
-            file_path: Path to log file
+            file_path: Path to log file (plain, .gz, .bz2 or .zst)
+            manifest: Optional manifest used to skip already-ingested files
+
+        Returns:
+            Statistics dictionary
+        """
+        return self.ingest_files([file_path], manifest=manifest)
+
+    def ingest_files(self, file_paths: List[str], manifest: Optional[IngestManifest] = None) -> Dict:
+        """
+        Ingest one or more log files
+
+        Files are streamed line by line (compressed files are decompressed on
+        the fly) and flushed to the database every ``batch_size`` parsed
+        entries, so memory stays bounded regardless of file size. Progress is
+        reported by byte offset on disk. With ``workers > 1`` plain files are
+        sharded into newline-aligned byte ranges and compressed files are
+        processed whole, all concurrently in a process pool, while this
+        process does the inserts.
+
+        Args:
+            file_paths: Paths to log files
+            manifest: Optional manifest; files already recorded are skipped and
+                      fully ingested files are recorded
 
         Returns:
             Statistics dictionary
         """
         start_time = time.time()
 
-        console.print(f"\n[bold cyan]Starting log ingestion[/bold cyan]")
-        console.print(f"File: {file_path}")
+        console.print("\n[bold cyan]Starting log ingestion[/bold cyan]")
+        console.print(f"Files: {file_paths[0] if len(file_paths) == 1 else f'{len(file_paths):,} files'}")
         console.print(f"Format: {self.log_format}")
-        console.print(f"Batch size: {self.batch_size:,}\n")
+        console.print(f"Batch size: {self.batch_size:,}")
+        console.print(f"Workers: {self.workers}\n")
 
-        # Read file
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-        except Exception as e:
-            console.print(f"[red]Error reading file: {e}[/red]")
-            return self.stats
+        pending = []
+        for file_path in file_paths:
+            try:
+                if manifest and manifest.is_ingested(file_path):
+                    self.stats['files_skipped'] += 1
+                    logger.info(f"Skipping already-ingested file: {file_path}")
+                    continue
+                pending.append((file_path, os.path.getsize(file_path)))
+            except OSError as e:
+                console.print(f"[red]Error reading file {file_path}: {e}[/red]")
+
+        if self.stats['files_skipped']:
+            console.print(f"Skipping {self.stats['files_skipped']:,} already-ingested files")
 
-        self.stats['total_lines'] = len(lines)
-        console.print(f"Read {len(lines):,} lines from file\n")
+        total_size = sum(size for _, size in pending)
+        console.print(f"Streaming {total_size:,} bytes from {len(pending):,} files\n")
 
         # Process in batches
         with Progress(
@@ -108,73 +281,39 @@ class LogIngestionPipeline:
             TextColumn("[progress.description]{task.description}"),
             BarColumn(),
             TaskProgressColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
             console=console
         ) as progress:
 
             task = progress.add_task(
                 "[cyan]Processing logs...",
-                total=len(lines)
+                total=total_size
             )
 
-            batch = []
-            security_events = []
-
-            for i, line in enumerate(lines):
-                # Parse log line
-                entry = self.parser.parse_line(line.strip(), format_type=self.log_format)
-
-                if entry:
-                    self.stats['parsed_successfully'] += 1
-
-                    # Bot detection
-                    if self.bot_detector:
-                        bot_info = self.bot_detector.detect(
-                            entry.user_agent,
-                            entry.ip_address
-                        )
-                        # Add bot info to entry (would need to extend ParsedLogEntry)
-                        # For now, just count
-                        if bot_info['is_bot']:
-                            self.stats['bots_detected'] += 1
-
-                    # Security scanning
-                    if self.security_scanner:
-                        threats = self.security_scanner.scan(
-                            entry.path,
-                            entry.query_string,
-                            entry.method
-                        )
-                        if threats:
-                            self.stats['threats_detected'] += len(threats)
-                            # Store threats for later insertion
-                            for threat in threats:
-                                security_events.append({
-                                    'timestamp': entry.timestamp,
-                                    'threat': threat,
-                                    'ip': entry.ip_address,
-                                    'path': entry.path
-                                })
-
-                    batch.append(entry)
-                else:
-                    self.stats['parse_errors'] += 1
-
-                # Insert batch when full
-                if len(batch) >= self.batch_size:
-                    inserted = self._insert_batch(batch)
-                    self.stats['inserted_to_db'] += inserted
-                    batch = []
+            self._start_writer()
 
-                progress.update(task, advance=1)
+            try:
+                if self.workers > 1 and pending:
+                    self._ingest_parallel([path for path, _ in pending], progress, task, manifest)
+                else:
+                    completed = 0
+                    for file_path, size in pending:
+                        self._ingest_sequential(file_path, progress, task, completed, manifest)
+                        completed += size
+                        progress.update(task, completed=completed)
 
-            # Insert remaining batch
-            if batch:
-                inserted = self._insert_batch(batch)
-                self.stats['inserted_to_db'] += inserted
+                self._write_sessions(self.sessionizer.flush() if self.sessionizer else [])
 
-            # Insert security events if any
-            if security_events:
-                self._insert_security_events(security_events)
+                if self.anomaly_detector:
+                    if self.anomaly_state:
+                        # The next run (or --follow) continues the open minutes
+                        self._drain_writer()
+                        self._save_anomaly_state()
+                    else:
+                        self._write_anomalies(self.anomaly_detector.flush())
+            finally:
+                self._stop_writer()
 
         # Calculate timing
         self.stats['processing_time'] = time.time() - start_time
@@ -184,45 +323,618 @@ class LogIngestionPipeline:
 
         return self.stats
 
-    def _insert_batch(self, batch: List[ParsedLogEntry]) -> int:
-        """Insert a batch of log entries to database"""
+    def _ingest_sequential(
+        self,
+        file_path: str,
+        progress: Progress,
+        task,
+        completed: int,
+        manifest: Optional[IngestManifest]
+    ):
+        """Parse, enrich and insert one file in this process"""
+        batch = []
+        security_events = []
+        lines_before = self.stats['total_lines']
+        errors_before = self.stats['insert_errors']
+        read_ok = False
+
         try:
-            return self.db_client.insert_requests(batch)
+            # Binary mode keeps byte offsets exact; lines are decoded individually
+            with LogFileReader(file_path) as reader:
+                for block in self._read_blocks(reader):
+                    self._process_lines(block, batch, security_events)
+
+                    # Insert batch when full
+                    if len(batch) >= self.batch_size:
+                        self._flush(batch, security_events)
+                        progress.update(task, completed=completed + reader.position)
+
+            read_ok = True
+
         except Exception as e:
-            logger.error(f"Error inserting batch: {e}")
-            return 0
+            console.print(f"[red]Error reading file {file_path}: {e}[/red]")
+
+        # Insert remaining batch and wait until the file's rows are durable
+        self._flush(batch, security_events)
+        self._drain_writer()
+        self.stats['files_processed'] += 1
+
+        if manifest and read_ok and self.stats['insert_errors'] == errors_before:
+            manifest.record(file_path, self.stats['total_lines'] - lines_before)
+
+    def _ingest_parallel(
+        self,
+        file_paths: List[str],
+        progress: Progress,
+        task,
+        manifest: Optional[IngestManifest]
+    ):
+        """
+        Parse and enrich files in worker processes
+
+        Plain files are split into byte-range chunks; compressed files are one
+        task each. Workers stream compact row batches through a bounded queue
+        to this process, the single writer, so memory stays bounded and
+        workers block when ClickHouse falls behind.
+        """
+        tasks = []
+        for file_path in file_paths:
+            if is_compressed(file_path):
+                tasks.append((file_path, 0, None))
+                continue
+
+            file_size = os.path.getsize(file_path)
+            chunk_size = max(
+                MIN_CHUNK_SIZE,
+                min(MAX_CHUNK_SIZE, -(-file_size // (self.workers * 4)))
+            )
+            tasks.extend(
+                (file_path, start, end)
+                for start, end in split_byte_ranges(file_path, chunk_size)
+            )
+
+        # Per-file bookkeeping for the manifest
+        remaining_tasks = Counter(file_path for file_path, _, _ in tasks)
+        file_lines = Counter()
+        failed_files = set()
+        reported = set()  # (file_path, start) of ranges whose done message arrived
+        errors_before = {file_path: self.stats['insert_errors'] for file_path in file_paths}
+
+        rows = []
+        event_rows = []
+        results = multiprocessing.Queue(maxsize=self.workers * 2)
+        self._results = results
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(
+                results,
+                self.batch_size,
+                self.log_format,
+                self.enable_bot_detection,
+                self.enable_security_scan,
+                self.fast_parser,
+                self.scan_cache_size,
+                self.scan_cache_mb,
+                self.rate_limits,
+                self.geo_database,
+                self.geo_cache_size,
+                self.metrics is not None
+            )
+        ) as executor:
+            futures = [executor.submit(_process_range, *args) for args in tasks]
+            pending = len(tasks)
+
+            while pending:
+                try:
+                    message = results.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker that died without reporting would otherwise hang us;
+                    # a range that failed but reported done only fails its file
+                    for (file_path, start, _), future in zip(tasks, futures):
+                        if future.done() and future.exception() and (file_path, start) not in reported:
+                            raise future.exception()
+                    continue
+
+                file_path = message['file_path']
+
+                for key, value in message['stats'].items():
+                    self.stats[key] += value
+                file_lines[file_path] += message['stats']['total_lines']
+
+                rows.extend(message['rows'])
+                event_rows.extend(message['event_rows'])
+
+                while len(rows) >= self.batch_size:
+                    self._write('fact_requests', rows[:self.batch_size])
+                    del rows[:self.batch_size]
+
+                if event_rows:
+                    self._write('security_events', event_rows)
+                    event_rows = []
+
+                if self.metrics and message['timings']:
+                    for stage, seconds in message['timings'].items():
+                        self.stage_times[stage] += seconds
+                    self._observe_stages()
+
+                progress.update(task, advance=message['raw_bytes'])
+
+                if not message['done']:
+                    continue
+
+                pending -= 1
+                remaining_tasks[file_path] -= 1
+                reported.add((file_path, message['start']))
+                if not message['ok']:
+                    failed_files.add(file_path)
+
+                if remaining_tasks[file_path] == 0:
+                    # File complete: make its rows durable before recording it
+                    if rows:
+                        self._write('fact_requests', rows)
+                        rows = []
+                    self._drain_writer()
+                    self.stats['files_processed'] += 1
+
+                    if (
+                        manifest and file_path not in failed_files
+                        and self.stats['insert_errors'] == errors_before[file_path]
+                    ):
+                        manifest.record(file_path, file_lines[file_path])
+
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    console.print(f"[red]Worker error: {e}[/red]")
+
+        if rows:
+            self._write('fact_requests', rows)
+
+        self._results = None
+
+    def follow_file(
+        self,
+        file_path: str,
+        checkpoint_path: str,
+        flush_interval: float = 5.0,
+        poll_interval: float = 0.5
+    ) -> Dict:
+        """
+        Continuously ingest new lines appended to a log file (tail -F)
+
+        Batches are flushed once they reach ``batch_size`` rows or once the
+        oldest buffered row is ``flush_interval`` seconds old, whichever comes
+        first. Parsing carries on while the writer inserts; the byte offset
+        of each flush is checkpointed once the writer has settled (inserted,
+        spooled or rejected) every batch up to it, so a restart resumes
+        without duplicates or gaps. Rotation and truncation are
+        detected and the new file is picked up from the beginning; a rotation
+        while stopped is caught up from the rotated file (see LogTailer).
+
+        Args:
+            file_path: Path to the live log file
+            checkpoint_path: JSON file used to persist read offsets
+            flush_interval: Max seconds a parsed row waits before insertion
+            poll_interval: Seconds to sleep when no new data is available
+
+        Returns:
+            Statistics dictionary (when interrupted)
+        """
+        start_time = time.time()
+
+        console.print("\n[bold cyan]Following log file[/bold cyan]")
+        console.print(f"File: {file_path}")
+        console.print(f"Format: {self.log_format}")
+        console.print(f"Batch size: {self.batch_size:,} (or every {flush_interval:g}s)")
+        console.print(f"Checkpoint: {checkpoint_path}")
+        console.print("[dim]Press Ctrl+C to stop[/dim]\n")
+
+        checkpoints = CheckpointStore(checkpoint_path)
+        tailer = LogTailer(file_path, checkpoint=checkpoints.get(file_path))
+
+        batch = []
+        security_events = []
+        batch_started = None
+        # (writer sequence, inode, offset, anomaly state) per flush, oldest first
+        unsettled = deque()
+
+        def flush():
+            nonlocal batch_started
+            self._flush(batch, security_events)
+            # Open minutes hold exactly the lines before the offset
+            state = self.anomaly_detector.get_state() if self.anomaly_detector and self.anomaly_state else None
+            unsettled.append((self.writer.submitted, tailer.inode, tailer.offset, state))
+            batch_started = None
+            checkpoint()
+
+        def checkpoint():
+            """Save the newest flush whose batches the writer has all settled"""
+            settled = None
+            completed = self.writer.completed_through()
+            while unsettled and unsettled[0][0] <= completed:
+                settled = unsettled.popleft()
+
+            if settled:
+                _, inode, offset, state = settled
+                checkpoints.save(file_path, inode, offset)
+                self._save_anomaly_state(state)
+
+        self._start_writer()
 
-    def _insert_security_events(self, events: List[Dict]):
-        """Insert security events to database"""
         try:
-            # Prepare security event rows
-            rows = []
-            for event in events:
-                threat = event['threat']
-                row = (
-                    event['timestamp'],
-                    threat.threat_type,
-                    threat.severity,
-                    event['ip'],
-                    event['path'],
-                    threat.description,
-                    threat.pattern_matched,
-                    threat.confidence
+            while True:
+                lines = tailer.read_lines(self.batch_size)
+
+                for block in self._read_blocks(raw_line for raw_line, _ in lines):
+                    self._process_lines(block, batch, security_events)
+
+                if lines and batch_started is None:
+                    batch_started = time.monotonic()
+
+                deadline_passed = (
+                    batch_started is not None
+                    and time.monotonic() - batch_started >= flush_interval
                 )
-                rows.append(row)
-
-            if rows:
-                query = """
-                INSERT INTO security_events
-                (timestamp, threat_type, severity, ip_address, path,
-                 description, pattern_matched, confidence)
-                VALUES
-                """
-                self.db_client.client.execute(query, rows)
-                logger.info(f"Inserted {len(rows)} security events")
 
-        except Exception as e:
-            logger.error(f"Error inserting security events: {e}")
+                if len(batch) >= self.batch_size or deadline_passed:
+                    flush()
+
+                if not lines:
+                    # Only check rotation at EOF so the old file is fully drained first
+                    if tailer.rotated():
+                        flush()
+                        self._drain_writer()
+                        checkpoint()
+                        tailer.reopen()
+                        checkpoints.save(file_path, tailer.inode, tailer.offset)
+                    else:
+                        checkpoint()
+                        if self.sessionizer and not batch:
+                            # Close sessions that went idle while the log was quiet
+                            self._write_sessions(self.sessionizer.expire(datetime.now(timezone.utc)))
+                        if self.anomaly_detector and not batch:
+                            # Score minutes that passed without any requests
+                            self._write_anomalies(self.anomaly_detector.advance(datetime.now(timezone.utc)))
+                        time.sleep(poll_interval)
+
+        except KeyboardInterrupt:
+            console.print("\n[yellow]Stopping follow mode...[/yellow]")
+
+        finally:
+            flush()
+            self._drain_writer()
+            checkpoint()
+            tailer.close()
+            if self.sessionizer:
+                # Sessions still open are cut here; they restart on resume
+                self._write_sessions(self.sessionizer.flush())
+            self._stop_writer()
+
+        self.stats['processing_time'] = time.time() - start_time
+        self._print_summary()
+
+        return self.stats
+
+    def _read_blocks(self, raw_lines: Iterable[bytes]) -> Iterator[List[bytes]]:
+        """Group raw lines into blocks of READ_BLOCK_LINES, counting bytes_read"""
+        block = []
+
+        for raw_line in raw_lines:
+            self.stats['bytes_read'] += len(raw_line)
+            block.append(raw_line)
+
+            if len(block) >= READ_BLOCK_LINES:
+                yield block
+                block = []
+
+        if block:
+            yield block
+
+    def _process_lines(
+        self,
+        raw_lines: List[bytes],
+        batch: List[ParsedLogEntry],
+        security_events: List[Dict]
+    ):
+        """
+        Parse and enrich a block of raw lines, appending results to the buffers
+
+        CloudFlare NDJSON blocks are decoded in one pass (see
+        LogParser.parse_cloudflare_batch); other formats are parsed line by line.
+        """
+        if self.log_format != 'cloudflare':
+            for raw_line in raw_lines:
+                self._process_line(raw_line.decode('utf-8', errors='ignore'), batch, security_events)
+            return
+
+        timing = self.stage_times
+        if timing is not None:
+            started = time.perf_counter()
+
+        entries = self.parser.parse_cloudflare_batch(raw_lines)
+
+        if timing is not None:
+            timing['parse'] += time.perf_counter() - started
+
+        self.stats['total_lines'] += len(raw_lines)
+
+        for entry in entries:
+            if entry is None:
+                self.stats['parse_errors'] += 1
+            else:
+                self.stats['parsed_successfully'] += 1
+                self._enrich(entry, batch, security_events)
+
+    def _process_line(
+        self,
+        line: str,
+        batch: List[ParsedLogEntry],
+        security_events: List[Dict]
+    ):
+        """Parse and enrich a single raw line, appending results to the buffers"""
+        self.stats['total_lines'] += 1
+        timing = self.stage_times
+
+        if timing is not None:
+            started = time.perf_counter()
+
+        # Parse log line
+        entry = self.parser.parse_line(line.strip(), format_type=self.log_format)
+
+        if timing is not None:
+            timing['parse'] += time.perf_counter() - started
+
+        if not entry:
+            self.stats['parse_errors'] += 1
+            return
+
+        self.stats['parsed_successfully'] += 1
+        self._enrich(entry, batch, security_events)
+
+    def _enrich(
+        self,
+        entry: ParsedLogEntry,
+        batch: List[ParsedLogEntry],
+        security_events: List[Dict]
+    ):
+        """Run bot detection, geo lookup and the security scan on a parsed entry and buffer it"""
+        timing = self.stage_times
+
+        if timing is not None:
+            started = time.perf_counter()
+
+        # Bot detection
+        if self.bot_detector:
+            bot_info = self.bot_detector.detect(
+                entry.user_agent,
+                entry.ip_address
+            )
+            entry.is_bot = bot_info['is_bot']
+            entry.bot_type = bot_info['bot_type']
+            entry.device_type = bot_info['device_type']
+            entry.browser = bot_info['browser']
+            entry.os = bot_info['os']
+
+            if bot_info['is_bot']:
+                self.stats['bots_detected'] += 1
+
+            if timing is not None:
+                now = time.perf_counter()
+                timing['bot_detection'] += now - started
+                started = now
+
+        # Geo enrichment
+        if self.geo_enricher:
+            entry.country_code, entry.city = self.geo_enricher.lookup(entry.ip_address)
+
+            if timing is not None:
+                now = time.perf_counter()
+                timing['geo'] += now - started
+                started = now
+
+        # Security scanning
+        if self.security_scanner:
+            threats = self.security_scanner.scan(
+                entry.path,
+                entry.query_string,
+                entry.method
+            )
+
+            rate_threats = self.security_scanner.check_request_rate(
+                entry.ip_address,
+                entry.path,
+                entry.method,
+                entry.status_code,
+                entry.timestamp.timestamp()
+            ) if self.rate_limits else None
+
+            if rate_threats:
+                self.stats['rate_alerts'] += len(rate_threats)
+                threats = threats + rate_threats
+
+            if threats:
+                self.stats['threats_detected'] += len(threats)
+                entry.is_suspicious = True
+                entry.attack_type = max(threats, key=lambda t: t.confidence).threat_type
+
+                # Store threats for insertion with the current batch
+                for threat in threats:
+                    security_events.append({
+                        'timestamp': entry.timestamp,
+                        'threat': threat,
+                        'ip': entry.ip_address,
+                        'user_agent': entry.user_agent,
+                        'method': entry.method,
+                        'path': entry.path,
+                        'query_string': entry.query_string
+                    })
+
+            if timing is not None:
+                timing['security_scan'] += time.perf_counter() - started
+
+        batch.append(entry)
+
+    def _collect_component_stats(self):
+        """Fold component counters accumulated since the last call into self.stats"""
+        counters = {}
+
+        if self.bot_detector:
+            counters['ua_cache_hits'] = self.bot_detector.cache_hits
+            counters['ua_cache_misses'] = self.bot_detector.cache_misses
+
+        if self.geo_enricher:
+            counters['geo_located'] = self.geo_enricher.located
+            counters['geo_cache_hits'] = self.geo_enricher.cache_hits
+            counters['geo_cache_misses'] = self.geo_enricher.cache_misses
+
+        if self.security_scanner:
+            counters['scan_cache_hits'] = self.security_scanner.cache_hits
+            counters['scan_cache_misses'] = self.security_scanner.cache_misses
+
+        if self.writer:
+            counters['inserted_to_db'] = self.writer.rows_inserted
+            counters['insert_errors'] = self.writer.batches_failed + self.writer.batches_rejected
+            counters['insert_retries'] = self.writer.retries
+            counters['spilled_rows'] = self.writer.rows_spilled
+            counters['replayed_rows'] = self.writer.rows_replayed
+
+        for key, value in counters.items():
+            self.stats[key] += value - self._component_marks.get(key, 0)
+            self._component_marks[key] = value
+
+    def _flush(self, batch: List[ParsedLogEntry], security_events: List[Dict]):
+        """Hand buffered entries and security events to the writer, then clear the buffers"""
+        self._collect_component_stats()
+        timing = self.stage_times
+
+        if batch:
+            if self.sessionizer:
+                started = time.perf_counter()
+                sessions = self.sessionizer.add_entries(batch)
+                if timing is not None:
+                    timing['sessionize'] += time.perf_counter() - started
+                self._write_sessions(sessions)
+
+            if self.anomaly_detector:
+                started = time.perf_counter()
+                anomalies = self.anomaly_detector.add_entries(batch)
+                if timing is not None:
+                    timing['anomalies'] += time.perf_counter() - started
+                self._write_anomalies(anomalies)
+
+            started = time.perf_counter()
+            rows = [ClickHouseClient.entry_to_row(entry) for entry in batch]
+            if timing is not None:
+                timing['convert'] += time.perf_counter() - started
+
+            self._write('fact_requests', rows)
+            batch.clear()
+
+        # Insert security events if any
+        if security_events:
+            self._write('security_events', [self._security_event_row(event) for event in security_events])
+            security_events.clear()
+
+        if self.metrics and any(timing.values()):
+            self._observe_stages()
+
+    def _observe_stages(self):
+        """Fold the current batch's stage times into the metrics and reset them"""
+        self.metrics.observe_batch(self.stage_times)
+        for stage in self.stage_times:
+            self.stage_times[stage] = 0.0
+
+    def _write_sessions(self, sessions: List):
+        """Queue finished sessions for insertion into fact_sessions"""
+        if sessions:
+            self.stats['sessions_emitted'] += len(sessions)
+            self._write('fact_sessions', [ClickHouseClient.session_to_row(session) for session in sessions])
+
+    def _write_anomalies(self, anomalies: List):
+        """Queue detected anomalies for insertion into the anomalies table"""
+        if anomalies:
+            self.stats['anomalies_detected'] += len(anomalies)
+            self._write('anomalies', [ClickHouseClient.anomaly_to_row(anomaly) for anomaly in anomalies])
+
+    def _save_anomaly_state(self, state: Optional[Dict] = None):
+        """Persist anomaly baselines and open minutes (or an earlier snapshot of them), if configured"""
+        if self.anomaly_detector and self.anomaly_state:
+            try:
+                self.anomaly_detector.save(self.anomaly_state, state)
+            except OSError as e:
+                logger.warning(f"Could not save anomaly state to {self.anomaly_state}: {e}")
+
+    def _start_writer(self):
+        """Start the background writer (replays batches spooled by earlier runs)"""
+        if self.db_client is None or self.writer is not None:
+            return
+
+        self.writer = BufferedWriter(
+            self.db_client,
+            queue_size=self.insert_queue_size,
+            max_retries=self.insert_retries,
+            spool_dir=self.spool_dir,
+            metrics=self.metrics,
+            threads=self.insert_connections
+        )
+        self._component_marks.update({
+            'inserted_to_db': 0,
+            'insert_errors': 0,
+            'insert_retries': 0,
+            'spilled_rows': 0,
+            'replayed_rows': 0
+        })
+        self.writer.start()
+
+    def _drain_writer(self):
+        """Wait until everything handed to the writer is inserted or spooled"""
+        if self.writer:
+            self.writer.drain()
+            self._collect_component_stats()
+
+    def _stop_writer(self):
+        """Drain and stop the background writer"""
+        if self.writer:
+            self.writer.close()
+            self._collect_component_stats()
+            self.writer = None
+
+    def _write(self, table: str, rows: List[tuple]):
+        """
+        Queue rows for insertion by the background writer
+
+        Blocks while the writer's queue is full, so parsing never runs
+        unboundedly ahead of ClickHouse; with instrumentation the blocked
+        time is counted as the insert_wait stage.
+        """
+        if self.stage_times is None:
+            self.writer.submit(table, rows)
+            return
+
+        started = time.perf_counter()
+        self.writer.submit(table, rows)
+        self.stage_times['insert_wait'] += time.perf_counter() - started
+
+    @staticmethod
+    def _security_event_row(event: Dict) -> tuple:
+        """Convert a buffered security event into a security_events row tuple"""
+        threat = event['threat']
+        return (
+            event['timestamp'],
+            threat.threat_type,
+            threat.severity,
+            event['ip'],
+            event['user_agent'],
+            event['method'],
+            event['path'],
+            event['query_string'],
+            threat.pattern_matched,
+            threat.confidence,
+            'logged'
+        )
 
     def _print_summary(self):
         """Print ingestion summary"""
@@ -236,45 +948,225 @@ class LogIngestionPipeline:
         parse_rate = (stats['parsed_successfully'] / stats['total_lines'] * 100) if stats['total_lines'] > 0 else 0
 
         console.print("[bold cyan]Parsing:[/bold cyan]")
+        if stats['files_processed'] > 1 or stats['files_skipped']:
+            console.print(f"  Files processed:    {stats['files_processed']:,}")
+            console.print(f"  Files skipped:      {stats['files_skipped']:,} (already ingested)")
         console.print(f"  Total lines:        {stats['total_lines']:,}")
+        console.print(f"  Bytes read:         {stats['bytes_read']:,}")
         console.print(f"  Parsed successfully: {stats['parsed_successfully']:,} ({parse_rate:.1f}%)")
         console.print(f"  Parse errors:       {stats['parse_errors']:,}")
 
         # Database stats
-        console.print(f"\n[bold cyan]Database:[/bold cyan]")
+        console.print("\n[bold cyan]Database:[/bold cyan]")
         console.print(f"  Inserted to DB:     {stats['inserted_to_db']:,}")
+        if stats['insert_retries']:
+            console.print(f"  Insert retries:     {stats['insert_retries']:,}")
+        if stats['replayed_rows']:
+            console.print(f"  Replayed from spool: {stats['replayed_rows']:,}")
+        if stats['spilled_rows']:
+            console.print(f"  [yellow]Spooled to disk:    {stats['spilled_rows']:,} (replayed when ClickHouse is back)[/yellow]")
+        if stats['insert_errors']:
+            console.print(f"  [red]Failed batches:     {stats['insert_errors']:,} (rejected ones kept as {self.spool_dir}/*.rejected)[/red]")
 
         # Security stats
         if self.enable_bot_detection:
             bot_rate = (stats['bots_detected'] / stats['parsed_successfully'] * 100) if stats['parsed_successfully'] > 0 else 0
-            console.print(f"\n[bold cyan]Bot Detection:[/bold cyan]")
+            console.print("\n[bold cyan]Bot Detection:[/bold cyan]")
             console.print(f"  Bots detected:      {stats['bots_detected']:,} ({bot_rate:.1f}%)")
 
+            lookups = stats['ua_cache_hits'] + stats['ua_cache_misses']
+            if lookups > 0:
+                hit_rate = stats['ua_cache_hits'] / lookups * 100
+                console.print(f"  UA cache hit rate:  {hit_rate:.1f}% ({stats['ua_cache_misses']:,} misses)")
+
+        if self.geo_enricher:
+            lookups = stats['geo_cache_hits'] + stats['geo_cache_misses']
+            located_rate = (stats['geo_located'] / lookups * 100) if lookups > 0 else 0
+            console.print("\n[bold cyan]Geo:[/bold cyan]")
+            console.print(f"  Located:            {stats['geo_located']:,} ({located_rate:.1f}%)")
+            if lookups > 0:
+                hit_rate = stats['geo_cache_hits'] / lookups * 100
+                console.print(f"  IP cache hit rate:  {hit_rate:.1f}% ({stats['geo_cache_misses']:,} misses)")
+
         if self.enable_security_scan:
-            console.print(f"\n[bold cyan]Security:[/bold cyan]")
+            console.print("\n[bold cyan]Security:[/bold cyan]")
             console.print(f"  Threats detected:   {stats['threats_detected']:,}")
+            if self.rate_limits:
+                console.print(f"  Rate limit alerts:  {stats['rate_alerts']:,}")
+
+            lookups = stats['scan_cache_hits'] + stats['scan_cache_misses']
+            if lookups > 0:
+                hit_rate = stats['scan_cache_hits'] / lookups * 100
+                console.print(f"  Scan cache hit rate: {hit_rate:.1f}% ({stats['scan_cache_misses']:,} misses)")
 
             if stats['threats_detected'] > 0:
                 console.print(f"\n  [yellow]⚠ WARNING: {stats['threats_detected']} security threats detected![/yellow]")
-                console.print(f"  [yellow]Run: python analytics_cli.py security-scan[/yellow]")
+                console.print("  [yellow]Run: python analytics_cli.py security-scan[/yellow]")
+
+        if self.sessionizer:
+            console.print("\n[bold cyan]Sessions:[/bold cyan]")
+            console.print(f"  Sessions emitted:   {stats['sessions_emitted']:,}")
+            console.print(f"  Peak open sessions: {self.sessionizer.peak_open_sessions:,}")
+
+        if self.anomaly_detector:
+            detector_stats = self.anomaly_detector.get_stats()
+            console.print("\n[bold cyan]Anomalies:[/bold cyan]")
+            console.print(f"  Minutes scored:     {detector_stats['minutes_scored']:,}")
+            console.print(f"  Warm baselines:     {detector_stats['warm_baselines']:,} of {detector_stats['baselines']:,}")
+            console.print(f"  Anomalies detected: {stats['anomalies_detected']:,}")
+            if detector_stats['late_entries']:
+                console.print(f"  Late entries:       {detector_stats['late_entries']:,} (minute already scored)")
 
         # Performance stats
-        console.print(f"\n[bold cyan]Performance:[/bold cyan]")
+        console.print("\n[bold cyan]Performance:[/bold cyan]")
         console.print(f"  Processing time:    {stats['processing_time']:.2f} seconds")
 
         if stats['processing_time'] > 0:
             lines_per_sec = stats['total_lines'] / stats['processing_time']
-            console.print(f"  Throughput:         {lines_per_sec:,.0f} lines/second")
+            mb_per_sec = stats['bytes_read'] / stats['processing_time'] / (1024 ** 2)
+            console.print(f"  Throughput:         {lines_per_sec:,.0f} lines/second ({mb_per_sec:.1f} MB/s)")
+
+        if self.metrics:
+            snapshot = self.metrics.snapshot()
+            console.print("\n[bold cyan]Stages:[/bold cyan]")
+            for stage, stage_info in snapshot['stages'].items():
+                if stage_info['seconds'] > 0:
+                    console.print(f"  {stage + ':':<19} {stage_info['seconds']:8.2f}s ({stage_info['share'] * 100:4.1f}%)")
+
+            for table, latency in snapshot['insert_latency'].items():
+                console.print(
+                    f"  Insert {table}: p50 {latency['p50'] * 1000:.0f} ms, "
+                    f"p95 {latency['p95'] * 1000:.0f} ms, p99 {latency['p99'] * 1000:.0f} ms "
+                    f"({latency['count']:,} inserts)"
+                )
 
         console.print("\n" + "="*60 + "\n")
 
 
+# Raw lines read before parsing; CloudFlare NDJSON is decoded a block at a time
+READ_BLOCK_LINES = 1000
+
+# Byte-range chunk bounds for --workers mode
+MIN_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Writer-side stats that workers never report
+WRITER_STATS = (
+    'inserted_to_db', 'insert_errors', 'insert_retries', 'spilled_rows', 'replayed_rows',
+    'files_processed', 'files_skipped', 'processing_time'
+)
+
+# Per-process state used by worker processes (set by _init_worker)
+_worker_pipeline = None
+_worker_results = None
+
+
+def _init_worker(
+    results: multiprocessing.Queue,
+    batch_size: int,
+    log_format: str,
+    enable_bot_detection: bool,
+    enable_security_scan: bool,
+    fast_parser: bool,
+    scan_cache_size: int,
+    scan_cache_mb: int,
+    rate_limits: bool,
+    geo_database: Optional[str],
+    geo_cache_size: int,
+    instrument: bool
+):
+    """Create the parser/detector/scanner instances once per worker process (each maps the geo database itself)"""
+    global _worker_pipeline, _worker_results
+    _worker_results = results
+    _worker_pipeline = LogIngestionPipeline(
+        log_format=log_format,
+        batch_size=batch_size,
+        enable_bot_detection=enable_bot_detection,
+        enable_security_scan=enable_security_scan,
+        fast_parser=fast_parser,
+        scan_cache_size=scan_cache_size,
+        scan_cache_mb=scan_cache_mb,
+        rate_limits=rate_limits,
+        geo_database=geo_database,
+        geo_cache_size=geo_cache_size,
+        instrument=instrument,
+        connect=False
+    )
+
+
+def _process_range(file_path: str, start: int, end: Optional[int]):
+    """
+    Parse and enrich one byte range (or a whole compressed file when end is None)
+    in a worker process, sending row batches to the writer as they fill up
+
+    Each message carries the range's file path and start, request rows,
+    security event rows, the stats, stage timings (None unless instrumented)
+    and on-disk bytes since the previous message; the last one has done=True.
+    """
+    pipeline = _worker_pipeline
+    batch = []
+    security_events = []
+    position = start
+    ok = False
+
+    def send(new_position: int, done: bool = False):
+        nonlocal position
+        pipeline._collect_component_stats()
+        timing = pipeline.stage_times
+
+        started = time.perf_counter()
+        rows = [ClickHouseClient.entry_to_row(entry) for entry in batch]
+        if timing is not None:
+            timing['convert'] += time.perf_counter() - started
+
+        _worker_results.put({
+            'file_path': file_path,
+            'start': start,
+            'rows': rows,
+            'event_rows': [LogIngestionPipeline._security_event_row(event) for event in security_events],
+            'stats': {key: value for key, value in pipeline.stats.items() if key not in WRITER_STATS},
+            'timings': dict(timing) if timing is not None else None,
+            'raw_bytes': new_position - position,
+            'done': done,
+            'ok': ok
+        })
+        position = new_position
+        batch.clear()
+        security_events.clear()
+        for key in pipeline.stats:
+            pipeline.stats[key] = 0
+        if timing is not None:
+            for stage in timing:
+                timing[stage] = 0.0
+
+    for key in pipeline.stats:
+        pipeline.stats[key] = 0
+
+    try:
+        if end is None:
+            with LogFileReader(file_path) as reader:
+                for block in pipeline._read_blocks(reader):
+                    pipeline._process_lines(block, batch, security_events)
+                    if len(batch) >= pipeline.batch_size:
+                        send(reader.position)
+                end = reader.position
+        else:
+            for block in pipeline._read_blocks(iter_range_lines(file_path, start, end)):
+                pipeline._process_lines(block, batch, security_events)
+                if len(batch) >= pipeline.batch_size:
+                    send(position + pipeline.stats['bytes_read'])
+        ok = True
+    finally:
+        send(end if end is not None else position, done=True)
+
+
 @click.command()
 @click.option(
     '--file',
+    'files',
     required=True,
-    type=click.Path(exists=True),
-    help='Path to log file'
+    multiple=True,
+    help='Log file, directory or glob; repeatable (.gz/.bz2/.zst decompressed on the fly)'
 )
 @click.option(
     '--format',
@@ -303,7 +1195,141 @@ class LogIngestionPipeline:
     is_flag=True,
     help='Follow log file for new entries (tail -f mode)'
 )
-def main(file, log_format, batch_size, no_bot_detection, no_security_scan, follow):
+@click.option(
+    '--fast-parser',
+    is_flag=True,
+    help='Use the fast delimiter-splitting parser for Nginx combined logs'
+)
+@click.option(
+    '--workers',
+    default=1,
+    help='Number of parse/enrich worker processes'
+)
+@click.option(
+    '--manifest-file',
+    default='.ingest_manifest.json',
+    help='Records fully ingested files so re-runs skip them'
+)
+@click.option(
+    '--reingest',
+    is_flag=True,
+    help='Ignore the manifest and ingest every matched file'
+)
+@click.option(
+    '--checkpoint-file',
+    default='.ingest_checkpoints.json',
+    help='Where --follow persists per-file read offsets'
+)
+@click.option(
+    '--flush-interval',
+    default=5.0,
+    help='Max seconds --follow buffers rows before inserting'
+)
+@click.option(
+    '--scan-cache-size',
+    default=50000,
+    help='Max distinct requests whose security scan verdict is cached (0 disables)'
+)
+@click.option(
+    '--scan-cache-mb',
+    default=32,
+    help='Approximate memory budget of the scan verdict cache, per process'
+)
+@click.option(
+    '--rate-limits',
+    is_flag=True,
+    help='Flag request bursts, credential stuffing and scanners per IP while ingesting'
+)
+@click.option(
+    '--geoip',
+    'geo_database',
+    help='Fill country_code/city from a MaxMind .mmdb or a range file from scripts/build_geo_db.py'
+)
+@click.option(
+    '--geo-cache-size',
+    default=100000,
+    help='Max client IPs whose location is cached, per process'
+)
+@click.option(
+    '--columnar-insert',
+    is_flag=True,
+    help='Send inserts as per-column arrays (see benchmarks/bench_clickhouse_insert.py)'
+)
+@click.option(
+    '--compress-inserts',
+    is_flag=True,
+    help='LZ4-compress inserted blocks (needs lz4 and clickhouse-cityhash)'
+)
+@click.option(
+    '--insert-queue',
+    default=4,
+    help='Batches buffered ahead of the background writer before parsing blocks'
+)
+@click.option(
+    '--insert-connections',
+    default=1,
+    help='Batches inserted concurrently, each on its own ClickHouse connection'
+)
+@click.option(
+    '--insert-retries',
+    default=5,
+    help='Retries (with exponential backoff) before a batch is spooled to disk'
+)
+@click.option(
+    '--spool-dir',
+    default='.ingest_spool',
+    help='Where batches wait while ClickHouse is unavailable (replayed automatically)'
+)
+@click.option(
+    '--sessionize',
+    is_flag=True,
+    help='Build sessions while ingesting and insert them into fact_sessions'
+)
+@click.option(
+    '--session-timeout',
+    default=30,
+    help='Minutes of inactivity that end a session'
+)
+@click.option(
+    '--detect-anomalies',
+    is_flag=True,
+    help='Score each minute against online baselines and insert anomalies'
+)
+@click.option(
+    '--seasonal-baselines',
+    is_flag=True,
+    help='Compare each minute with the same hour of the week (with --detect-anomalies)'
+)
+@click.option(
+    '--anomaly-state',
+    default='.anomaly_baselines.json',
+    help='Where --detect-anomalies keeps its baselines between runs'
+)
+@click.option(
+    '--metrics-port',
+    type=int,
+    help='Serve per-stage timings, throughput and queue depths on http://HOST:PORT/metrics (Prometheus)'
+)
+@click.option(
+    '--stats-file',
+    help='Periodically write the same metrics as JSON to this file'
+)
+@click.option(
+    '--stats-interval',
+    default=10.0,
+    help='Seconds between --stats-file writes'
+)
+@click.option(
+    '--profile',
+    'profile_path',
+    help='Profile the run: *.html uses pyinstrument, anything else is a cProfile dump (main process only)'
+)
+def main(files, log_format, batch_size, no_bot_detection, no_security_scan, follow,
+         fast_parser, workers, manifest_file, reingest, checkpoint_file, flush_interval,
+         scan_cache_size, scan_cache_mb, rate_limits, geo_database, geo_cache_size,
+         columnar_insert, compress_inserts, insert_queue, insert_connections, insert_retries,
+         spool_dir, sessionize, session_timeout, detect_anomalies, seasonal_baselines, anomaly_state,
+         metrics_port, stats_file, stats_interval, profile_path):
     """
     Ingest server logs into analytics warehouse
 
@@ -318,16 +1344,103 @@ def main(file, log_format, batch_size, no_bot_detection, no_security_scan, follo
         # Ingest CloudFlare logs with smaller batches
         python ingest_logs.py --file cf_logs.json --format cloudflare --batch-size 5000
 
-        # Follow log file for continuous ingestion
-        python ingest_logs.py --file /var/log/nginx/access.log --follow
+        # Ingest CloudFlare Logpush gzip batches straight from the bucket sync
+        python ingest_logs.py --file 'logpush/*.log.gz' --format cloudflare --workers 4
+
+        # Parse and enrich a large file on 8 cores with the fast Nginx parser
+        python ingest_logs.py --file access.log --workers 8 --fast-parser
+
+        # Add country and city from a GeoLite2 City database
+        python ingest_logs.py --file access.log --workers 8 --geoip GeoLite2-City.mmdb
+
+        # Backfill a month of rotated, gzipped logs (already-ingested files are skipped)
+        python ingest_logs.py --file '/var/log/nginx/access.log.*.gz' --workers 8
+
+        # Follow log file for continuous ingestion (resumes from checkpoint)
+        python ingest_logs.py --file /var/log/nginx/access.log --follow --flush-interval 2
+
+        # ...and flag unusual minutes as they are ingested
+        python ingest_logs.py --file /var/log/nginx/access.log --follow --detect-anomalies --seasonal-baselines
+
+        # Expose stage timings to Prometheus and profile a run
+        python ingest_logs.py --file access.log --metrics-port 9108 --profile ingest.prof
     """
 
+    file_paths = expand_inputs(list(files))
+    missing = [path for path in file_paths if not os.path.isfile(path)]
+
+    if not file_paths or missing:
+        console.print(f"[red]No such log file: {', '.join(missing) or ', '.join(files)}[/red]")
+        sys.exit(1)
+
+    if follow and (len(file_paths) != 1 or is_compressed(file_paths[0])):
+        console.print("[red]--follow requires a single uncompressed log file[/red]")
+        sys.exit(1)
+
+    if sessionize and workers > 1:
+        # Sessions need every request of a visitor in time order in one process
+        console.print("[red]--sessionize requires --workers 1[/red]")
+        sys.exit(1)
+
+    logs = {rotation_key(path)[0] for path in file_paths}
+    if (sessionize or detect_anomalies) and len(logs) > 1:
+        # Rotations of one log are read oldest first, but separate logs are read one after another
+        console.print(
+            f"[yellow]⚠ {len(logs)} separate logs are read one after another, not merged by time; "
+            f"sessions and anomaly baselines assume time-ordered input[/yellow]"
+        )
+
+    if rate_limits and no_security_scan:
+        console.print("[red]--rate-limits is part of the security scan; drop --no-security-scan[/red]")
+        sys.exit(1)
+
+    if rate_limits and workers > 1:
+        # Each worker would only see the requests of its own byte ranges
+        console.print("[red]--rate-limits requires --workers 1[/red]")
+        sys.exit(1)
+
+    if detect_anomalies and workers > 1:
+        # Minutes are scored in log order as entries are seen by this process
+        console.print("[red]--detect-anomalies requires --workers 1[/red]")
+        sys.exit(1)
+
+    if profile_path and profile_path.endswith('.html') and not PYINSTRUMENT_AVAILABLE:
+        console.print("[red]HTML profiles need pyinstrument (pip install pyinstrument); use a .prof path for cProfile[/red]")
+        sys.exit(1)
+
+    if geo_database:
+        # Fail before ingesting anything rather than in every worker
+        try:
+            open_database(geo_database).close()
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Cannot open geo database: {e}[/red]")
+            sys.exit(1)
+
     # Initialize pipeline
     pipeline = LogIngestionPipeline(
         log_format=log_format,
         batch_size=batch_size,
         enable_bot_detection=not no_bot_detection,
-        enable_security_scan=not no_security_scan
+        enable_security_scan=not no_security_scan,
+        workers=workers,
+        fast_parser=fast_parser,
+        scan_cache_size=scan_cache_size,
+        scan_cache_mb=scan_cache_mb,
+        rate_limits=rate_limits,
+        geo_database=geo_database,
+        geo_cache_size=geo_cache_size,
+        columnar_insert=columnar_insert,
+        compress_inserts=compress_inserts,
+        insert_queue_size=insert_queue,
+        insert_connections=insert_connections,
+        insert_retries=insert_retries,
+        spool_dir=spool_dir,
+        sessionize=sessionize,
+        session_timeout_minutes=session_timeout,
+        detect_anomalies=detect_anomalies,
+        seasonal_baselines=seasonal_baselines,
+        anomaly_state=anomaly_state,
+        instrument=bool(metrics_port or stats_file)
     )
 
     # Check database connection
@@ -340,13 +1453,35 @@ def main(file, log_format, batch_size, no_bot_detection, no_security_scan, follo
         console.print("  docker-compose up -d")
         sys.exit(1)
 
+    exporters = []
+    if metrics_port:
+        exporters.append(MetricsServer(pipeline.metrics, metrics_port))
+    if stats_file:
+        exporters.append(StatsFileWriter(pipeline.metrics, stats_file, interval=stats_interval))
+
     if follow:
-        console.print("[yellow]Follow mode not yet implemented[/yellow]")
-        console.print("[yellow]Use --file without --follow for now[/yellow]")
-        sys.exit(1)
+        if workers > 1:
+            console.print("[yellow]--workers is ignored in follow mode[/yellow]")
+
+        # Continuous ingestion
+        run, args = pipeline.follow_file, (file_paths[0], checkpoint_file, flush_interval)
     else:
         # One-time ingestion
-        pipeline.ingest_file(file)
+        manifest = None if reingest else IngestManifest(manifest_file)
+        run, args = pipeline.ingest_files, (file_paths, manifest)
+
+    for exporter in exporters:
+        exporter.start()
+
+    try:
+        if profile_path:
+            run_profiled(profile_path, run, *args)
+            console.print(f"Profile written to {profile_path}")
+        else:
+            run(*args)
+    finally:
+        for exporter in exporters:
+            exporter.stop()
 
 
 if __name__ == '__main__':
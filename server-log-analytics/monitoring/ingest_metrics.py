@@ -0,0 +1,435 @@
+"""
+Ingest Metrics - Per-stage timings, throughput, queue depths and insert latency
+Exposed as Prometheus text over HTTP, as a periodically written JSON file, or both
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable
+
+# Try to import pyinstrument for --profile *.html
+try:
+    import pyinstrument
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    PYINSTRUMENT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Histogram upper bounds (seconds): stage time per batch, insert round-trips
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Seconds of history behind the lines/sec and bytes/sec gauges
+RATE_WINDOW = 60.0
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (Prometheus semantics: cumulative ``le`` buckets)
+
+    Quantiles are interpolated inside the bucket that holds the rank, the
+    same estimate Prometheus' histogram_quantile() gives.
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds: Iterable[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """Record one value"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile (0..1); 0.0 when empty"""
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+
+        for bound, count in zip(self.bounds, self.counts):
+            if count and seen + count >= rank:
+                return min(lower + (bound - lower) * (rank - seen) / count, self.max)
+            seen += count
+            lower = bound
+
+        # Rank falls in +Inf: the largest value seen is the best bound
+        return self.max
+
+    def to_dict(self) -> Dict:
+        """Summary for the JSON stats file"""
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
+
+
+class IngestMetrics:
+    """
+    Metrics registry for one LogIngestionPipeline
+
+    The pipeline accumulates per-line stage times into a plain dict
+    (new_stage_times()) and folds it in once per batch with observe_batch(),
+    so instrumentation costs a few clock reads per line and no locking on
+    the hot path. Worker processes send their stage dicts with each row
+    batch. The writer thread reports each insert round-trip through
+    observe_insert(). Counters are read from the pipeline's stats dict and
+    queue depths from registered gauge callbacks when a snapshot is taken.
+    """
+
+    # Time spent per line (parse, bot_detection, geo, security_scan) or per
+    # batch (the rest); insert_wait is time blocked on a full writer queue
+    STAGES = (
+        'parse', 'bot_detection', 'geo', 'security_scan', 'sessionize',
+        'anomalies', 'convert', 'insert_wait'
+    )
+
+    def __init__(self, stats: Dict, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        """
+        Initialize metrics
+
+        Args:
+            stats: The pipeline's stats dict (exported as counters)
+            buckets: Histogram upper bounds in seconds
+        """
+        self.stats = stats
+        self.started = time.monotonic()
+
+        self.stage_seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.stage_histograms = {stage: Histogram(buckets) for stage in self.STAGES}
+        self.insert_histograms: Dict[str, Histogram] = {}
+        self.batches = 0
+
+        self._buckets = tuple(buckets)
+        self._gauges: Dict[str, tuple] = {}
+        self._samples = deque()  # (monotonic, total_lines, bytes_read)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def new_stage_times(cls) -> Dict[str, float]:
+        """Zeroed per-batch stage accumulator"""
+        return dict.fromkeys(cls.STAGES, 0.0)
+
+    def register_gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        """
+        Add a gauge evaluated at snapshot time (e.g. a queue depth)
+
+        Args:
+            name: Metric name without the ``ingest_`` prefix
+            help_text: One-line description
+            read: Returns the current value; errors are reported as 0
+        """
+        self._gauges[name] = (help_text, read)
+
+    def observe_batch(self, stage_times: Dict[str, float]):
+        """
+        Fold one batch's stage times into the totals and histograms
+
+        Args:
+            stage_times: Seconds per stage (reset by the caller afterwards)
+        """
+        with self._lock:
+            self.batches += 1
+            for stage, seconds in stage_times.items():
+                self.stage_seconds[stage] += seconds
+                self.stage_histograms[stage].observe(seconds)
+            self._sample()
+
+    def observe_insert(self, table: str, seconds: float):
+        """
+        Record one insert round-trip (called by BufferedWriter)
+
+        Args:
+            table: Target table
+            seconds: Wall time of the insert call
+        """
+        with self._lock:
+            histogram = self.insert_histograms.get(table)
+            if histogram is None:
+                histogram = self.insert_histograms[table] = Histogram(self._buckets)
+            histogram.observe(seconds)
+
+    def _sample(self):
+        """Record throughput counters for the rate gauges; caller holds the lock"""
+        now = time.monotonic()
+        if self._samples and now - self._samples[-1][0] < 1.0:
+            return
+
+        self._samples.append((now, self.stats.get('total_lines', 0), self.stats.get('bytes_read', 0)))
+        while len(self._samples) > 2 and now - self._samples[1][0] > RATE_WINDOW:
+            self._samples.popleft()
+
+    def _rates(self, now: float) -> tuple:
+        """(lines/sec, bytes/sec) over roughly the last RATE_WINDOW seconds"""
+        if not self._samples:
+            return 0.0, 0.0
+
+        since, lines, size = self._samples[0]
+        elapsed = now - since
+        if elapsed <= 0:
+            return 0.0, 0.0
+
+        return (
+            (self.stats.get('total_lines', 0) - lines) / elapsed,
+            (self.stats.get('bytes_read', 0) - size) / elapsed
+        )
+
+    def snapshot(self) -> Dict:
+        """
+        Current values of every metric
+
+        Returns:
+            Dict with counters, rates, gauges, stage and insert latency summaries
+        """
+        with self._lock:
+            self._sample()
+            now = time.monotonic()
+            uptime = now - self.started
+            lines_per_second, bytes_per_second = self._rates(now)
+
+            gauges = {}
+            for name, (_, read) in self._gauges.items():
+                try:
+                    gauges[name] = read()
+                except Exception:
+                    # e.g. multiprocessing.Queue.qsize() on macOS
+                    gauges[name] = 0
+
+            busy = sum(self.stage_seconds.values())
+
+            return {
+                'timestamp': time.time(),
+                'uptime_seconds': uptime,
+                'counters': {key: value for key, value in self.stats.items() if key != 'processing_time'},
+                'lines_per_second': lines_per_second,
+                'bytes_per_second': bytes_per_second,
+                'avg_lines_per_second': self.stats.get('total_lines', 0) / uptime if uptime > 0 else 0.0,
+                'gauges': gauges,
+                'batches': self.batches,
+                'stages': {
+                    stage: {
+                        'seconds': seconds,
+                        'share': seconds / busy if busy > 0 else 0.0,
+                        'per_batch': self.stage_histograms[stage].to_dict()
+                    }
+                    for stage, seconds in self.stage_seconds.items()
+                },
+                'insert_latency': {
+                    table: histogram.to_dict()
+                    for table, histogram in self.insert_histograms.items()
+                }
+            }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: Iterable[tuple]):
+            lines.append(f"# HELP ingest_{name} {help_text}")
+            lines.append(f"# TYPE ingest_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"ingest_{name}{labels} {value:g}" if isinstance(value, float) else f"ingest_{name}{labels} {value}")
+
+        for key, value in snapshot['counters'].items():
+            metric(f"{key}_total", 'counter', f"Pipeline counter {key}", [('', value)])
+
+        metric('lines_per_second', 'gauge', f"Lines read per second over the last {RATE_WINDOW:g}s",
+               [('', snapshot['lines_per_second'])])
+        metric('bytes_per_second', 'gauge', f"Bytes read per second over the last {RATE_WINDOW:g}s",
+               [('', snapshot['bytes_per_second'])])
+
+        for name, (help_text, _) in self._gauges.items():
+            metric(name, 'gauge', help_text, [('', snapshot['gauges'][name])])
+
+        metric('stage_seconds_total', 'counter', 'Time spent per pipeline stage',
+               [(f'{{stage="{stage}"}}', stage_info['seconds']) for stage, stage_info in snapshot['stages'].items()])
+
+        with self._lock:
+            histograms = [('stage_batch_seconds', 'Stage time per batch', 'stage', self.stage_histograms),
+                          ('insert_seconds', 'ClickHouse insert round-trip time', 'table', self.insert_histograms)]
+
+            for name, help_text, label, by_label in histograms:
+                lines.append(f"# HELP ingest_{name} {help_text}")
+                lines.append(f"# TYPE ingest_{name} histogram")
+                for value, histogram in by_label.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                        lines.append(f'ingest_{name}_bucket{{{label}="{value}",le="{le}"}} {cumulative}')
+                    lines.append(f'ingest_{name}_sum{{{label}="{value}"}} {histogram.sum:g}')
+                    lines.append(f'ingest_{name}_count{{{label}="{value}"}} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Serves IngestMetrics over HTTP from a daemon thread
+
+    GET /metrics returns Prometheus text, GET /stats.json the JSON snapshot.
+    """
+
+    def __init__(self, metrics: IngestMetrics, port: int, host: str = '0.0.0.0'):
+        """
+        Initialize server
+
+        Args:
+            metrics: Registry to expose
+            port: TCP port
+            host: Bind address
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        """Bind and start serving"""
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/stats.json':
+                    body = json.dumps(metrics.snapshot(), indent=2).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes every few seconds would drown the ingest log
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+        logger.info(f"Serving ingest metrics on http://{self.host}:{self.server.server_port}/metrics")
+
+    def stop(self):
+        """Stop serving"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class StatsFileWriter:
+    """
+    Writes IngestMetrics snapshots to a JSON file every ``interval`` seconds
+
+    Each write replaces the file atomically, so readers never see it partial;
+    a last snapshot is written on stop().
+    """
+
+    def __init__(self, metrics: IngestMetrics, path: str, interval: float = 10.0):
+        """
+        Initialize writer
+
+        Args:
+            metrics: Registry to snapshot
+            path: JSON file to (re)write
+            interval: Seconds between writes
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start the writer thread"""
+        self.thread = threading.Thread(target=self._run, name='stats-file', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        """Write one snapshot now"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.metrics.snapshot(), f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write stats file {self.path}: {e}")
+
+    def stop(self):
+        """Stop the thread and write a final snapshot"""
+        self._stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.write()
+
+
+def run_profiled(path: str, func: Callable, *args, **kwargs):
+    """
+    Run func under a profiler and save the result
+
+    ``*.html`` paths use pyinstrument (statistical, readable call tree);
+    anything else is a cProfile dump for pstats/snakeviz. Only the calling
+    process is profiled, not --workers subprocesses.
+
+    Args:
+        path: Output file
+        func: Callable to profile
+
+    Returns:
+        Whatever func returns
+    """
+    if path.endswith('.html'):
+        if not PYINSTRUMENT_AVAILABLE:
+            raise ImportError("pyinstrument is required for HTML profiles (pip install pyinstrument)")
+
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            logger.info(f"Wrote pyinstrument profile to {path}")
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
+        logger.info(f"Wrote cProfile stats to {path} (python -m pstats {path})")
@@ -6,17 +6,26 @@ Extracts structured data from raw log lines
 import re
 import logging
 from typing import Dict, Optional, List
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
+from functools import lru_cache
 from urllib.parse import urlparse, parse_qs
 import hashlib
 
+from parsers.logpush import LogpushSchema, decode_ndjson, to_datetime
+
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedLogEntry:
-    """Structured log entry"""
+    """
+    Structured log entry
+
+    Slotted, so a batch of entries holds no per-row attribute dicts; strings
+    that repeat across rows (method, path, user agent, ...) are shared
+    objects when produced by LogParser (see LogParser._intern).
+    """
     # Request info
     timestamp: datetime
     method: str
@@ -30,16 +39,27 @@ class ParsedLogEntry:
     response_time_ms: Optional[int] = None
 
     # Client
-    ip_address: str
-    user_agent: str
+    ip_address: str = ""
+    user_agent: str = ""
     referer: str = ""
 
     # Session
     session_id: str = ""
 
+    # Enrichment (filled in by the ingestion pipeline)
+    is_bot: bool = False
+    bot_type: str = ""
+    device_type: str = ""
+    browser: str = ""
+    os: str = ""
+    is_suspicious: bool = False
+    attack_type: str = ""
+    country_code: str = ""
+    city: str = ""
+
     # Metadata
     log_format: str = "nginx"
-    raw_line: str = ""
+    raw_line: str = ""  # Only kept with LogParser(keep_raw_line=True)
 
 
 class LogParser:
@@ -73,10 +93,45 @@ class LogParser:
         r'"(?P<user_agent>[^"]*)"'
     )
 
-    def __init__(self):
+    # Timestamp strings have one-second resolution and logs are roughly time
+    # ordered, so a small memo covers almost every line
+    TIMESTAMP_CACHE_SIZE = 4096
+
+    # Distinct strings shared between entries (see _intern); a batch of
+    # 10,000 rows typically repeats a few hundred paths and user agents
+    STRING_CACHE_SIZE = 65536
+
+    # Characters of the raw line kept with keep_raw_line
+    RAW_LINE_LIMIT = 500
+
+    # Month abbreviations for the fixed-width CLF timestamp fast path
+    MONTHS = {
+        'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+        'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+    }
+
+    def __init__(self, fast: bool = False, session_cache_size: int = 65536, keep_raw_line: bool = False):
+        """
+        Initialize parser
+
+        Args:
+            fast: Use the delimiter-splitting fast path for Nginx combined logs
+                  (falls back to the regex for any line it cannot handle)
+            session_cache_size: LRU size for (ip, user agent) -> session ID in fast mode
+            keep_raw_line: Store the first RAW_LINE_LIMIT characters of each
+                           line in ParsedLogEntry.raw_line (off: left empty)
+        """
+        self.fast = fast
+        self.keep_raw_line = keep_raw_line
         self.parsed_count = 0
         self.error_count = 0
 
+        self._timestamp_cache = {}
+        self._timezone_cache = {}
+        self._strings = {}
+        self._logpush_schemas = {}
+        self._cached_session_id = lru_cache(maxsize=session_cache_size)(self._generate_session_id)
+
     def parse_line(self, line: str, format_type: str = "nginx") -> Optional[ParsedLogEntry]:
         """
         Parse a single log line
@@ -103,6 +158,8 @@ class LogParser:
         """
         try:
             if log_format == "nginx":
+                if self.fast:
+                    return self._parse_nginx_fast(line)
                 return self._parse_nginx(line)
             elif log_format == "apache":
                 return self._parse_apache(line)
@@ -154,19 +211,117 @@ class LogParser:
 
         entry = ParsedLogEntry(
             timestamp=timestamp,
-            method=method,
-            path=path,
+            method=self._intern(method),
+            path=self._intern(path),
             query_string=query_string,
-            http_version=http_version,
+            http_version=self._intern(http_version),
             status_code=int(groups['status']),
             response_bytes=response_bytes,
             response_time_ms=response_time_ms,
-            ip_address=groups['ip'],
-            user_agent=groups.get('user_agent', ''),
-            referer=groups.get('referer', ''),
+            ip_address=self._intern(groups['ip']),
+            user_agent=self._intern(groups.get('user_agent', '')),
+            referer=self._intern(groups.get('referer', '')),
             session_id=session_id,
             log_format='nginx',
-            raw_line=line[:500]  # Limit stored raw line
+            raw_line=self._raw_line(line)
+        )
+
+        self.parsed_count += 1
+        return entry
+
+    def _parse_nginx_fast(self, line: str) -> Optional[ParsedLogEntry]:
+        """
+        Parse Nginx combined log format by splitting on fixed delimiters
+
+        Only canonical lines are handled here; anything unusual (tabs or
+        control characters, odd spacing, quotes inside fields) is handed to
+        the regex parser, so results are identical to _parse_nginx.
+        """
+        # Prefilter: the only whitespace allowed is plain ASCII space
+        if not line.isprintable():
+            return self._parse_nginx(line)
+
+        # ip - remote_user [time] "
+        ip_end = line.find(' - ')
+        user_end = line.find(' ', ip_end + 3)
+        time_end = line.find(']', user_end)
+        if (
+            ip_end <= 0 or user_end <= ip_end + 3 or time_end <= user_end + 2
+            or line[user_end + 1:user_end + 2] != '['
+            or line[time_end + 1:time_end + 3] != ' "'
+        ):
+            return self._parse_nginx(line)
+
+        ip = line[:ip_end]
+        if not ip.replace('.', '').isdecimal():
+            return self._parse_nginx(line)
+        time_str = line[user_end + 2:time_end]
+
+        # "METHOD PATH PROTOCOL"
+        request_end = line.find('"', time_end + 3)
+        if request_end < 0 or line[request_end + 1:request_end + 2] != ' ':
+            return self._parse_nginx(line)
+        request = line[time_end + 3:request_end].split(' ')
+        if len(request) != 3 or not request[0] or not request[1] or not request[2]:
+            return self._parse_nginx(line)
+        method, uri, http_version = request
+
+        # status size "referer" "user_agent"
+        status_start = request_end + 2
+        size_end = line.find(' ', status_start + 4)
+        status_str = line[status_start:status_start + 3]
+        size_str = line[status_start + 4:size_end]
+        if (
+            size_end < 0
+            or line[status_start + 3:status_start + 4] != ' '
+            or not status_str.isdecimal()
+            or not (size_str == '-' or size_str.isdecimal())
+            or line[size_end + 1:size_end + 2] != '"'
+        ):
+            return self._parse_nginx(line)
+
+        referer_end = line.find('"', size_end + 2)
+        agent_end = line.find('"', referer_end + 3)
+        if referer_end < 0 or agent_end < 0 or line[referer_end + 1:referer_end + 3] != ' "':
+            return self._parse_nginx(line)
+        referer = line[size_end + 2:referer_end]
+        user_agent = line[referer_end + 3:agent_end]
+
+        # Optional "forwarded_for" and response time
+        tail = line[agent_end + 1:]
+        response_time_ms = None
+        if tail:
+            if tail.startswith(' "') and tail.find('"', 2) > 0:
+                tail = tail[tail.find('"', 2) + 1:]
+            if tail.startswith(' ') and len(tail) > 1:
+                response_time = tail[1:].split(' ', 1)[0]
+                if response_time.strip('0123456789.'):
+                    return self._parse_nginx(line)
+                try:
+                    response_time_ms = int(float(response_time) * 1000)
+                except ValueError:
+                    pass
+
+        path, query_string = self._split_uri(uri)
+
+        ip = self._intern(ip)
+        user_agent = self._intern(user_agent)
+
+        entry = ParsedLogEntry(
+            timestamp=self._parse_timestamp_cached(time_str),
+            method=self._intern(method),
+            path=self._intern(path),
+            query_string=query_string,
+            http_version=self._intern(http_version),
+            status_code=int(status_str),
+            response_bytes=int(size_str) if size_str != '-' else 0,
+            response_time_ms=response_time_ms,
+            ip_address=ip,
+            user_agent=user_agent,
+            referer=self._intern(referer),
+            session_id=self._cached_session_id(ip, user_agent),
+            log_format='nginx',
+            raw_line=self._raw_line(line)
         )
 
         self.parsed_count += 1
@@ -201,66 +356,179 @@ class LogParser:
 
         entry = ParsedLogEntry(
             timestamp=timestamp,
-            method=method,
-            path=path,
+            method=self._intern(method),
+            path=self._intern(path),
             query_string=query_string,
-            http_version=http_version,
+            http_version=self._intern(http_version),
             status_code=int(groups['status']),
             response_bytes=response_bytes,
-            ip_address=groups['ip'],
-            user_agent=groups.get('user_agent', ''),
-            referer=groups.get('referer', ''),
+            ip_address=self._intern(groups['ip']),
+            user_agent=self._intern(groups.get('user_agent', '')),
+            referer=self._intern(groups.get('referer', '')),
             session_id=session_id,
             log_format='apache',
-            raw_line=line[:500]
+            raw_line=self._raw_line(line)
         )
 
         self.parsed_count += 1
         return entry
 
     def _parse_cloudflare(self, line: str) -> Optional[ParsedLogEntry]:
-        """Parse CloudFlare JSON log format"""
-        import json
+        """Parse one CloudFlare Logpush JSON line (see parse_cloudflare_batch for blocks)"""
+        return self.parse_cloudflare_batch([line])[0]
 
-        try:
-            data = json.loads(line)
-
-            # CloudFlare uses different field names
-            timestamp = datetime.fromtimestamp(data['EdgeStartTimestamp'] / 1000)
-
-            # Parse request
-            method = data.get('ClientRequestMethod', 'GET')
-            uri = data.get('ClientRequestURI', '/')
-            path, query_string = self._split_uri(uri)
-
-            entry = ParsedLogEntry(
-                timestamp=timestamp,
-                method=method,
-                path=path,
-                query_string=query_string,
-                http_version=data.get('ClientRequestProtocol', 'HTTP/1.1'),
-                status_code=int(data.get('EdgeResponseStatus', 200)),
-                response_bytes=int(data.get('EdgeResponseBytes', 0)),
-                ip_address=data.get('ClientIP', ''),
-                user_agent=data.get('ClientRequestUserAgent', ''),
-                referer=data.get('ClientRequestReferer', ''),
-                session_id=self._generate_session_id(
-                    data.get('ClientIP', ''),
-                    data.get('ClientRequestUserAgent', '')
-                ),
-                log_format='cloudflare',
-                raw_line=line[:500]
-            )
+    def parse_cloudflare_batch(self, lines: List) -> List[Optional[ParsedLogEntry]]:
+        """
+        Parse a block of CloudFlare Logpush NDJSON lines
+
+        The block is decoded in one pass (orjson when installed, see
+        decode_ndjson) and each record is projected through the LogpushSchema
+        of its field set, resolved once per distinct set, so files from jobs
+        with different field lists need no per-line fallback.
+
+        Args:
+            lines: Raw lines (bytes, as read from plain or gzipped Logpush files, or str)
+
+        Returns:
+            One entry per line, None where a line could not be parsed
+        """
+        entries = []
+        schema = None
+
+        for line, record in zip(lines, decode_ndjson(lines)):
+            if record is None:
+                self.error_count += 1
+                entries.append(None)
+                continue
+
+            try:
+                if schema is None or len(record) != schema.width:
+                    schema = LogpushSchema.for_record(record, self._logpush_schemas)
+
+                try:
+                    entry = self._logpush_entry(record, schema, line)
+                except KeyError:
+                    # Same width, different fields: resolve this record's set
+                    schema = LogpushSchema.for_record(record, self._logpush_schemas)
+                    entry = self._logpush_entry(record, schema, line)
+
+            except (KeyError, TypeError, ValueError, AttributeError, OverflowError, OSError) as e:
+                self.error_count += 1
+                logger.debug(f"Error parsing CloudFlare log: {e}")
+                entries.append(None)
+                continue
 
             self.parsed_count += 1
-            return entry
+            entries.append(entry)
 
-        except (json.JSONDecodeError, KeyError) as e:
-            logger.debug(f"Error parsing CloudFlare log: {e}")
-            return None
+        return entries
+
+    def _logpush_entry(self, record: dict, schema: LogpushSchema, line) -> ParsedLogEntry:
+        """Build an entry from a decoded Logpush record"""
+        if schema.timestamp is None:
+            raise ValueError("record has no timestamp field")
+
+        intern = self._intern
+
+        if schema.uri:
+            path, query_string = self._split_uri(record[schema.uri])
+        else:
+            path = record[schema.path] if schema.path else '/'
+            query_string = record[schema.query] if schema.query else ''
+            if query_string.startswith('?'):
+                query_string = query_string[1:]
+
+        ip = intern(record[schema.ip]) if schema.ip else ''
+        user_agent = intern(record[schema.user_agent]) if schema.user_agent else ''
+
+        response_time = record[schema.response_time] if schema.response_time else None
+        if response_time is not None:
+            response_time = int(response_time) // schema.response_time_divisor
+
+        if self.keep_raw_line and isinstance(line, bytes):
+            line = line.decode('utf-8', errors='ignore')
+
+        return ParsedLogEntry(
+            timestamp=to_datetime(record[schema.timestamp]),
+            method=intern(record[schema.method]) if schema.method else 'GET',
+            path=intern(path),
+            query_string=query_string,
+            http_version=intern(record[schema.protocol]) if schema.protocol else 'HTTP/1.1',
+            status_code=int(record[schema.status]) if schema.status else 200,
+            response_bytes=int(record[schema.bytes]) if schema.bytes else 0,
+            response_time_ms=response_time,
+            ip_address=ip,
+            user_agent=user_agent,
+            referer=intern(record[schema.referer]) if schema.referer else '',
+            session_id=self._cached_session_id(ip, user_agent),
+            log_format='cloudflare',
+            raw_line=self._raw_line(line)
+        )
 
     def _parse_timestamp(self, time_str: str) -> datetime:
         """Parse various timestamp formats"""
+        timestamp = self._strptime(time_str)
+        if timestamp:
+            return timestamp
+
+        # Fallback to current time if parsing fails
+        logger.warning(f"Could not parse timestamp: {time_str}")
+        return datetime.utcnow()
+
+    def _parse_timestamp_cached(self, time_str: str) -> datetime:
+        """Parse a timestamp, memoized on the (per-second) timestamp string"""
+        timestamp = self._timestamp_cache.get(time_str)
+        if timestamp is not None:
+            return timestamp
+
+        timestamp = self._parse_clf_timestamp(time_str) or self._strptime(time_str)
+        if timestamp is None:
+            return self._parse_timestamp(time_str)
+
+        if len(self._timestamp_cache) >= self.TIMESTAMP_CACHE_SIZE:
+            self._timestamp_cache.clear()
+        self._timestamp_cache[time_str] = timestamp
+
+        return timestamp
+
+    def _parse_clf_timestamp(self, time_str: str) -> Optional[datetime]:
+        """
+        Parse the fixed-width Nginx/Apache timestamp (01/Jan/2024:12:00:00 +0000)
+        without strptime; returns None for anything else so strptime can decide
+        """
+        if (
+            len(time_str) != 26 or not time_str.isascii()
+            or time_str[2] != '/' or time_str[6] != '/' or time_str[11] != ':'
+            or time_str[14] != ':' or time_str[17] != ':' or time_str[20] != ' '
+            or time_str[21] not in '+-'
+        ):
+            return None
+
+        month = self.MONTHS.get(time_str[3:6])
+        digits = (time_str[0:2], time_str[7:11], time_str[12:14], time_str[15:17],
+                  time_str[18:20], time_str[22:24], time_str[24:26])
+        if month is None or not all(d.isdigit() for d in digits):
+            return None
+
+        try:
+            tz = self._timezone_cache.get(time_str[21:])
+            if tz is None:
+                if int(time_str[24:26]) > 59:
+                    return None
+                offset = timedelta(hours=int(time_str[22:24]), minutes=int(time_str[24:26]))
+                tz = timezone(-offset if time_str[21] == '-' else offset)
+                self._timezone_cache[time_str[21:]] = tz
+
+            return datetime(
+                int(time_str[7:11]), month, int(time_str[0:2]),
+                int(time_str[12:14]), int(time_str[15:17]), int(time_str[18:20]),
+                tzinfo=tz
+            )
+        except ValueError:
+            return None
+
+    def _strptime(self, time_str: str) -> Optional[datetime]:
+        """Try the supported timestamp formats, returning None if none match"""
         # Nginx/Apache format: 01/Jan/2024:12:00:00 +0000
         formats = [
             '%d/%b/%Y:%H:%M:%S %z',
@@ -274,9 +542,7 @@ class LogParser:
             except ValueError:
                 continue
 
-        # Fallback to current time if parsing fails
-        logger.warning(f"Could not parse timestamp: {time_str}")
-        return datetime.utcnow()
+        return None
 
     def _parse_request_line(self, request: str) -> tuple:
         """
@@ -297,6 +563,28 @@ class LogParser:
 
         return (method, path, query_string, http_version)
 
+    def _intern(self, value: str) -> str:
+        """
+        Return a shared copy of a string that repeats across lines
+
+        Every entry parsed from the same user agent, path, referer or IP then
+        references one string object instead of its own slice of the line.
+        The table is bounded and simply restarts when full.
+        """
+        shared = self._strings.get(value)
+        if shared is not None:
+            return shared
+
+        if len(self._strings) >= self.STRING_CACHE_SIZE:
+            self._strings.clear()
+        self._strings[value] = value
+
+        return value
+
+    def _raw_line(self, line: str) -> str:
+        """The stored raw line: a bounded prefix with keep_raw_line, else empty"""
+        return line[:self.RAW_LINE_LIMIT] if self.keep_raw_line else ""
+
     def _split_uri(self, uri: str) -> tuple:
         """Split URI into path and query string"""
         if '?' in uri:
@@ -0,0 +1,512 @@
+"""
+Log Reader - File access helpers for the ingestion pipeline
+Reads plain and compressed logs, expands globs/directories, tails live log
+files across logrotate, persists per-file offsets and an ingest manifest,
+and shards files into newline-aligned byte ranges for parallel parsing
+"""
+
+import bz2
+import glob
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Try to import zstandard for .zst input
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.zst')
+
+# Leading bytes of each compressed format, for files whose name does not say
+# (e.g. Logpush batches copied out of object storage without their .gz)
+COMPRESSION_MAGIC = ((b'\x1f\x8b', '.gz'), (b'\x28\xb5\x2f\xfd', '.zst'), (b'BZh', '.bz2'))
+
+# logrotate suffixes: a date (dateext, e.g. access.log-20240131) or an index (access.log.3)
+ROTATION_SUFFIX = re.compile(r'^(.+?)(?:[.-](\d{4}-?\d{2}-?\d{2})|\.(\d+))$')
+
+
+def _read_json(path: str) -> Dict:
+    """Load a JSON state file (empty if missing or unreadable)"""
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable state file {path}: {e}")
+        return {}
+
+
+def _write_json_atomic(path: str, data: Dict):
+    """Write a JSON state file atomically so a crash never leaves it partial"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def compression_of(file_path: str) -> str:
+    """
+    Compression of a file as its extension ('.gz', '.bz2', '.zst'), '' if plain
+
+    Decided by the file name, or else by the file's leading bytes.
+    """
+    for extension in COMPRESSED_EXTENSIONS:
+        if file_path.endswith(extension):
+            return extension
+
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(4)
+    except OSError:
+        return ''
+
+    for magic, extension in COMPRESSION_MAGIC:
+        if head.startswith(magic) and (extension != '.bz2' or head[3:4].isdigit()):
+            return extension
+
+    return ''
+
+
+def is_compressed(file_path: str) -> bool:
+    """Check whether a file is read through a decompressor"""
+    return bool(compression_of(file_path))
+
+
+def rotation_key(file_path: str) -> Tuple[str, int, int]:
+    """
+    Sort key putting the rotations of a log oldest first
+
+    access.log.3.gz, access.log.2.gz, access.log.1, access.log: the highest
+    index is the oldest, dated rotations go in date order, and the live file
+    (no suffix) comes last. The first item is the log the file belongs to.
+    """
+    name = file_path
+    for extension in COMPRESSED_EXTENSIONS:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+            break
+
+    match = ROTATION_SUFFIX.match(name)
+    if not match:
+        return name, 1, 0
+
+    stem, date, index = match.groups()
+    if date:
+        return stem, 0, int(date.replace('-', ''))
+    return stem, 0, -int(index)
+
+
+def expand_inputs(inputs: List[str]) -> List[str]:
+    """
+    Expand file paths, glob patterns and directories into a list of files
+
+    Directories contribute their non-hidden regular files (not recursive).
+    Duplicates are dropped. Logs keep the order they first appear in the
+    inputs, and the rotations of each log are read oldest first (see
+    rotation_key), so sessions and per-minute baselines see time order.
+
+    Args:
+        inputs: Paths, globs (e.g. 'access.log.*.gz') or directories
+
+    Returns:
+        List of file paths
+    """
+    paths = []
+    seen = set()
+
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = sorted(
+                os.path.join(item, name)
+                for name in os.listdir(item)
+                if not name.startswith('.') and os.path.isfile(os.path.join(item, name))
+            )
+        elif any(char in item for char in '*?['):
+            matches = sorted(path for path in glob.glob(item) if os.path.isfile(path))
+        else:
+            matches = [item]
+
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+
+    # Group each log's rotations where the log first appears, then oldest first
+    first_seen = {}
+    for path in paths:
+        first_seen.setdefault(rotation_key(path)[0], len(first_seen))
+
+    def order(path):
+        stem, live, position = rotation_key(path)
+        return first_seen[stem], live, position
+
+    return sorted(paths, key=order)
+
+
+class LogFileReader:
+    """
+    Iterates raw lines of a plain or compressed (.gz, .bz2, .zst) log file
+
+    Compression is recognized by extension or, failing that, by magic bytes.
+
+    Decompression is streamed, never staged on disk. ``position`` is the
+    offset into the file on disk, so progress for compressed input is
+    measured in compressed bytes.
+    """
+
+    def __init__(self, file_path: str):
+        """
+        Open a log file for reading
+
+        Args:
+            file_path: Path to plain or compressed log file
+        """
+        self.file_path = file_path
+        compression = compression_of(file_path)
+        self.raw = open(file_path, 'rb')
+
+        try:
+            if compression == '.gz':
+                # Multi-member files (concatenated gzip batches) read through
+                self.stream = gzip.GzipFile(fileobj=self.raw)
+            elif compression == '.bz2':
+                self.stream = bz2.BZ2File(self.raw)
+            elif compression == '.zst':
+                if not ZSTD_AVAILABLE:
+                    raise ImportError("zstandard library is required for .zst files (pip install zstandard)")
+                self.stream = io.BufferedReader(
+                    zstandard.ZstdDecompressor().stream_reader(self.raw, read_across_frames=True)
+                )
+            else:
+                self.stream = self.raw
+        except Exception:
+            self.raw.close()
+            raise
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self.stream)
+
+    @property
+    def position(self) -> int:
+        """Byte offset consumed from the file on disk"""
+        return self.raw.tell()
+
+    def close(self):
+        """Close the decompressor and the underlying file"""
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CheckpointStore:
+    """
+    Persists per-file read offsets so follow mode can resume after a restart
+
+    Stored as a small JSON document keyed by absolute file path:
+        {"/var/log/nginx/access.log": {"inode": 1234, "offset": 56789, "updated_at": "..."}}
+    """
+
+    def __init__(self, checkpoint_path: str):
+        """
+        Initialize checkpoint store
+
+        Args:
+            checkpoint_path: JSON file used to persist offsets
+        """
+        self.checkpoint_path = checkpoint_path
+        self.checkpoints = _read_json(checkpoint_path)
+
+    def get(self, file_path: str) -> Optional[Dict]:
+        """Get the checkpoint for a file, if any"""
+        return self.checkpoints.get(os.path.abspath(file_path))
+
+    def save(self, file_path: str, inode: int, offset: int):
+        """
+        Record the offset up to which a file has been durably ingested
+
+        The file is replaced atomically so a crash never leaves a partial checkpoint.
+        """
+        self.checkpoints[os.path.abspath(file_path)] = {
+            'inode': inode,
+            'offset': offset,
+            'updated_at': datetime.utcnow().isoformat()
+        }
+
+        _write_json_atomic(self.checkpoint_path, self.checkpoints)
+
+
+class IngestManifest:
+    """
+    Records which input files have been fully ingested so re-runs skip them
+
+    Files are keyed by a content fingerprint (size plus hashes of the first and
+    last 64 KiB) rather than by path, so logrotate renaming access.log.1.gz to
+    access.log.2.gz does not cause a re-ingest.
+    """
+
+    FINGERPRINT_BYTES = 64 * 1024
+
+    def __init__(self, manifest_path: str):
+        """
+        Initialize manifest
+
+        Args:
+            manifest_path: JSON file used to persist ingested files
+        """
+        self.manifest_path = manifest_path
+        self.files = _read_json(manifest_path)
+
+    def fingerprint(self, file_path: str) -> str:
+        """Compute the content fingerprint of a file"""
+        size = os.path.getsize(file_path)
+        digest = hashlib.sha1(str(size).encode('utf-8'))
+
+        with open(file_path, 'rb') as f:
+            digest.update(f.read(self.FINGERPRINT_BYTES))
+            if size > self.FINGERPRINT_BYTES:
+                f.seek(max(self.FINGERPRINT_BYTES, size - self.FINGERPRINT_BYTES))
+                digest.update(f.read())
+
+        return digest.hexdigest()
+
+    def is_ingested(self, file_path: str) -> bool:
+        """Check whether a file with identical content was already ingested"""
+        return self.fingerprint(file_path) in self.files
+
+    def record(self, file_path: str, lines: int):
+        """Mark a file as fully ingested"""
+        self.files[self.fingerprint(file_path)] = {
+            'path': os.path.abspath(file_path),
+            'size': os.path.getsize(file_path),
+            'lines': lines,
+            'ingested_at': datetime.utcnow().isoformat()
+        }
+        _write_json_atomic(self.manifest_path, self.files)
+
+
+class LogTailer:
+    """
+    Follows a growing log file (tail -F semantics)
+
+    Only complete lines are returned, each paired with the byte offset just
+    past it, so callers can checkpoint exactly what they have consumed.
+    Rotation (inode change) and truncation (copytruncate) are detected once
+    the current handle has been drained to EOF. If the file was rotated
+    while nobody was following it, the rest of the checkpointed file is read
+    from its rotated name (e.g. access.log.1) before the live file.
+    """
+
+    def __init__(self, file_path: str, checkpoint: Optional[Dict] = None):
+        """
+        Initialize tailer
+
+        Args:
+            file_path: Path of the live log file
+            checkpoint: Previously saved {'inode', 'offset'} to resume from
+        """
+        self.file_path = file_path
+        self.handle = None
+        self.inode = None
+        self.offset = 0
+        self._partial = b''
+        self._rotated_backlog = []  # Newer rotated files to read before the live one
+
+        self._open(checkpoint)
+
+    def _open(self, checkpoint: Optional[Dict] = None, path: Optional[str] = None):
+        """Open the file (or a rotated one), resuming from the checkpoint when it still applies"""
+        if path is None:
+            path = self.file_path
+            if checkpoint and checkpoint.get('inode') is not None:
+                path = self._find_rotated(checkpoint['inode']) or path
+
+        self.handle = open(path, 'rb')
+        stat = os.fstat(self.handle.fileno())
+        self.inode = stat.st_ino
+        self.offset = 0
+        self._partial = b''
+
+        if checkpoint and checkpoint.get('inode') == self.inode:
+            if checkpoint.get('offset', 0) <= stat.st_size:
+                self.offset = checkpoint['offset']
+                self.handle.seek(self.offset)
+                logger.info(f"Resuming {path} at byte {self.offset:,}")
+            else:
+                logger.warning(f"{path} is shorter than its checkpoint; starting from the beginning")
+        elif checkpoint:
+            logger.warning(
+                f"{self.file_path} was rotated since the last checkpoint and the rotated file "
+                f"was not found; starting from the beginning"
+            )
+
+    def _find_rotated(self, inode: int) -> Optional[str]:
+        """
+        Find the rotated sibling of the live file that has the given inode
+
+        Uncompressed rotations newer than it are queued in _rotated_backlog;
+        compressed ones can't be tailed and are reported as skipped.
+
+        Returns:
+            Path of the rotated file, or None if no sibling has that inode
+        """
+        directory = os.path.dirname(self.file_path) or '.'
+        stem = rotation_key(self.file_path)[0]
+        siblings = sorted(
+            (
+                os.path.join(directory, name)
+                for name in os.listdir(directory)
+                if os.path.join(directory, name) != self.file_path
+            ),
+            key=rotation_key
+        )
+        siblings = [path for path in siblings if rotation_key(path)[0] == stem]
+
+        for i, path in enumerate(siblings):
+            try:
+                if os.stat(path).st_ino != inode:
+                    continue
+            except OSError:
+                continue
+
+            for newer in siblings[i + 1:]:
+                if is_compressed(newer):
+                    logger.warning(f"Skipping {newer}: rotated and compressed while not being followed")
+                else:
+                    self._rotated_backlog.append(newer)
+            return path
+
+        return None
+
+    def read_lines(self, max_lines: int) -> List[Tuple[bytes, int]]:
+        """
+        Read up to max_lines complete lines currently available
+
+        Returns:
+            List of (raw_line, offset_after_line) tuples; empty at EOF
+        """
+        lines = []
+
+        while len(lines) < max_lines:
+            chunk = self.handle.readline()
+            if not chunk:
+                break
+
+            if not chunk.endswith(b'\n'):
+                # Writer is mid-line; keep the fragment until the newline arrives
+                self._partial += chunk
+                break
+
+            line = self._partial + chunk
+            self._partial = b''
+            self.offset += len(line)
+            lines.append((line, self.offset))
+
+        return lines
+
+    def rotated(self) -> bool:
+        """Check whether the file was replaced or truncated since it was opened"""
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            # Between rename and re-create during rotation
+            return False
+
+        if stat.st_ino != self.inode:
+            return True
+
+        return stat.st_size < self.offset + len(self._partial)
+
+    def reopen(self):
+        """Switch to the new file after rotation or truncation"""
+        if self._partial:
+            logger.warning(f"Dropping {len(self._partial)} bytes of unterminated line from rotated file")
+
+        self.close()
+        if self._rotated_backlog:
+            path = self._rotated_backlog.pop(0)
+            self._open(path=path)
+            logger.info(f"Reading {path}, rotated while not being followed")
+        else:
+            self._open()
+            logger.info(f"Reopened {self.file_path} (inode {self.inode})")
+
+    def close(self):
+        """Close the underlying file handle"""
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+
+
+def split_byte_ranges(file_path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Split a file into byte ranges of roughly chunk_size, aligned on newlines
+
+    Every range except possibly the last ends just past a newline, so each
+    line belongs to exactly one range.
+
+    Args:
+        file_path: Path to log file
+        chunk_size: Target size of each range in bytes
+
+    Returns:
+        List of (start, end) byte offsets covering the whole file
+    """
+    file_size = os.path.getsize(file_path)
+    ranges = []
+    start = 0
+
+    with open(file_path, 'rb') as f:
+        while start < file_size:
+            end = min(start + chunk_size, file_size)
+
+            if end < file_size:
+                # Extend to the end of the line straddling the boundary
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+
+            ranges.append((start, end))
+            start = end
+
+    return ranges
+
+
+def iter_range_lines(file_path: str, start: int, end: int) -> Iterator[bytes]:
+    """
+    Yield raw lines from a newline-aligned byte range
+
+    Args:
+        file_path: Path to log file
+        start: First byte of the range (start of a line)
+        end: Byte just past the range (end of a line or EOF)
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        position = start
+
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+
+            position += len(line)
+            yield line
@@ -3,10 +3,14 @@ Generate sample server logs for testing
 Creates realistic-looking Nginx access logs with various scenarios
 """
 
+import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import numpy as np
+
 # Sample data pools
 PATHS = [
     '/',
@@ -79,6 +83,23 @@ STATUS_CODES = [
 ]
 
 
+# Malicious request paths used by the 'attack' scenario
+ATTACK_PATHS = [
+    "/admin' OR '1'='1",
+    "/search?q=<script>alert('XSS')</script>",
+    "/api?file=../../../../etc/passwd",
+    "/login?redirect=$(whoami)",
+    "/api/users?id=1 UNION SELECT * FROM passwords--"
+]
+
+# Scenario shares used by generate_sample_logs()
+DEFAULT_MIX = {'normal': 0.70, 'bot': 0.15, 'slow': 0.05, 'error': 0.08, 'attack': 0.02}
+
+# Lines per independently seeded corpus chunk. Part of the corpus definition:
+# changing it changes every generated corpus.
+CORPUS_CHUNK_LINES = 250000
+
+
 def weighted_choice(choices):
     """Make weighted random choice"""
     total = sum(weight for choice, weight in choices)
@@ -111,16 +132,7 @@ def generate_log_line(timestamp, scenario='normal'):
     elif scenario == 'attack':
         ip = random.choice(IP_ADDRESSES[-2:])  # Suspicious IPs
         user_agent = random.choice(USER_AGENTS[-3:])  # Suspicious UAs
-
-        # Malicious paths
-        attack_paths = [
-            "/admin' OR '1'='1",
-            "/search?q=<script>alert('XSS')</script>",
-            "/api?file=../../../../etc/passwd",
-            "/login?redirect=$(whoami)",
-            "/api/users?id=1 UNION SELECT * FROM passwords--"
-        ]
-        path = random.choice(attack_paths)
+        path = random.choice(ATTACK_PATHS)  # Malicious paths
         status = random.choice([400, 403, 500])
         response_time = random.randint(10, 50)
 
@@ -156,6 +168,142 @@ def generate_log_line(timestamp, scenario='normal'):
     return log_line
 
 
+def generate_corpus_chunk(chunk_index, num_lines, seed=42, mix=None, visitors=10000, start=None):
+    """
+    Generate one chunk of a benchmark corpus with numpy instead of per-line random calls
+
+    Scenarios, paths, user agents, referers and status codes come from the
+    same pools as generate_log_line(), but requests come from ``visitors``
+    distinct 10.x.y.z clients (each with a fixed browser or bot user agent)
+    so sessions look realistic, and the chunk is seeded by (seed,
+    chunk_index): any chunk can be generated in any process and the corpus
+    is identical however it is split up. Chunk i covers seconds
+    [i * CORPUS_CHUNK_LINES, (i + 1) * CORPUS_CHUNK_LINES) after ``start``,
+    in time order.
+
+    Args:
+        chunk_index: Position of the chunk in the corpus
+        num_lines: Lines in this chunk (CORPUS_CHUNK_LINES except the last)
+        seed: Corpus seed
+        mix: Scenario shares (keys of DEFAULT_MIX, normalized)
+        visitors: Distinct clients
+        start: Corpus start time (default 2024-01-01 00:00:00)
+
+    Returns:
+        Newline-terminated Nginx combined log text
+    """
+    mix = mix or DEFAULT_MIX
+    scenarios = list(DEFAULT_MIX)
+    shares = np.array([mix.get(name, 0.0) for name in scenarios], dtype=float)
+    rng = np.random.default_rng([seed, chunk_index])
+    start = start or datetime(2024, 1, 1)
+
+    scenario = rng.choice(len(scenarios), num_lines, p=shares / shares.sum())
+    normal, bot, slow, error, attack = (scenario == i for i in range(len(scenarios)))
+    visitor = rng.integers(0, max(1, visitors), num_lines)
+
+    # Clients: one IP and user agent per visitor; attacks from the suspicious pools
+    octets = np.stack([np.full(num_lines, 10), visitor >> 16 & 255, visitor >> 8 & 255, visitor & 255])
+    suspicious = np.array([[int(part) for part in ip.split('.')] for ip in IP_ADDRESSES[-2:]]).T
+    octets[:, attack] = suspicious[:, rng.integers(0, suspicious.shape[1], attack.sum())]
+
+    user_agent = visitor % 5
+    user_agent[bot] = 5 + visitor[bot] % 4
+    user_agent[attack] = len(USER_AGENTS) - 3 + rng.integers(0, 3, attack.sum())
+
+    # Paths: per-scenario slices of one table
+    slow_paths = ['/api/reports', '/api/search', '/admin']
+    path_table = np.array(PATHS + slow_paths + ATTACK_PATHS, dtype=object)
+    offsets = {'normal': (0, 10), 'bot': (0, len(PATHS)), 'error': (0, len(PATHS)),
+               'slow': (len(PATHS), len(slow_paths)), 'attack': (len(PATHS) + len(slow_paths), len(ATTACK_PATHS))}
+    first = np.array([offsets[name][0] for name in scenarios])
+    size = np.array([offsets[name][1] for name in scenarios])
+    path = first[scenario] + (rng.random(num_lines) * size[scenario]).astype(np.int64)
+
+    # Status codes
+    codes, weights = zip(*STATUS_CODES)
+    status = np.array(codes)[rng.choice(len(codes), num_lines, p=np.array(weights) / sum(weights))]
+    status[bot | slow] = 200
+    status[error] = np.array([500, 502, 503, 504])[rng.integers(0, 4, error.sum())]
+    status[attack] = np.array([400, 403, 500])[rng.integers(0, 3, attack.sum())]
+
+    size_sent = rng.integers(500, 50001, num_lines)
+    referer = rng.integers(0, len(REFERERS), num_lines)
+
+    # One request per second on average, sorted within the chunk
+    seconds = np.sort(rng.integers(0, CORPUS_CHUNK_LINES, num_lines)) + chunk_index * CORPUS_CHUNK_LINES
+    day, second_of_day = np.divmod(seconds, 86400)
+    hour, minute_second = np.divmod(second_of_day, 3600)
+    minute, second = np.divmod(minute_second, 60)
+    day_strings = {
+        d: (start + timedelta(days=int(d))).strftime('%d/%b/%Y')
+        for d in np.unique(day).tolist()
+    }
+
+    user_agents = np.array(USER_AGENTS, dtype=object)[user_agent].tolist()
+    referers = np.array(REFERERS, dtype=object)[referer].tolist()
+    paths = path_table[path].tolist()
+
+    lines = [
+        f'{a}.{b}.{c}.{d} - - [{day_strings[day_]}:{h:02d}:{m:02d}:{sec:02d} +0000] '
+        f'"GET {p} HTTP/1.1" {st} {sz} "{ref}" "{ua}"'
+        for a, b, c, d, day_, h, m, sec, p, st, sz, ref, ua in zip(
+            *octets.tolist(), day.tolist(), hour.tolist(), minute.tolist(), second.tolist(),
+            paths, status.tolist(), size_sent.tolist(), referers, user_agents
+        )
+    ]
+
+    return '\n'.join(lines) + '\n'
+
+
+def _corpus_chunk_bytes(args):
+    """generate_corpus_chunk() for a process pool, encoded for writing"""
+    return generate_corpus_chunk(*args).encode('utf-8')
+
+
+def write_corpus(output_file, num_lines, seed=42, mix=None, visitors=None, workers=None):
+    """
+    Write a deterministic benchmark corpus, generating chunks in parallel
+
+    Args:
+        output_file: Destination log file
+        num_lines: Total lines (e.g. 1M, 10M or 100M)
+        seed: Corpus seed
+        mix: Scenario shares (default DEFAULT_MIX)
+        visitors: Distinct clients (default one per 50 lines)
+        workers: Generator processes (default: all cores)
+
+    Returns:
+        Bytes written
+    """
+    visitors = visitors or max(1, num_lines // 50)
+    chunks = [
+        (index, min(CORPUS_CHUNK_LINES, num_lines - first_line), seed, mix, visitors)
+        for index, first_line in enumerate(range(0, num_lines, CORPUS_CHUNK_LINES))
+    ]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(chunks)))
+    written = 0
+
+    with open(output_file, 'wb') as f:
+        if workers == 1:
+            for chunk in chunks:
+                written += f.write(_corpus_chunk_bytes(chunk))
+            return written
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Bounded read-ahead so finished chunks never pile up in memory
+            window = workers * 2
+            futures = [executor.submit(_corpus_chunk_bytes, chunk) for chunk in chunks[:window]]
+
+            for position in range(len(chunks)):
+                written += f.write(futures[position].result())
+                futures[position] = None
+                if position + window < len(chunks):
+                    futures.append(executor.submit(_corpus_chunk_bytes, chunks[position + window]))
+
+    return written
+
+
 def generate_sample_logs(num_lines=10000, output_file='nginx_access.log'):
     """Generate sample log file"""
 
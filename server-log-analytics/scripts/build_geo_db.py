@@ -0,0 +1,66 @@
+"""
+Geo Database Builder
+Converts IP range / network CSV exports into the range file ingest_logs.py --geoip maps
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import click
+from rich.console import Console
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from analyzers.geo_enricher import build_range_database
+
+console = Console()
+
+
+@click.command()
+@click.argument('csv_files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--output',
+    required=True,
+    help='Range database to write (replaced atomically)'
+)
+@click.option(
+    '--locations',
+    type=click.Path(exists=True, dir_okay=False),
+    help='GeoLite2 City/Country locations CSV, to resolve geoname_id columns'
+)
+def main(csv_files, output, locations):
+    """
+    Build a range database for geo enrichment
+
+    Examples:
+
+        # DB-IP / IP2Location style start_ip,end_ip,country_code,city export
+        python scripts/build_geo_db.py dbip-city-lite.csv --output geo.ranges
+
+        # GeoLite2 City CSV (IPv4 and IPv6 blocks plus the English locations)
+        python scripts/build_geo_db.py GeoLite2-City-Blocks-IPv4.csv GeoLite2-City-Blocks-IPv6.csv \\
+            --locations GeoLite2-City-Locations-en.csv --output geo.ranges
+    """
+    started = time.perf_counter()
+
+    try:
+        result = build_range_database(list(csv_files), output, locations_path=locations)
+    except ValueError as e:
+        console.print(f"[red]✗ {e}[/red]")
+        sys.exit(1)
+
+    console.print(f"[green]✓[/green] Wrote {output} in {time.perf_counter() - started:.1f}s")
+    console.print(f"  Rows read:    {result['rows']:,}")
+    console.print(f"  IPv4 ranges:  {result['v4_ranges']:,}")
+    console.print(f"  IPv6 ranges:  {result['v6_ranges']:,}")
+    console.print(f"  Locations:    {result['locations']:,}")
+    if result['skipped']:
+        console.print(f"  [yellow]Skipped:      {result['skipped']:,} rows without a valid range or country code[/yellow]")
+
+    console.print(f"\nIngest with: python ingest_logs.py --file access.log --geoip {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ Creates ClickHouse tables and views for log analytics
 """
 
 import sys
+import time
 from pathlib import Path
 
 # Add project root to path
@@ -62,11 +63,15 @@ def create_tables(client: Client):
             country_code FixedString(2) DEFAULT '',
             device_type LowCardinality(String) DEFAULT '',
             browser LowCardinality(String) DEFAULT '',
-            os LowCardinality(String) DEFAULT ''
+            os LowCardinality(String) DEFAULT '',
+
+            -- Set by the server when the row is inserted (rollup backfill split)
+            ingested_at DateTime DEFAULT now()
 
         ) ENGINE = MergeTree()
         PARTITION BY toYYYYMM(date)
-        ORDER BY (date, timestamp)
+        ORDER BY (date, toStartOfHour(timestamp), cityHash64(request_id))
+        SAMPLE BY cityHash64(request_id)
         TTL date + INTERVAL 90 DAY
         SETTINGS index_granularity = 8192
         """,
@@ -87,9 +92,10 @@ def create_tables(client: Client):
 
             entry_page String,
             exit_page String,
+            pages_visited Array(String),  -- Visit order, revisits included (first 100 requests)
 
             is_bounce UInt8,
-            converted UInt8,
+            has_conversion UInt8,
 
             ip_address IPv4,
             user_agent String,
@@ -111,14 +117,18 @@ def create_tables(client: Client):
             severity LowCardinality(String),
 
             ip_address IPv4,
+            user_agent String,
+
+            method String,
             path String,
-            description String,
+            query_string String,
+
             pattern_matched String,
-            confidence Float32,
+            confidence_score Float32,
 
-            -- Actions taken
-            blocked UInt8 DEFAULT 0,
-            notified UInt8 DEFAULT 0
+            -- Action taken: logged, blocked, rate_limited
+            action LowCardinality(String) DEFAULT 'logged',
+            details String DEFAULT ''
 
         ) ENGINE = MergeTree()
         PARTITION BY toYYYYMM(date)
@@ -180,89 +190,204 @@ def create_tables(client: Client):
             console.print(f"[red]✗[/red] Error creating table '{table_name}': {e}")
             raise
 
+    # Tables created by earlier releases lack columns the ingest pipeline
+    # writes (see clickhouse_schema.sql); their old columns are left in place
+    # and fill with defaults
+    for table_name, columns in ADDED_COLUMNS.items():
+        for column in columns:
+            client.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column}")
+
+    add_ingested_at(client)
+
+
+def add_ingested_at(client: Client):
+    """
+    Add fact_requests.ingested_at to a table created without it
+
+    A part that lacks a column evaluates its DEFAULT when read, so rows
+    loaded earlier would read ingested_at as the current time and look newer
+    than any rollup cutoff. Writing the column out once gives them the time
+    of this run instead.
+    """
+    exists = client.execute("""
+        SELECT count()
+        FROM system.columns
+        WHERE database = currentDatabase() AND table = 'fact_requests' AND name = 'ingested_at'
+    """)[0][0]
+    if exists:
+        return
+
+    client.execute("ALTER TABLE fact_requests ADD COLUMN IF NOT EXISTS ingested_at DateTime DEFAULT now()")
+    client.execute("ALTER TABLE fact_requests MATERIALIZE COLUMN ingested_at", settings={'mutations_sync': 2})
+    console.print("[green]✓[/green] Added ingested_at to 'fact_requests'")
+
+
+# Columns ClickHouseClient.insert_security_event_rows and insert_session_rows
+# write beyond the earliest layout of their tables
+ADDED_COLUMNS = {
+    'security_events': (
+        "user_agent String",
+        "method String",
+        "query_string String",
+        "confidence_score Float32",
+        "action LowCardinality(String) DEFAULT 'logged'",
+        "details String DEFAULT ''"
+    ),
+    'fact_sessions': (
+        "pages_visited Array(String)",
+        "has_conversion UInt8"
+    )
+}
+
+
+# Rollup granularity -> (bucket expression, partition key, TTL clause).
+# ClickHouseClient.ROLLUPS must list the same tables and minute retention.
+ROLLUPS = {
+    'minute': ('toStartOfMinute(timestamp)', 'toYYYYMMDD(bucket)', 'TTL bucket + INTERVAL 7 DAY DELETE'),
+    'hour': ('toStartOfHour(timestamp)', 'toYYYYMM(bucket)', ''),
+    'day': ('toStartOfDay(timestamp)', 'toYYYYMM(bucket)', '')
+}
+
+ROLLUP_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS rollup_requests_{name} (
+    bucket DateTime,
+    path String,
+    is_bot UInt8,
+    bot_type LowCardinality(String),
+
+    requests SimpleAggregateFunction(sum, UInt64),
+    bytes SimpleAggregateFunction(sum, UInt64),
+    client_errors SimpleAggregateFunction(sum, UInt64),
+    server_errors SimpleAggregateFunction(sum, UInt64),
+    timed_requests SimpleAggregateFunction(sum, UInt64),
+    latency_sum SimpleAggregateFunction(sum, UInt64),
+    latency_max SimpleAggregateFunction(max, UInt32),
+    latency AggregateFunction(quantilesTDigest(0.5, 0.95, 0.99), UInt32),
+    visitors AggregateFunction(uniq, IPv4)
+) ENGINE = AggregatingMergeTree()
+PARTITION BY {partition}
+ORDER BY (bucket, path, is_bot, bot_type)
+{ttl}
+"""
 
-def create_materialized_views(client: Client):
-    """Create materialized views for common queries"""
+ROLLUP_SELECT_SQL = """
+SELECT
+    {bucket} AS bucket,
+    path,
+    is_bot,
+    bot_type,
+    count() AS requests,
+    sum(response_bytes) AS bytes,
+    countIf(status_code >= 400 AND status_code < 500) AS client_errors,
+    countIf(status_code >= 500) AS server_errors,
+    countIf(response_time_ms > 0) AS timed_requests,
+    sum(response_time_ms) AS latency_sum,
+    max(response_time_ms) AS latency_max,
+    quantilesTDigestStateIf(0.5, 0.95, 0.99)(response_time_ms, response_time_ms > 0) AS latency,
+    uniqState(ip_address) AS visitors
+FROM fact_requests
+{where}
+GROUP BY bucket, path, is_bot, bot_type
+"""
 
-    views = {
-        'mv_hourly_traffic': """
-        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_hourly_traffic
-        ENGINE = SummingMergeTree()
-        PARTITION BY toYYYYMM(date)
-        ORDER BY (date, hour, path)
-        AS SELECT
-            toDate(timestamp) as date,
-            toStartOfHour(timestamp) as hour,
-            path,
-            count() as request_count,
-            sum(response_bytes) as total_bytes,
-            avg(response_time_ms) as avg_latency,
-            quantile(0.95)(response_time_ms) as p95_latency,
-            countIf(status_code >= 400) as error_count,
-            countIf(is_bot = 1) as bot_count
-        FROM fact_requests
-        GROUP BY date, hour, path
-        """,
+# Seconds between choosing a rollup's backfill cutoff and the cutoff itself;
+# its view must be created within this margin
+ROLLUP_CUTOFF_MARGIN = 10
 
-        'mv_daily_summary': """
-        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_daily_summary
-        ENGINE = SummingMergeTree()
-        ORDER BY date
-        AS SELECT
-            date,
-            count() as total_requests,
-            count(distinct ip_address) as unique_ips,
-            sum(response_bytes) as total_bytes,
-            avg(response_time_ms) as avg_latency,
-            quantile(0.50)(response_time_ms) as p50_latency,
-            quantile(0.95)(response_time_ms) as p95_latency,
-            quantile(0.99)(response_time_ms) as p99_latency,
-            countIf(status_code = 200) as success_count,
-            countIf(status_code >= 400) as error_count,
-            countIf(is_bot = 1) as bot_requests
-        FROM fact_requests
-        GROUP BY date
-        """,
+# SummingMergeTree views from earlier releases; they summed averages and
+# quantiles across parts, so their numbers were wrong. Superseded by rollups.
+LEGACY_VIEWS = ('mv_hourly_traffic', 'mv_daily_summary', 'mv_top_pages_daily', 'mv_bot_stats', 'mv_bot_stats_daily')
 
-        'mv_top_pages_daily': """
-        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_top_pages_daily
-        ENGINE = SummingMergeTree()
-        ORDER BY (date, path)
-        AS SELECT
-            date,
-            path,
-            count() as requests,
-            sum(response_bytes) as bytes,
-            avg(response_time_ms) as avg_latency,
-            countIf(status_code >= 400) as errors
-        FROM fact_requests
-        GROUP BY date, path
-        """,
 
-        'mv_bot_stats': """
-        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_bot_stats
-        ENGINE = SummingMergeTree()
-        ORDER BY (date, bot_type)
-        AS SELECT
-            date,
-            bot_type,
-            count() as request_count
-        FROM fact_requests
-        WHERE is_bot = 1
-        GROUP BY date, bot_type
-        """
-    }
+def create_materialized_views(client: Client):
+    """
+    Create minute/hour/day rollup tables and the views that feed them
+
+    A new view over an already loaded fact_requests only takes rows
+    inserted from a cutoff on (by ingested_at, not the logged timestamp);
+    rows inserted before it are backfilled into the rollup instead. Live
+    ingestion may continue during init, and old logs loaded afterwards
+    still reach every rollup.
+    """
 
-    for view_name, create_sql in views.items():
+    for view_name in LEGACY_VIEWS:
         try:
-            client.execute(create_sql)
-            console.print(f"[green]✓[/green] Materialized view '{view_name}' created/verified")
+            if client.execute(f"EXISTS TABLE {view_name}")[0][0]:
+                client.execute(f"DROP TABLE {view_name}")
+                console.print(f"[yellow]•[/yellow] Dropped legacy view '{view_name}' (replaced by rollups)")
+        except Exception as e:
+            console.print(f"[red]✗[/red] Error dropping legacy view '{view_name}': {e}")
+
+    for name, (bucket, partition, ttl) in ROLLUPS.items():
+        table = f"rollup_requests_{name}"
+        view = f"mv_{table}"
+
+        try:
+            client.execute(ROLLUP_TABLE_SQL.format(name=name, partition=partition, ttl=ttl))
+            console.print(f"[green]✓[/green] Rollup table '{table}' created/verified")
+
+            if client.execute(f"EXISTS TABLE {view}")[0][0]:
+                console.print(f"[green]✓[/green] Materialized view '{view}' verified")
+                continue
+
+            backfill = (
+                not client.execute(f"SELECT count() FROM {table}")[0][0]
+                and client.execute("SELECT count() FROM fact_requests")[0][0]
+            )
+            if not backfill:
+                client.execute(
+                    f"CREATE MATERIALIZED VIEW {view} TO {table} AS "
+                    + ROLLUP_SELECT_SQL.format(bucket=bucket, where="")
+                )
+                console.print(f"[green]✓[/green] Materialized view '{view}' created")
+                continue
+
+            # Views only see new inserts, so an empty rollup is seeded from the
+            # requests already loaded. ingested_at is filled in by the server
+            # as an INSERT runs, and every INSERT starting after the view
+            # exists goes through it. The view is in place before the cutoff
+            # and only takes rows from it on; the backfill waits for INSERTs
+            # started before it and takes the rest, so each row is counted
+            # once (assuming no single INSERT block runs past the margin).
+            cutoff = client.execute("SELECT toUnixTimestamp(now())")[0][0] + ROLLUP_CUTOFF_MARGIN
+            client.execute(
+                f"CREATE MATERIALIZED VIEW {view} TO {table} AS "
+                + ROLLUP_SELECT_SQL.format(bucket=bucket, where=f"WHERE ingested_at >= toDateTime({cutoff})")
+            )
+            if client.execute("SELECT toUnixTimestamp(now())")[0][0] >= cutoff:
+                client.execute(f"DROP TABLE {view}")
+                raise RuntimeError(f"view took over {ROLLUP_CUTOFF_MARGIN}s to create; run init_db again")
+            console.print(f"[green]✓[/green] Materialized view '{view}' created")
+
+            wait_for_inserts_before(client, cutoff)
+
+            where = f"WHERE ingested_at < toDateTime({cutoff})"
+            if ttl:
+                where += " AND timestamp >= now() - INTERVAL 7 DAY"
+            client.execute(f"INSERT INTO {table} " + ROLLUP_SELECT_SQL.format(bucket=bucket, where=where))
+            rows = client.execute(f"SELECT count() FROM {table}")[0][0]
+            console.print(f"[green]✓[/green] Backfilled {rows:,} rows into '{table}'")
         except Exception as e:
-            console.print(f"[red]✗[/red] Error creating view '{view_name}': {e}")
-            # Views might fail if they already exist, continue anyway
+            console.print(f"[red]✗[/red] Error creating rollup '{table}': {e}")
             console.print(f"[yellow]  Continuing...[/yellow]")
 
 
+def wait_for_inserts_before(client: Client, cutoff: int):
+    """Block until the cutoff has passed and every INSERT into fact_requests started before it is done"""
+    while True:
+        now, running = client.execute(f"""
+            SELECT
+                toUnixTimestamp(now()),
+                (SELECT count()
+                 FROM system.processes
+                 WHERE query ILIKE 'INSERT INTO fact_requests%'
+                   AND toUnixTimestamp(now()) - elapsed < {cutoff})
+        """)[0]
+        if now >= cutoff and not running:
+            return
+        time.sleep(1)
+
+
 def verify_setup(client: Client):
     """Verify database setup"""
     console.print("\n[bold cyan]Verifying setup...[/bold cyan]\n")
@@ -292,6 +417,18 @@ def verify_setup(client: Client):
     if result:
         console.print(f"\n[bold]Disk usage:[/bold] {result[0][0]}")
 
+    # Sorting and sampling keys cannot be altered in place, so a table
+    # created by an older release keeps serving --approx without sampling
+    result = client.execute("""
+        SELECT sampling_key
+        FROM system.tables
+        WHERE database = currentDatabase() AND name = 'fact_requests'
+    """)
+
+    if result and not result[0][0]:
+        console.print("\n[yellow]fact_requests has no SAMPLE BY key; --approx queries will read every row.[/yellow]")
+        console.print("[yellow]Recreate it (and re-ingest or INSERT ... SELECT) to enable sampling.[/yellow]")
+
 
 def main():
     """Main initialization function"""